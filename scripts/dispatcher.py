@@ -1,7 +1,7 @@
 """
 usage: teuthology-dispatcher --help
        teuthology-dispatcher --supervisor [-v] --bin-path BIN_PATH --job-config COFNFIG --archive-dir DIR
-       teuthology-dispatcher [-v] [--archive-dir DIR] [--exit-on-empty-queue] --log-dir LOG_DIR --tube TUBE
+       teuthology-dispatcher [-v] [--archive-dir DIR] [--exit-on-empty-queue] [--max-in-flight N] --log-dir LOG_DIR --tube TUBE
 
 Start a dispatcher for the specified tube. Grab jobs from a beanstalk
 queue and run the teuthology tests they describe as subprocesses. The
@@ -22,6 +22,9 @@ standard arguments:
   --bin-path BIN_PATH            teuthology bin path
   --job-config CONFIG            file descriptor of job's config file
   --exit-on-empty-queue          if the queue is empty, exit
+  --max-in-flight N              how many jobs to lock machines for at the
+                                 same time; defaults to
+                                 dispatcher_max_in_flight from the config
 """
 
 import docopt
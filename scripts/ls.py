@@ -1,5 +1,5 @@
 """
-usage: teuthology-ls [-h] [-v] <archive_dir>
+usage: teuthology-ls [-h] [-v] [--rebuild-index] <archive_dir>
 
 List teuthology job results
 
@@ -7,8 +7,10 @@ positional arguments:
   <archive_dir>            path under which to archive results
 
 optional arguments:
-  -h, --help     show this help message and exit
-  -v, --verbose  show reasons tests failed
+  -h, --help       show this help message and exit
+  -v, --verbose    show reasons tests failed
+  --rebuild-index  rebuild the run's index of jobs from their archives
+                   before listing them
 """
 import docopt
 import teuthology.ls
@@ -30,6 +30,15 @@ optional arguments:
                         Compress (using gzip) any teuthology.log files older
                         than DAYS. Negative values will skip this operation.
                         [default: 30]
+  -w N, --workers N     The number of threads removing and compressing files
+                        [default: 4]
+  --max-iops N          Start at most N filesystem operations (listings and
+                        removals) per second; 0 means unlimited [default: 0]
+  --max-bandwidth SIZE  Compress at most SIZE (e.g. 50MB) worth of logs per
+                        second; 0 means unlimited [default: 0]
+  --index               Also write the job index of each run that lacks
+                        one, e.g. because it was archived before runs were
+                        indexed
 """.format(archive_base=teuthology.config.config.archive_base)
 
 
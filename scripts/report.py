@@ -5,9 +5,9 @@ import teuthology.report
 doc = """
 usage:
     teuthology-report -h
-    teuthology-report [-v] [-R] [-n] [-s SERVER] [-a ARCHIVE] [-D] -r RUN ...
-    teuthology-report [-v] [-s SERVER] [-a ARCHIVE] [-D] -r RUN -j JOB ...
-    teuthology-report [-v] [-R] [-n] [-s SERVER] [-a ARCHIVE] --all-runs
+    teuthology-report [-v] [-R] [-n] [-s SERVER] [-a ARCHIVE] [-w WORKERS] [-D] -r RUN ...
+    teuthology-report [-v] [-s SERVER] [-a ARCHIVE] [-w WORKERS] [-D] -r RUN -j JOB ...
+    teuthology-report [-v] [-R] [-n] [-s SERVER] [-a ARCHIVE] [-w WORKERS] --all-runs
 
 Submit test results to a web service
 
@@ -33,6 +33,9 @@ optional arguments:
                         behavior.
   -D, --dead            Mark all given jobs (or entire runs) with status
                         'dead'. Implies --refresh.
+  -w WORKERS, --workers WORKERS
+                        How many requests to make to the server concurrently
+                        [default: 1]
   -v, --verbose         be more verbose
 """.format(archive_base=teuthology.config.config.archive_base)
 
@@ -0,0 +1,5 @@
+from script import Script
+
+
+class TestTrace(Script):
+    script_name = 'teuthology-trace'
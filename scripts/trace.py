@@ -0,0 +1,27 @@
+import docopt
+
+import teuthology.trace
+
+doc = """
+usage:
+    teuthology-trace -h
+    teuthology-trace [options] <path>
+
+Summarize where a job spent its time, from the trace.jsonl written to its
+archive directory.
+
+positional arguments:
+  <path>                The trace, or the archive directory of the job
+
+optional arguments:
+  -h, --help            Show this help message and exit
+  -n N, --top N         How many of the slowest spans to list [default: 10]
+  --chrome FILE         Instead, convert the trace to the Chrome trace event
+                        format, for chrome://tracing or Perfetto, and write
+                        it to FILE
+"""
+
+
+def main():
+    args = docopt.docopt(doc)
+    teuthology.trace.main(args)
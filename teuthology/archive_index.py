@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import yaml
+
+from teuthology.job_status import get_status
+
+log = logging.getLogger(__name__)
+
+# The name of the index file in each run's archive directory
+INDEX_FILE = '.index.jsonl'
+
+# The job information kept in the index
+INDEX_FIELDS = (
+    'name',
+    'description',
+    'owner',
+    'pid',
+    'machine_type',
+    'status',
+    'duration',
+    'failure_reason',
+)
+
+
+def record_job(job_dir, info, finished=False):
+    """
+    Add information about the job archived in job_dir to its run's index.
+
+    Failures are logged rather than raised, since the index can always be
+    rebuilt from the archive.
+
+    :param job_dir:  The job's archive directory
+    :param info:     A dict like the job's config, info or summary; only the
+                     keys in INDEX_FIELDS are recorded
+    :param finished: Whether the job's summary.yaml has been written
+    """
+    job_dir = os.path.normpath(job_dir)
+    index = RunIndex(os.path.dirname(job_dir))
+    record = dict((k, info[k]) for k in INDEX_FIELDS if k in info)
+    if finished:
+        record['finished'] = True
+    try:
+        index.update(os.path.basename(job_dir), record)
+    except Exception:
+        log.warning('Could not update the archive index in %s',
+                    index.run_dir, exc_info=True)
+
+
+class RunIndex(object):
+    """
+    An index of the jobs archived in a run's directory, so that listing them
+    and their status does not require parsing each of their YAML files.
+
+    The index is a file of JSON records, one per line, that is only ever
+    appended to; later records for a job add to, or replace fields of,
+    earlier ones. Each record is written with a single write(), but nothing
+    keeps records written concurrently by the jobs of a run from being
+    interleaved, e.g. on NFS; read() skips lines it cannot parse, and those
+    jobs are then looked up as if they were missing.
+
+    Jobs whose directory is missing from the index, e.g. because they were
+    archived before the index existed, are looked up in their YAML files
+    instead; looking jobs up never writes to the index. So are unfinished
+    jobs which have since written their summary.yaml, in case the record of
+    their end is missing. rebuild() writes the records of every job at
+    once; 'teuthology-ls --rebuild-index' does that for a run, and
+    'teuthology-prune-logs --index' for every run lacking an index.
+    """
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, INDEX_FILE)
+
+    def update(self, job_id, record):
+        """
+        Append a record for job_id to the index
+        """
+        record = dict(record, job_id=str(job_id))
+        line = json.dumps(record, default=str) + '\n'
+        with open(self.path, 'a') as f:
+            f.write(line)
+
+    def read(self):
+        """
+        :returns: A dict mapping job IDs to the merged records of the index
+        """
+        jobs = dict()
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return jobs
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a partially written line
+                continue
+            jobs.setdefault(record['job_id'], dict()).update(record)
+        return jobs
+
+    def jobs(self, job_ids=None):
+        """
+        Look up jobs in the index, reading the YAML files of any which are
+        missing from it, or whose record is out of date.
+
+        :param job_ids: The job IDs to look up. If not given, the run's
+                        directory is listed to find them.
+        :returns:       A dict mapping job IDs to dicts with the keys in
+                        INDEX_FIELDS that are known for the job, plus
+                        'job_id' and 'finished'.
+        """
+        if job_ids is None:
+            job_ids = self.job_ids()
+        jobs = self.read()
+        result = dict()
+        for job_id in job_ids:
+            record = jobs.get(job_id)
+            if record is None or (
+                    not record.get('finished') and self._has_summary(job_id)):
+                record = dict(record or dict(), **self.lookup_job(job_id))
+            result[job_id] = record
+        return result
+
+    def _has_summary(self, job_id):
+        return os.path.exists(
+            os.path.join(self.run_dir, job_id, 'summary.yaml'))
+
+    def job_ids(self):
+        """
+        :returns: A sorted list of the IDs of the jobs archived in the run's
+                  directory
+        """
+        if not os.path.isdir(self.run_dir):
+            return []
+        job_ids = [
+            item for item in os.listdir(self.run_dir)
+            if re.match(r'\d+$', item) and
+            os.path.isdir(os.path.join(self.run_dir, item))
+        ]
+        return sorted(job_ids)
+
+    def lookup_job(self, job_id):
+        """
+        :returns: A record of the job, read from its YAML files
+        """
+        job_dir = os.path.join(self.run_dir, job_id)
+        if not os.path.isdir(job_dir):
+            return dict(job_id=job_id)
+        return dict(self.read_job(job_dir), job_id=job_id)
+
+    def rebuild(self):
+        """
+        Replace the index with one built from the YAML files of every job
+        archived in the run's directory. Records appended while it is
+        rebuilt are lost, so it is meant for runs which have finished.
+        """
+        tmp = tempfile.NamedTemporaryFile(
+            'w', dir=self.run_dir, prefix=INDEX_FILE, delete=False)
+        with tmp:
+            for job_id in self.job_ids():
+                record = self.read_job(os.path.join(self.run_dir, job_id))
+                record['job_id'] = job_id
+                tmp.write(json.dumps(record, default=str) + '\n')
+        os.rename(tmp.name, self.path)
+
+    @staticmethod
+    def read_job(job_dir):
+        """
+        :returns: A record of the job archived in job_dir, built from its
+                  YAML files
+        """
+        info = dict()
+        for yaml_name in ('orig.config.yaml', 'info.yaml'):
+            partial_info = _load_yaml(os.path.join(job_dir, yaml_name))
+            if partial_info:
+                info.update(partial_info)
+        record = dict((k, info[k]) for k in INDEX_FIELDS if k in info)
+        summary = _load_yaml(os.path.join(job_dir, 'summary.yaml'))
+        if summary is not None:
+            summary['status'] = get_status(summary)
+            record.update(
+                (k, summary[k]) for k in INDEX_FIELDS if k in summary)
+            record['finished'] = True
+        return record
+
+
+def _load_yaml(path):
+    try:
+        with open(path) as f:
+            data = dict()
+            for partial in yaml.safe_load_all(f):
+                if isinstance(partial, dict):
+                    data.update(partial)
+            return data
+    except FileNotFoundError:
+        return None
+    except yaml.YAMLError:
+        log.warning('Could not parse %s', path, exc_info=True)
+        return None
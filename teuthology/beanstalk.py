@@ -1,4 +1,7 @@
 import beanstalkc
+import json
+import os
+import tempfile
 import yaml
 import logging
 import pprint
@@ -7,6 +10,7 @@ from collections import OrderedDict
 
 from teuthology.config import config
 from teuthology import report
+from teuthology.util.flock import FileLock
 
 log = logging.getLogger(__name__)
 
@@ -36,7 +40,13 @@ def watch_tube(connection, tube_name):
 
 def walk_jobs(connection, tube_name, processor, pattern=None):
     """
-    def callback(jobs_dict)
+    Pass the ready jobs of a tube to processor, in the order they would be
+    reserved in.
+
+    The jobs are found using the tube's QueueIndex, and looked at with
+    peek, so that they stay available to workers.
+
+    :param pattern: Only process jobs with pattern in their name
     """
     log.info("Checking Beanstalk Queue...")
     job_count = connection.stats_tube(tube_name)['current-jobs-ready']
@@ -44,23 +54,244 @@ def walk_jobs(connection, tube_name, processor, pattern=None):
         log.info('No jobs in Beanstalk Queue')
         return
 
-    # Try to figure out a sane timeout based on how many jobs are in the queue
-    timeout = job_count / 2000.0 * 60
-    for i in range(1, job_count + 1):
-        print_progress(i, job_count, "Loading")
-        job = connection.reserve(timeout=timeout)
-        if job is None or job.body is None:
+    jobs = QueueIndex(tube_name).reconcile(connection, pattern=pattern)
+    for i, (job_id, job) in enumerate(jobs.items(), 1):
+        print_progress(i, len(jobs), "Loading")
+        if not processor.full_config:
+            processor.add_job(job_id, dict(name=job['name']))
             continue
-        job_config = yaml.safe_load(job.body)
-        job_name = job_config['name']
-        job_id = job.stats()['id']
-        if pattern is not None and pattern not in job_name:
+        job_obj = connection.peek(int(job_id))
+        if job_obj is None or job_obj.body is None:
             continue
-        processor.add_job(job_id, job_config, job)
+        job_config = yaml.safe_load(job_obj.body)
+        processor.add_job(job_id, job_config, job_obj)
     end_progress()
     processor.complete()
 
 
+class QueueIndex(object):
+    """
+    An index of the jobs put into a beanstalk tube, and of the runs they
+    belong to, so that the jobs of a run can be found without reserving
+    every job in the tube.
+
+    Like the archive index, it is a file of JSON records, one per line,
+    appended to whenever jobs are put. It is only ever a hint: reconcile()
+    drops the jobs that have left the tube, and if the tube holds jobs that
+    the index does not know about, e.g. because they were scheduled by an
+    older client, it reserves each ready job in the tube once to index them.
+    Appending and rewriting the index both happen under a lock on a file
+    next to it, so that no job is lost by appending while it is rewritten.
+
+    Every account scheduling jobs into the tube must share the index, so it
+    lives in queue_index_dir, by default a directory of archive_base, and
+    its files are kept group-writable.
+    """
+    # Permissions of the index directory and files
+    dir_mode = 0o2775
+    file_mode = 0o664
+
+    def __init__(self, tube, index_dir=None):
+        self.tube = tube
+        self.index_dir = index_dir or config.queue_index_dir or \
+            os.path.join(config.archive_base, '.queue_index')
+        self.path = os.path.join(self.index_dir, tube + '.jsonl')
+        self.lock_path = os.path.join(self.index_dir, tube + '.lock')
+
+    def _lock(self):
+        """
+        :returns: A FileLock to hold while changing the index
+        """
+        os.makedirs(self.index_dir, mode=self.dir_mode, exist_ok=True)
+        if not os.path.exists(self.lock_path):
+            with open(self.lock_path, 'a'):
+                pass
+            os.chmod(self.lock_path, self.file_mode)
+        return FileLock(self.lock_path)
+
+    def add(self, job_ids, name):
+        """
+        Record that jobs of the run called name were put into the tube.
+
+        Failures are logged rather than raised, since reconcile() can always
+        rebuild the index.
+        """
+        lines = ''.join(
+            json.dumps(dict(job_id=str(job_id), name=name)) + '\n'
+            for job_id in job_ids
+        )
+        try:
+            with self._lock():
+                created = not os.path.exists(self.path)
+                with open(self.path, 'a') as f:
+                    f.write(lines)
+                if created:
+                    os.chmod(self.path, self.file_mode)
+        except OSError:
+            log.warning('Could not update the queue index in %s',
+                        self.path, exc_info=True)
+
+    def read(self):
+        """
+        :returns: A dict mapping job IDs to run names
+        """
+        jobs = dict()
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return jobs
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a partially written line
+                continue
+            jobs[record['job_id']] = record['name']
+        return jobs
+
+    def write(self, jobs):
+        """
+        Replace the index with one of jobs, a dict mapping job IDs to run
+        names
+        """
+        try:
+            with self._lock():
+                self._write(jobs)
+        except OSError:
+            log.warning('Could not rewrite the queue index in %s',
+                        self.path, exc_info=True)
+
+    def update(self, gone=(), found=None):
+        """
+        Rewrite the index without the jobs whose IDs are in gone, and with
+        those in found, a dict mapping job IDs to run names. Jobs added since
+        the index was last read are kept.
+        """
+        try:
+            with self._lock():
+                jobs = self.read()
+                for job_id in gone:
+                    jobs.pop(job_id, None)
+                jobs.update(found or dict())
+                self._write(jobs)
+        except OSError:
+            log.warning('Could not rewrite the queue index in %s',
+                        self.path, exc_info=True)
+
+    def _write(self, jobs):
+        tmp = tempfile.NamedTemporaryFile(
+            'w', dir=self.index_dir, prefix=self.tube, delete=False)
+        with tmp:
+            for job_id, name in jobs.items():
+                tmp.write(json.dumps(dict(job_id=job_id, name=name)) + '\n')
+        # NamedTemporaryFile creates files only their owner may write to
+        os.chmod(tmp.name, self.file_mode)
+        os.rename(tmp.name, self.path)
+
+    def reconcile(self, connection, pattern=None):
+        """
+        Bring the index up to date with the tube.
+
+        The connection must be watching the tube if the index is missing
+        any of its jobs.
+
+        :param pattern: Only look up the jobs with pattern in their name.
+                        Checking each job costs a round trip to beanstalkd,
+                        so the others are left unchecked, as long as the
+                        index holds as many jobs as the tube. Otherwise
+                        all of them are checked, and if fewer are ready
+                        than the tube says, the tube is indexed.
+        :returns: An OrderedDict mapping the IDs of the ready jobs in the tube
+                  (with pattern in their name) to dicts with their 'name' and
+                  'pri', in the order they would be reserved in
+        """
+        indexed = self.read()
+        tube_stats = connection.stats_tube(self.tube)
+        tube_ready = tube_stats['current-jobs-ready']
+        tube_jobs = sum(
+            tube_stats.get('current-jobs-' + state, 0)
+            for state in ('ready', 'reserved', 'delayed', 'buried'))
+        # job ID -> stats, or None if the job has left the tube
+        checked = dict()
+        for job_id, name in indexed.items():
+            if pattern is None or pattern in name:
+                checked[job_id] = self._stats_job(connection, job_id)
+        if len(checked) < len(indexed):
+            present = len(indexed) - list(checked.values()).count(None)
+            if present != tube_jobs:
+                # jobs are missing from the index, or jobs that are gone
+                # are still in it; both are hidden until all are checked
+                log.info("The queue index of %s holds %d jobs, the tube %d; "
+                         "checking all of them", self.tube, present,
+                         tube_jobs)
+                for job_id in indexed:
+                    if job_id not in checked:
+                        checked[job_id] = self._stats_job(connection, job_id)
+        ready = dict()
+        for job_id, stats in checked.items():
+            if stats is not None and stats['state'] == 'ready':
+                ready[job_id] = dict(name=indexed[job_id], pri=stats['pri'])
+        gone = [job_id for job_id, stats in checked.items() if stats is None]
+
+        found = dict()
+        if len(checked) == len(indexed) and len(ready) < tube_ready:
+            log.info("The queue index of %s is missing %d jobs; indexing "
+                     "the tube", self.tube, tube_ready - len(ready))
+            for job_id, job in self._walk(connection, tube_ready):
+                found[job_id] = job['name']
+                ready[job_id] = job
+        if gone or set(found) - set(indexed):
+            self.update(gone, found)
+        return OrderedDict(sorted(
+            ((job_id, job) for (job_id, job) in ready.items()
+             if pattern is None or pattern in job['name']),
+            key=lambda item: (item[1]['pri'], int(item[0])),
+        ))
+
+    def _stats_job(self, connection, job_id):
+        """
+        :returns: The stats of the job, or None if it is not in the tube
+        """
+        try:
+            stats = connection.stats_job(int(job_id))
+        except beanstalkc.CommandFailed:
+            return None
+        if stats['tube'] != self.tube:
+            return None
+        return stats
+
+    def _walk(self, connection, job_count):
+        """
+        Reserve each ready job in the tube, then release them all
+
+        :returns: A list of (job ID, dict with 'name' and 'pri') tuples
+        """
+        # Try to figure out a sane timeout based on how many jobs are in the
+        # queue
+        timeout = job_count / 2000.0 * 60
+        reserved = list()
+        jobs = list()
+        try:
+            for i in range(1, job_count + 1):
+                print_progress(i, job_count, "Indexing")
+                job = connection.reserve(timeout=timeout)
+                if job is None:
+                    continue
+                stats = job.stats()
+                reserved.append((job, stats['pri']))
+                if job.body is None:
+                    continue
+                job_config = yaml.safe_load(job.body)
+                jobs.append((str(job.jid), dict(
+                    name=job_config['name'], pri=stats['pri'])))
+            end_progress()
+        finally:
+            for job, pri in reserved:
+                job.release(priority=pri)
+        return jobs
+
+
 def print_progress(index, total, message=None):
     msg = "{m} ".format(m=message) if message else ''
     sys.stderr.write("{msg}{i}/{total}\r".format(
@@ -74,6 +305,9 @@ def end_progress():
 
 
 class JobProcessor(object):
+    # Whether process_job() needs more of the job config than its 'name'
+    full_config = True
+
     def __init__(self):
         self.jobs = OrderedDict()
 
@@ -123,6 +357,8 @@ class JobPrinter(JobProcessor):
 
 
 class RunPrinter(JobProcessor):
+    full_config = False
+
     def __init__(self):
         super(RunPrinter, self).__init__()
         self.runs = list()
@@ -153,7 +389,12 @@ class JobDeleter(JobProcessor):
             ))
         job_obj = self.jobs[job_id].get('job_obj')
         if job_obj:
-            job_obj.delete()
+            try:
+                job_obj.delete()
+            except beanstalkc.CommandFailed:
+                # a worker reserved it in the meantime
+                log.warning("Could not delete job %s", job_id)
+                return
         report.try_delete_jobs(job_name, job_id)
 
 
@@ -201,7 +442,7 @@ def main(args):
             pause_tube(connection, machine_type, pause_duration)
         elif delete:
             walk_jobs(connection, machine_type,
-                      JobDeleter(delete))
+                      JobDeleter(delete), pattern=delete)
         elif runs:
             walk_jobs(connection, machine_type,
                       RunPrinter())
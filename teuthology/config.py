@@ -140,6 +140,7 @@ class TeuthologyConfig(YamlConfig):
         'archive_upload_key': None,
         'archive_upload_url': None,
         'automated_scheduling': False,
+        'dispatcher_max_in_flight': 1,
         'reserve_machines': 5,
         'ceph_git_base_url': 'https://github.com/ceph/',
         'ceph_git_url': None,
@@ -157,6 +158,7 @@ class TeuthologyConfig(YamlConfig):
         'max_job_time': 259200,  # 3 days
         'nsupdate_url': 'http://nsupdate.front.sepia.ceph.com/update',
         'results_server': 'http://paddles.front.sepia.ceph.com/',
+        'results_server_bulk': False,
         'results_ui_server': 'http://pulpito.ceph.com/',
         'results_sending_email': 'teuthology',
         'results_timeout': 43200,
@@ -172,6 +174,12 @@ class TeuthologyConfig(YamlConfig):
         'teuthology_path': None,
         'suite_verify_ceph_hash': True,
         'suite_allow_missing_packages': False,
+        'suite_matrix_cache_path':
+            os.path.expanduser('~/.cache/teuthology/suite_matrix'),
+        'suite_package_versions_cache_path':
+            os.path.expanduser('~/.cache/teuthology/package_versions'),
+        'suite_package_versions_cache_ttl': 3600,
+        'queue_index_dir': None,
         'openstack': {
             'clone': 'git clone http://github.com/ceph/teuthology',
             'user-data': 'teuthology/openstack/openstack-{os_type}-{os_version}-user-data.txt',
@@ -12,7 +12,7 @@ from distutils.util import strtobool
 
 from teuthology.exceptions import ParseError
 from teuthology.suite.build_matrix import \
-        build_matrix, generate_combinations, _get_matrix
+        build_matrix, Combinations, _get_matrix
 from teuthology.suite import util
 
 def main(args):
@@ -125,7 +125,7 @@ def output_summary(path, limit=0,
 
     random.seed(seed)
     mat, first, matlimit = _get_matrix(path, subset)
-    configs = generate_combinations(path, mat, first, matlimit)
+    configs = Combinations(path, mat, first, matlimit)
     count = 0
     suite = os.path.basename(path)
     config_list = util.filter_configs(configs,
@@ -166,7 +166,7 @@ def get_combinations(suite_dir,
     of strings.
     """
     suite = os.path.basename(suite_dir)
-    configs = build_matrix(suite_dir, subset, seed)
+    configs = build_matrix(suite_dir, subset, seed, lazy=True)
 
     num_listed = 0
     rows = []
@@ -1,12 +1,20 @@
+import gevent
+import gevent.lock
+import gevent.pool
+import heapq
+import itertools
+import json
 import logging
 import os
 import subprocess
 import sys
+import time
 import yaml
 
 from datetime import datetime
 
 from teuthology import setup_log_file, install_except_hook
+from teuthology import archive_index
 from teuthology import beanstalk
 from teuthology import report
 from teuthology.config import config as teuth_config
@@ -22,6 +30,11 @@ log = logging.getLogger(__name__)
 start_time = datetime.utcnow()
 restart_file_path = '/tmp/teuthology-restart-dispatcher'
 stop_file_path = '/tmp/teuthology-stop-dispatcher'
+# Held while (re)loading the config and preparing a job. prep_job() sets
+# process-wide config such as ceph_qa_suite_git_url, and fetches into clones
+# that the file locks of repo_utils do not protect from other greenlets, so
+# only the waits for machines may overlap.
+prep_lock = gevent.lock.Semaphore()
 
 
 def sentinel(path):
@@ -82,36 +95,138 @@ def main(args):
 
     connection = beanstalk.connect()
     beanstalk.watch_tube(connection, tube)
-    result_proc = None
 
     if teuth_config.teuthology_path is None:
         fetch_teuthology('master')
     fetch_qa_suite('master')
 
-    keep_running = True
-    job_procs = set()
-    while keep_running:
-        # Check to see if we have a teuthology-results process hanging around
-        # and if so, read its return code so that it can exit.
-        if result_proc is not None and result_proc.poll() is not None:
-            log.debug("teuthology-results exited with code: %s",
-                      result_proc.returncode)
-            result_proc = None
-
-        if sentinel(restart_file_path):
-            restart()
-        elif sentinel(stop_file_path):
-            stop()
-
-        load_config()
-        job_procs = set(filter(lambda p: p.poll() is None, job_procs))
-        job = connection.reserve(timeout=60)
+    max_in_flight = int(args.get("--max-in-flight") or
+                        teuth_config.dispatcher_max_in_flight)
+    dispatcher = Dispatcher(
+        connection,
+        tube,
+        archive_dir,
+        log_file_path,
+        max_in_flight=max_in_flight,
+        exit_on_empty_queue=exit_on_empty_queue,
+    )
+    return dispatcher.run()
+
+
+class Dispatcher(object):
+    """
+    Reserve jobs from a beanstalk tube and start a supervisor process for
+    each of them.
+
+    Up to max_in_flight jobs have their machines locked concurrently, so
+    that a job waiting for scarce machines does not hold up the ones behind
+    it. Jobs are still prepared one at a time; see prep_lock. Up to backlog_size more reserved jobs wait in a
+    local backlog, from which the jobs with the most urgent beanstalk
+    priority go first. By default the backlog holds one job less than
+    max_in_flight, so that a dispatcher handling one job at a time does
+    not keep jobs from other dispatchers.
+
+    The queue depth, the size of the backlog, the number of jobs in flight
+    and the time it took jobs to start are logged every stats_interval
+    seconds, and written as JSON to <log file>.stats.json.
+    """
+    # How long reserve() waits for a job when nothing else is going on
+    reserve_timeout = 60
+    # ... and when there are jobs to keep an eye on
+    busy_reserve_timeout = 5
+    stats_interval = 300
+
+    def __init__(self, connection, tube, archive_dir, log_file_path,
+                 max_in_flight=1, backlog_size=None,
+                 exit_on_empty_queue=False):
+        self.connection = connection
+        self.tube = tube
+        self.archive_dir = archive_dir
+        self.log_file_path = log_file_path
+        self.max_in_flight = max_in_flight
+        if backlog_size is None:
+            backlog_size = max_in_flight - 1
+        self.backlog_size = backlog_size
+        self.exit_on_empty_queue = exit_on_empty_queue
+        self.pool = gevent.pool.Pool(max_in_flight)
+        # a heap of (priority, sequence number, job, job config, reserved at)
+        self.backlog = []
+        self.sequence = itertools.count()
+        self.job_procs = set()
+        self.keep_running = True
+        self.stats = dict(
+            queue_depth=None,
+            backlog=0,
+            in_flight=0,
+            supervisors=0,
+            started=0,
+            failed=0,
+            time_to_start=None,
+            time_to_start_max=0,
+            time_to_start_total=0,
+            queue_time=None,
+        )
+        self.stats_path = log_file_path + '.stats.json'
+        self.last_stats = time.time()
+
+    def run(self):
+        while self.keep_running or self.backlog or len(self.pool):
+            self.reap()
+            if sentinel(restart_file_path):
+                self.drain()
+                restart()
+            elif sentinel(stop_file_path):
+                self.drain()
+                stop()
+
+            self.dispatch()
+            if self.keep_running and len(self.backlog) + len(self.pool) < \
+                    self.max_in_flight + self.backlog_size:
+                job = self.reserve()
+                if job is None:
+                    if self.exit_on_empty_queue and not self.busy():
+                        log.info("Queue is empty and no supervisor processes "
+                                 "running; exiting!")
+                        break
+            else:
+                # wait for a job to make it past locking
+                gevent.wait(list(self.pool.greenlets), count=1,
+                            timeout=self.busy_reserve_timeout)
+            self.maybe_report_stats()
+
+        self.pool.join()
+        self.report_stats()
+        returncodes = set([0])
+        for proc in self.job_procs:
+            if proc.returncode is not None:
+                returncodes.add(proc.returncode)
+        return max(returncodes)
+
+    def busy(self):
+        return bool(self.backlog or len(self.pool) or self.job_procs)
+
+    def reap(self):
+        """
+        Forget about the supervisors that have exited
+        """
+        self.job_procs = set(filter(lambda p: p.poll() is None,
+                                    self.job_procs))
+
+    def reserve(self):
+        """
+        Reserve a job and add it to the backlog.
+
+        :returns: The job, or None if there was none to reserve
+        """
+        with prep_lock:
+            load_config()
+        timeout = self.reserve_timeout
+        if self.busy():
+            timeout = self.busy_reserve_timeout
+        job = self.connection.reserve(timeout=timeout)
         if job is None:
-            if exit_on_empty_queue and not job_procs:
-                log.info("Queue is empty and no supervisor processes running; exiting!")
-                break
-            continue
-
+            return None
+        reserved_at = time.time()
         # bury the job so it won't be re-run if it fails
         job.bury()
         job_id = job.jid
@@ -121,54 +236,57 @@ def main(args):
         job_config['job_id'] = str(job_id)
 
         if job_config.get('stop_worker'):
-            keep_running = False
+            self.keep_running = False
 
         try:
-            job_config, teuth_bin_path = prep_job(
-                job_config,
-                log_file_path,
-                archive_dir,
-            )
-        except SkipJob:
-            continue
-
-        # lock machines but do not reimage them
-        if 'roles' in job_config:
-            job_config = lock_machines(job_config)
-
-        run_args = [
-            os.path.join(teuth_bin_path, 'teuthology-dispatcher'),
-            '--supervisor',
-            '-v',
-            '--bin-path', teuth_bin_path,
-            '--archive-dir', archive_dir,
-        ]
-
-        # Create run archive directory if not already created and
-        # job's archive directory
-        create_job_archive(job_config['name'],
-                           job_config['archive_path'],
-                           archive_dir)
-        job_config_path = os.path.join(job_config['archive_path'], 'orig.config.yaml')
-
-        # Write initial job config in job archive dir
-        with open(job_config_path, 'w') as f:
-            yaml.safe_dump(job_config, f, default_flow_style=False)
-
-        run_args.extend(["--job-config", job_config_path])
-
+            job_stats = job.stats()
+        except Exception:
+            log.debug("Could not get the stats of job %d", job_id,
+                      exc_info=True)
+            job_stats = dict()
+        if 'age' in job_stats:
+            self.stats['queue_time'] = job_stats['age']
+        heapq.heappush(self.backlog, (
+            job_stats.get('pri', 0), next(self.sequence), job, job_config,
+            reserved_at))
+        return job
+
+    def dispatch(self):
+        """
+        Start preparing the most urgent jobs in the backlog, as long as
+        fewer than max_in_flight jobs are being prepared
+        """
+        while self.backlog and self.pool.free_count():
+            item = heapq.heappop(self.backlog)
+            self.pool.spawn(self.dispatch_job, *item[2:])
+
+    def drain(self):
+        """
+        Stop reserving jobs and start supervisors for those already reserved
+        """
+        self.keep_running = False
+        while self.backlog:
+            self.dispatch()
+            gevent.wait(list(self.pool.greenlets), count=1)
+        self.pool.join()
+
+    def dispatch_job(self, job, job_config, reserved_at):
         try:
-            job_proc = subprocess.Popen(run_args)
-            job_procs.add(job_proc)
-            log.info('Job supervisor PID: %s', job_proc.pid)
+            job_proc = run_job(job_config, self.log_file_path,
+                               self.archive_dir)
+        except SkipJob:
+            job_proc = None
         except Exception:
-            error_message = "Saw error while trying to spawn supervisor."
+            self.stats['failed'] += 1
+            error_message = "Saw error while preparing job."
             log.exception(error_message)
-            if 'targets' in job_config:
-                nuke(supervisor.create_fake_context(job_config), True)
             report.try_push_job_info(job_config, dict(
-                status='fail',
+                status='dead',
                 failure_reason=error_message))
+            job_proc = None
+        if job_proc is not None:
+            self.job_procs.add(job_proc)
+            self.record_start(time.time() - reserved_at)
 
         # This try/except block is to keep the worker from dying when
         # beanstalkc throws a SocketError
@@ -177,11 +295,99 @@ def main(args):
         except Exception:
             log.exception("Saw exception while trying to delete job")
 
-    returncodes = set([0])
-    for proc in job_procs:
-        if proc.returncode is not None:
-            returncodes.add(proc.returncode)
-    return max(returncodes)
+    def record_start(self, elapsed):
+        stats = self.stats
+        stats['started'] += 1
+        stats['time_to_start'] = elapsed
+        stats['time_to_start_max'] = max(stats['time_to_start_max'], elapsed)
+        stats['time_to_start_total'] += elapsed
+
+    def maybe_report_stats(self):
+        if time.time() - self.last_stats >= self.stats_interval:
+            self.report_stats()
+
+    def report_stats(self):
+        self.last_stats = time.time()
+        stats = self.stats
+        try:
+            stats['queue_depth'] = self.connection.stats_tube(
+                self.tube)['current-jobs-ready']
+        except Exception:
+            log.debug("Could not get the stats of tube %s", self.tube,
+                      exc_info=True)
+        stats['backlog'] = len(self.backlog)
+        stats['in_flight'] = len(self.pool)
+        stats['supervisors'] = len(self.job_procs)
+        if stats['started']:
+            stats['time_to_start_mean'] = \
+                stats['time_to_start_total'] / stats['started']
+        log.info(
+            "Queue depth: %s; backlog: %d; in flight: %d; supervisors: %d; "
+            "started: %d; mean time to start: %.1fs",
+            stats['queue_depth'], stats['backlog'], stats['in_flight'],
+            stats['supervisors'], stats['started'],
+            stats.get('time_to_start_mean', 0))
+        try:
+            with open(self.stats_path + '.tmp', 'w') as f:
+                json.dump(stats, f)
+            os.rename(self.stats_path + '.tmp', self.stats_path)
+        except OSError:
+            log.warning("Could not write %s", self.stats_path, exc_info=True)
+
+
+def run_job(job_config, log_file_path, archive_dir):
+    """
+    Prepare a job, lock its machines and start its supervisor.
+
+    :returns: The supervisor process, or None if it could not be started
+    :raises:  SkipJob if the job is not to be run
+    """
+    with prep_lock:
+        job_config, teuth_bin_path = prep_job(
+            job_config,
+            log_file_path,
+            archive_dir,
+        )
+
+    # lock machines but do not reimage them
+    if 'roles' in job_config:
+        job_config = lock_machines(job_config)
+
+    run_args = [
+        os.path.join(teuth_bin_path, 'teuthology-dispatcher'),
+        '--supervisor',
+        '-v',
+        '--bin-path', teuth_bin_path,
+        '--archive-dir', archive_dir,
+    ]
+
+    # Create run archive directory if not already created and
+    # job's archive directory
+    create_job_archive(job_config['name'],
+                       job_config['archive_path'],
+                       archive_dir)
+    job_config_path = os.path.join(job_config['archive_path'], 'orig.config.yaml')
+
+    # Write initial job config in job archive dir
+    with open(job_config_path, 'w') as f:
+        yaml.safe_dump(job_config, f, default_flow_style=False)
+    archive_index.record_job(job_config['archive_path'], job_config)
+
+    run_args.extend(["--job-config", job_config_path])
+
+    try:
+        job_proc = subprocess.Popen(run_args)
+        log.info('Job supervisor PID: %s', job_proc.pid)
+        return job_proc
+    except Exception:
+        error_message = "Saw error while trying to spawn supervisor."
+        log.exception(error_message)
+        if 'targets' in job_config:
+            nuke(supervisor.create_fake_context(job_config), True)
+        report.try_push_job_info(job_config, dict(
+            status='fail',
+            failure_reason=error_message))
+        return None
 
 
 def lock_machines(job_config):
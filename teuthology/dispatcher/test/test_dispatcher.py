@@ -0,0 +1,127 @@
+import gevent
+import json
+import yaml
+
+from mock import Mock, patch
+
+from teuthology import dispatcher
+from teuthology.exceptions import SkipJob
+
+
+class FakeJob(object):
+    def __init__(self, jid, pri=1024, **config):
+        self.jid = jid
+        self.pri = pri
+        config.setdefault('name', 'run')
+        self.body = yaml.safe_dump(config)
+        self.buried = self.deleted = False
+
+    def bury(self):
+        self.buried = True
+
+    def delete(self):
+        self.deleted = True
+
+    def stats(self):
+        return dict(pri=self.pri, age=10)
+
+
+class TestDispatcher(object):
+    def setup(self):
+        self.patchers = [
+            patch('teuthology.dispatcher.load_config'),
+            patch('teuthology.dispatcher.sentinel', return_value=False),
+            patch('teuthology.dispatcher.report'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.started = []
+
+    def teardown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def make_dispatcher(self, jobs, tmpdir, max_in_flight=2):
+        queue = list(jobs)
+
+        def reserve(timeout):
+            # like the real thing, give other greenlets a chance to run
+            gevent.sleep(0.01)
+            return queue.pop(0) if queue else None
+
+        connection = Mock()
+        connection.reserve.side_effect = reserve
+        connection.stats_tube.return_value = {'current-jobs-ready': 0}
+        return dispatcher.Dispatcher(
+            connection, 'tube', str(tmpdir), str(tmpdir.join('dispatcher')),
+            max_in_flight=max_in_flight, exit_on_empty_queue=True)
+
+    def run_job(self, job_config, log_file_path, archive_dir):
+        if job_config.get('skip'):
+            raise SkipJob()
+        if job_config.get('broken'):
+            raise RuntimeError('broken')
+        self.started.append(job_config['job_id'])
+        proc = Mock()
+        proc.poll.return_value = 0
+        proc.returncode = 0
+        return proc
+
+    def test_run(self, tmpdir):
+        jobs = [FakeJob(1), FakeJob(2, skip=True), FakeJob(3, broken=True),
+                FakeJob(4)]
+        d = self.make_dispatcher(jobs, tmpdir)
+        with patch('teuthology.dispatcher.run_job', side_effect=self.run_job):
+            assert d.run() == 0
+        assert sorted(self.started) == ['1', '4']
+        for job in jobs:
+            assert job.buried and job.deleted
+        dispatcher.report.try_push_job_info.assert_called_once()
+        assert d.stats['started'] == 2
+        assert d.stats['failed'] == 1
+        assert d.stats['queue_time'] == 10
+        with open(d.stats_path) as f:
+            stats = json.load(f)
+        assert stats['queue_depth'] == 0
+        assert stats['started'] == 2
+
+    def test_priority(self, tmpdir):
+        jobs = [FakeJob(1, pri=100), FakeJob(2, pri=10), FakeJob(3, pri=50)]
+        d = self.make_dispatcher(jobs, tmpdir, max_in_flight=3)
+        for _ in jobs:
+            d.reserve()
+        assert len(d.backlog) == 3
+        with patch('teuthology.dispatcher.run_job', side_effect=self.run_job):
+            d.dispatch()
+            d.pool.join()
+        assert self.started == ['2', '3', '1']
+
+    def test_stop_worker(self, tmpdir):
+        jobs = [FakeJob(1, stop_worker=True), FakeJob(2)]
+        d = self.make_dispatcher(jobs, tmpdir)
+        d.exit_on_empty_queue = False
+        with patch('teuthology.dispatcher.run_job', side_effect=self.run_job):
+            d.run()
+        assert self.started == ['1']
+        assert not jobs[1].buried
+
+    def test_prep_serialized(self, tmpdir):
+        active = []
+        overlapped = []
+
+        def prep_job(job_config, log_file_path, archive_dir):
+            active.append(job_config['job_id'])
+            overlapped.append(len(active) > 1)
+            # like fetching repositories, yield to the other greenlets
+            gevent.sleep(0.01)
+            active.remove(job_config['job_id'])
+            raise SkipJob()
+
+        jobs = [FakeJob(1), FakeJob(2), FakeJob(3)]
+        d = self.make_dispatcher(jobs, tmpdir, max_in_flight=3)
+        for _ in jobs:
+            d.reserve()
+        with patch('teuthology.dispatcher.prep_job', side_effect=prep_job):
+            d.dispatch()
+            d.pool.join()
+        assert overlapped == [False, False, False]
@@ -125,6 +125,25 @@ class ConnectionLostError(Exception):
             )
 
 
+class CleanupError(Exception):
+
+    """
+    Exception thrown when cleanup steps fail while nuking a node
+    """
+    def __init__(self, node, failures):
+        self.node = node
+        self.failures = failures
+
+    def __str__(self):
+        return "Cleanup of {node} failed: {steps}".format(
+            node=self.node,
+            steps=', '.join(
+                '{step} ({status})'.format(**failure)
+                for failure in self.failures
+            ),
+        )
+
+
 class ScheduleFailError(RuntimeError):
     def __init__(self, message, name=None):
         self.message = message
@@ -1,4 +1,5 @@
 #!/usr/bin/python
+import beanstalkc
 import os
 import sys
 import yaml
@@ -11,6 +12,7 @@ import getpass
 
 from teuthology import beanstalk
 from teuthology import report
+from teuthology.archive_index import RunIndex
 from teuthology.config import config
 from teuthology import misc
 
@@ -76,7 +78,8 @@ def kill_run(run_name, archive_base=None, owner=None, machine_type=None,
 
 def kill_job(run_name, job_id, archive_base=None, owner=None, skip_nuke=False):
     serializer = report.ResultsSerializer(archive_base)
-    job_info = serializer.job_info(run_name, job_id)
+    index = RunIndex(os.path.join(serializer.archive_base, run_name))
+    job_info = index.jobs([str(job_id)])[str(job_id)]
     if not owner:
         if 'owner' not in job_info:
             raise RuntimeError(
@@ -101,16 +104,10 @@ def find_run_info(serializer, run_name):
 
     pids = []
     run_info = {}
-    job_info = {}
-    job_num = 0
-    jobs = serializer.jobs_for_run(run_name)
-    job_total = len(jobs)
-    for (job_id, job_dir) in jobs.items():
-        if not os.path.isdir(job_dir):
-            continue
-        job_num += 1
-        beanstalk.print_progress(job_num, job_total, 'Reading Job: ')
-        job_info = serializer.job_info(run_name, job_id, simple=True)
+    index = RunIndex(os.path.join(serializer.archive_base, run_name))
+    jobs = index.jobs()
+    for job_id in sorted(jobs, key=int):
+        job_info = jobs[job_id]
         for key in job_info.keys():
             if key in run_info_fields and key not in run_info:
                 run_info[key] = job_info[key]
@@ -141,23 +138,27 @@ def remove_beanstalk_jobs(run_name, tube_name):
 
     curjobs = beanstalk_conn.stats_tube(real_tube_name)['current-jobs-ready']
     if curjobs != 0:
-        x = 1
-        while x != curjobs:
-            x += 1
-            job = beanstalk_conn.reserve(timeout=20)
-            if job is None:
+        index = beanstalk.QueueIndex(real_tube_name)
+        jobs = index.reconcile(beanstalk_conn, pattern=run_name)
+        for job_id, job in jobs.items():
+            if job['name'] != run_name:
                 continue
-            job_config = yaml.safe_load(job.body)
-            if run_name == job_config['name']:
-                job_id = job.stats()['id']
-                msg = "Deleting job from queue. ID: " + \
-                    "{id} Name: {name} Desc: {desc}".format(
-                        id=str(job_id),
-                        name=job_config['name'],
-                        desc=job_config['description'],
-                    )
-                log.info(msg)
-                job.delete()
+            job_obj = beanstalk_conn.peek(int(job_id))
+            if job_obj is None:
+                continue
+            job_config = yaml.safe_load(job_obj.body)
+            msg = "Deleting job from queue. ID: " + \
+                "{id} Name: {name} Desc: {desc}".format(
+                    id=job_id,
+                    name=job_config['name'],
+                    desc=job_config['description'],
+                )
+            log.info(msg)
+            try:
+                job_obj.delete()
+            except beanstalkc.CommandFailed:
+                # a worker reserved it in the meantime
+                log.warning("Could not delete job %s", job_id)
     else:
         print("No jobs in Beanstalk Queue")
     beanstalk_conn.close()
@@ -284,7 +284,7 @@ def update_inventory(node_dict):
 def do_update_keys(machines, all_=False, _raise=True):
     reference = query.list_locks(keyed_by_name=True)
     if all_:
-        machines = reference.keys()
+        machines = list(reference.keys())
     keys_dict = misc.ssh_keyscan(machines, _raise=_raise)
     return push_new_keys(keys_dict, reference), keys_dict
 
@@ -394,9 +394,17 @@ def block_and_lock_machines(ctx, total_requested, machine_type, reimage=True):
             )
         )
         if len(all_locked) == total_requested:
+            statuses = teuthology.lock.query.get_statuses(
+                list(all_locked), keyed_by_name=True)
+
+            def get_status(machine):
+                name = misc.canonicalize_hostname(machine, user=None)
+                return statuses.get(name) or \
+                    teuthology.lock.query.get_status(name)
+
             vmlist = []
             for lmach in all_locked:
-                if teuthology.lock.query.is_vm(lmach):
+                if teuthology.lock.query.is_vm(status=get_status(lmach)):
                     vmlist.append(lmach)
             if vmlist:
                 log.info('Waiting for virtual machines to come up')
@@ -417,11 +425,15 @@ def block_and_lock_machines(ctx, total_requested, machine_type, reimage=True):
                                 full_name = misc.canonicalize_hostname(guest)
                                 teuthology.provision.destroy_if_vm(ctx, full_name)
                                 teuthology.provision.create_if_vm(ctx, full_name)
+                                misc.forget_host_keys([guest])
                 if teuthology.lock.ops.do_update_keys(keys_dict)[0]:
                     log.info("Error in virtual machine keys")
+                # get statuses again to pick up the updated keys
+                statuses = teuthology.lock.query.get_statuses(
+                    list(all_locked), keyed_by_name=True)
                 newscandict = {}
                 for dkey in all_locked.keys():
-                    stats = teuthology.lock.query.get_status(dkey)
+                    stats = get_status(dkey)
                     newscandict[dkey] = stats['ssh_pub_key']
                 ctx.config['targets'] = newscandict
             else:
@@ -1,7 +1,10 @@
+import gevent.pool
 import logging
 import os
+import time
 
 import requests
+import requests.adapters
 
 from teuthology import misc
 from teuthology.config import config
@@ -12,13 +15,42 @@ from teuthology.util.compat import urlencode
 log = logging.getLogger(__name__)
 
 
+# Looking up this many machines or more is done by listing every node,
+# rather than asking for each of them
+STATUS_BATCH_MIN = 5
+
+# Jobs in these states are the reason their nodes are locked
+ACTIVE_JOB_STATUSES = ('running', 'waiting')
+# Jobs in these states are done for good
+FINAL_JOB_STATUSES = ('pass', 'fail', 'dead')
+JOB_STATUS_CACHE_TTL = 60
+
+_session = None
+# (run name, job ID) -> (status, when it was looked up)
+_job_statuses = dict()
+
+
+def get_session():
+    """
+    The requests.Session shared by lock server queries, so that they reuse
+    their connections
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=16)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
 def get_status(name):
     name = misc.canonicalize_hostname(name, user=None)
     uri = os.path.join(config.lock_server, 'nodes', name, '')
     with safe_while(
             sleep=1, increment=0.5, action=f'get_status {name}') as proceed:
         while proceed():
-            response = requests.get(uri)
+            response = get_session().get(uri)
             if response.ok:
                 return response.json()
     log.warning(
@@ -26,19 +58,38 @@ def get_status(name):
     return dict()
 
 
-def get_statuses(machines):
+def get_statuses(machines, keyed_by_name=False):
+    """
+    Look up the status of machines, or of every node if machines is empty.
+
+    Many machines are looked up with a single query listing every node.
+
+    :param machines:      Machine names
+    :param keyed_by_name: Return a dict mapping node names to their status
+                          rather than a list of statuses
+    """
     if machines:
+        names = [
+            misc.canonicalize_hostname(
+                misc.canonicalize_hostname(machine), user=None)
+            for machine in machines
+        ]
+        if len(names) >= STATUS_BATCH_MIN:
+            nodes = list_locks(keyed_by_name=True)
+        else:
+            nodes = dict()
         statuses = []
-        for machine in machines:
-            machine = misc.canonicalize_hostname(machine)
-            status = get_status(machine)
+        for name in names:
+            status = nodes.get(name) or get_status(name)
             if status:
                 statuses.append(status)
             else:
                 log.error("Lockserver doesn't know about machine: %s" %
-                          machine)
+                          name)
     else:
         statuses = list_locks()
+    if keyed_by_name:
+        return {status['name']: status for status in statuses}
     return statuses
 
 
@@ -66,7 +117,7 @@ def list_locks(keyed_by_name=False, **kwargs):
             sleep=1, increment=0.5, action='list_locks') as proceed:
         while proceed():
             try:
-                response = requests.get(uri)
+                response = get_session().get(uri)
                 if response.ok:
                     break
             except requests.ConnectionError:
@@ -87,6 +138,10 @@ def find_stale_locks(owner=None):
     us to nuke nodes that were left locked due to e.g. infrastructure failures
     and return them to the pool.
 
+    Nodes whose job the results server does not know about, or whose status
+    could not be looked up, are not considered stale: the job may simply not
+    have been reported yet.
+
     :param owner: If non-None, return nodes locked by owner. Default is None.
     """
     def might_be_stale(node_dict):
@@ -111,43 +166,96 @@ def find_stale_locks(owner=None):
     nodes = list_locks(locked=True)
     if owner is not None:
         nodes = [node for node in nodes if node['locked_by'] == owner]
-    nodes = filter(might_be_stale, nodes)
+    nodes = list(filter(might_be_stale, nodes))
 
-    def node_job_is_active(node, cache):
-        """
-        Is this node's job active (e.g. running or waiting)?
-
-        :param node:  The node dict as returned from the lock server
-        :param cache: A set() used for caching results
-        :returns:     True or False
-        """
-        description = node['description']
-        if description in cache:
-            return True
-        (name, job_id) = description.split('/')[-2:]
-        url = os.path.join(config.results_server, 'runs', name, 'jobs', job_id,
-                           '')
-        with safe_while(
-                sleep=1, increment=0.5, action='node_is_active') as proceed:
-            while proceed():
-                resp = requests.get(url)
-                if resp.ok:
-                    break
-        if not resp.ok:
-            return False
-        job_info = resp.json()
-        if job_info['status'] in ('running', 'waiting'):
-            cache.add(description)
-            return True
-        return False
+    def node_job(node):
+        (name, job_id) = node['description'].split('/')[-2:]
+        return (name, job_id)
 
-    result = list()
+    statuses = get_job_statuses(node_job(node) for node in nodes)
     # Here we build the list of of nodes that are locked, for a job (as opposed
     # to being locked manually for random monkeying), where the job is not
     # running
-    active_jobs = set()
+    stale = list()
     for node in nodes:
-        if node_job_is_active(node, active_jobs):
-            continue
-        result.append(node)
+        status = statuses.get(node_job(node))
+        if status is None:
+            log.info("The status of %s's job %s is unknown; not treating it "
+                     "as stale", node['name'], '/'.join(node_job(node)))
+        elif status not in ACTIVE_JOB_STATUSES:
+            stale.append(node)
+    return stale
+
+
+def get_job_statuses(jobs, workers=16):
+    """
+    Look up the status of jobs on the results server.
+
+    The jobs of each run are looked up together, and the runs concurrently.
+    Statuses are cached: those of finished jobs for good, the others for
+    JOB_STATUS_CACHE_TTL seconds. Unknown statuses are not cached.
+
+    :param jobs:    (run name, job ID) tuples
+    :param workers: How many runs to look up at once
+    :returns:       A dict mapping each of the tuples to the job's status,
+                    or None if it is unknown
+    """
+    now = time.time()
+    result = dict()
+    wanted = dict()
+    for (run_name, job_id) in set(jobs):
+        job_id = str(job_id)
+        cached = _job_statuses.get((run_name, job_id))
+        if cached is not None and (cached[0] in FINAL_JOB_STATUSES or
+                                   now - cached[1] < JOB_STATUS_CACHE_TTL):
+            result[(run_name, job_id)] = cached[0]
+        else:
+            wanted.setdefault(run_name, set()).add(job_id)
+
+    pool = gevent.pool.Pool(workers)
+    runs = list(wanted.items())
+    for (run_name, job_ids), statuses in zip(
+            runs, pool.imap(lambda run: _get_run_job_statuses(*run), runs)):
+        for job_id in job_ids:
+            status = statuses.get(job_id)
+            if status is not None:
+                _job_statuses[(run_name, job_id)] = (status, now)
+            result[(run_name, job_id)] = status
     return result
+
+
+def _get_run_job_statuses(run_name, job_ids):
+    """
+    :returns: A dict mapping the IDs of jobs of run_name to their status
+    """
+    run_uri = os.path.join(config.results_server, 'runs', run_name, 'jobs', '')
+    if len(job_ids) > 1:
+        try:
+            response = get_session().get(
+                run_uri, params=dict(fields='job_id,status'))
+            if response.ok:
+                return dict(
+                    (str(job['job_id']), job['status'])
+                    for job in response.json()
+                )
+        except requests.RequestException:
+            log.debug("Could not get the jobs of run %s", run_name,
+                      exc_info=True)
+    statuses = dict()
+    for job_id in job_ids:
+        with safe_while(
+                sleep=1, increment=0.5, action='node_is_active') as proceed:
+            while proceed():
+                try:
+                    response = get_session().get(
+                        os.path.join(run_uri, job_id, ''))
+                except requests.ConnectionError:
+                    continue
+                if response.ok:
+                    statuses[job_id] = response.json()['status']
+                    break
+                if response.status_code == 404:
+                    log.warning("The results server does not know about "
+                                "job %s/%s", run_name, job_id)
+                    break
+    return statuses
@@ -1,7 +1,121 @@
+import time
+
+import teuthology.lock.query
 import teuthology.lock.util
 
+from mock import Mock, patch
+
 class TestLock(object):
 
     def test_locked_since_seconds(self):
         node = { "locked_since": "2013-02-07 19:33:55.000000" }
         assert teuthology.lock.util.locked_since_seconds(node) > 3600
+
+
+class TestGetStatuses(object):
+    def setup(self):
+        self.nodes = dict(
+            ('smithi%03d.front.sepia.ceph.com' % i,
+             dict(name='smithi%03d.front.sepia.ceph.com' % i, locked=True))
+            for i in range(10)
+        )
+
+    def get_status(self, name):
+        return dict(self.nodes.get(name, dict()))
+
+    @patch('teuthology.lock.query.list_locks')
+    @patch('teuthology.lock.query.get_status')
+    def test_few(self, m_get_status, m_list_locks):
+        m_get_status.side_effect = self.get_status
+        statuses = teuthology.lock.query.get_statuses(
+            ['ubuntu@smithi001', 'smithi002.front.sepia.ceph.com'])
+        assert [s['name'] for s in statuses] == [
+            'smithi001.front.sepia.ceph.com',
+            'smithi002.front.sepia.ceph.com']
+        assert m_get_status.call_count == 2
+        m_list_locks.assert_not_called()
+
+    @patch('teuthology.lock.query.list_locks')
+    @patch('teuthology.lock.query.get_status')
+    def test_many(self, m_get_status, m_list_locks):
+        m_get_status.side_effect = self.get_status
+        listed = dict(self.nodes)
+        # a node the listing somehow missed is still looked up
+        del listed['smithi007.front.sepia.ceph.com']
+        m_list_locks.return_value = listed
+        machines = ['smithi%03d' % i for i in range(8)] + ['unknown']
+        statuses = teuthology.lock.query.get_statuses(
+            machines, keyed_by_name=True)
+        m_list_locks.assert_called_once_with(keyed_by_name=True)
+        assert sorted(statuses) == [
+            'smithi%03d.front.sepia.ceph.com' % i for i in range(8)]
+        assert [c[0][0] for c in m_get_status.call_args_list] == [
+            'smithi007.front.sepia.ceph.com', 'unknown.front.sepia.ceph.com']
+
+
+class TestFindStaleLocks(object):
+    def setup(self):
+        teuthology.lock.query._job_statuses.clear()
+        self.nodes = [
+            dict(name='a', locked=True, locked_by='me',
+                 description='/archive/run1/1'),
+            dict(name='b', locked=True, locked_by='me',
+                 description='/archive/run1/1'),
+            dict(name='c', locked=True, locked_by='me',
+                 description='/archive/run1/2'),
+            dict(name='d', locked=True, locked_by='me',
+                 description='/archive/run2/3'),
+            dict(name='e', locked=True, locked_by='me',
+                 description='/archive/run3/4'),
+            dict(name='f', locked=True, locked_by='you',
+                 description='/archive/run2/3'),
+            dict(name='g', locked=True, locked_by='me',
+                 description='manually locked'),
+        ]
+        self.jobs = {
+            'run1': {'1': 'running', '2': 'pass'},
+            'run2': {'3': 'queued'},
+        }
+
+    def get(self, uri, params=None):
+        parts = uri.rstrip('/').split('/')
+        response = Mock(ok=True, status_code=200)
+        if parts[-1] == 'jobs':
+            jobs = self.jobs.get(parts[-2], dict())
+            response.json.return_value = [
+                dict(job_id=int(job_id), status=status)
+                for job_id, status in jobs.items()
+            ]
+            return response
+        status = self.jobs.get(parts[-3], dict()).get(parts[-1])
+        if status is None:
+            response.ok = False
+            response.status_code = 404
+        response.json.return_value = dict(status=status)
+        return response
+
+    @patch('teuthology.lock.query.get_session')
+    @patch('teuthology.lock.query.list_locks')
+    def test_find_stale_locks(self, m_list_locks, m_get_session):
+        m_list_locks.return_value = self.nodes
+        m_get = m_get_session.return_value.get
+        m_get.side_effect = self.get
+        stale = teuthology.lock.query.find_stale_locks(owner='me')
+        # the results server does not know run3's job, so e is left alone
+        assert [node['name'] for node in stale] == ['c', 'd']
+        # one query for run1's jobs, one for each of the other runs' job
+        assert m_get.call_count == 3
+
+        # finished jobs are not looked up again, nor are the others right
+        # away; unknown ones are
+        m_get.reset_mock()
+        self.jobs['run2']['3'] = 'running'
+        teuthology.lock.query.find_stale_locks(owner='me')
+        assert m_get.call_count == 1
+        m_get.reset_mock()
+        self.jobs['run3'] = {'4': 'dead'}
+        later = time.time() + teuthology.lock.query.JOB_STATUS_CACHE_TTL + 1
+        with patch('teuthology.lock.query.time.time', return_value=later):
+            stale = teuthology.lock.query.find_stale_locks(owner='me')
+        assert [node['name'] for node in stale] == ['c', 'e']
+        assert m_get.call_count == 3
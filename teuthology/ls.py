@@ -1,32 +1,27 @@
 from __future__ import print_function
 
 import os
-import yaml
-import errno
 import re
 
+from teuthology.archive_index import RunIndex
 from teuthology.job_status import get_status
 
 
 def main(args):
+    if args["--rebuild-index"]:
+        RunIndex(args["<archive_dir>"]).rebuild()
     return ls(args["<archive_dir>"], args["--verbose"])
 
 
 def ls(archive_dir, verbose):
-    for j in get_jobs(archive_dir):
+    jobs = get_jobs(archive_dir)
+    index = RunIndex(archive_dir).jobs(jobs)
+    for j in jobs:
         job_dir = os.path.join(archive_dir, j)
-        summary = {}
-        try:
-            with open(os.path.join(job_dir, 'summary.yaml')) as f:
-                g = yaml.safe_load_all(f)
-                for new in g:
-                    summary.update(new)
-        except IOError as e:
-            if e.errno == errno.ENOENT:
-                print_debug_info(j, job_dir, archive_dir)
-                continue
-            else:
-                raise
+        summary = index[j]
+        if not summary.get('finished'):
+            print_debug_info(j, job_dir, archive_dir)
+            continue
 
         print("{job} {status} {owner} {desc} {duration}s".format(
             job=j,
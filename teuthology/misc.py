@@ -3,6 +3,7 @@ Miscellaneous teuthology functions.
 Used by other modules, but mostly called from tasks.
 """
 import argparse
+import gevent
 import os
 import logging
 import configobj
@@ -902,6 +903,12 @@ def reboot(node, timeout=300, interval=30):
             host=node.hostname, time=timeout))
 
 
+# How long probing a remote for its SSH banner may take
+RECONNECT_PROBE_TIMEOUT = 5
+# The longest a remote being waited for goes without being probed
+RECONNECT_MAX_INTERVAL = 10
+
+
 def reconnect(ctx, timeout, remotes=None):
     """
     Connect to all the machines in ctx.cluster.
@@ -915,29 +922,92 @@ def reconnect(ctx, timeout, remotes=None):
     holding the ssh keys for each of them. As long as it
     contains this data, you can construct a context
     that is a subset of your full cluster.
+
+    The machines are all waited for at the same time; see
+    wait_for_remotes().
+
+    :returns: A dict mapping the names of the machines to how many seconds
+              they took to come back
     """
     log.info('Re-opening connections...')
-    starttime = time.time()
-
     if remotes:
-        need_reconnect = remotes
+        need_reconnect = list(remotes)
     else:
         need_reconnect = list(ctx.cluster.remotes.keys())
+    return wait_for_remotes(need_reconnect, timeout)
+
+
+def wait_for_remotes(remotes, timeout, interval=1,
+                     max_interval=RECONNECT_MAX_INTERVAL):
+    """
+    Wait for remotes to accept SSH connections, and reconnect to them.
+
+    Every remote is waited for concurrently, so that the slowest one does
+    not hold up the others. A remote is probed by reading its SSH banner,
+    which is cheap and quick to fail, and only reconnected to once it
+    answers. The time between the probes of a remote starts at interval
+    seconds and doubles, up to max_interval, each time it fails.
 
-    while need_reconnect:
-        for remote in need_reconnect:
+    :param timeout: How many seconds to wait for the remotes
+    :returns:       A dict mapping the names of the remotes to how many
+                    seconds they took to come back
+    :raises:        RuntimeError if some of the remotes did not come back in
+                    time
+    """
+    start = time.time()
+    deadline = start + timeout
+    greenlets = [
+        gevent.spawn(_wait_for_remote, remote, deadline, interval,
+                     max_interval)
+        for remote in remotes
+    ]
+    gevent.joinall(greenlets)
+    returned = dict()
+    failed = list()
+    for remote, greenlet in zip(remotes, greenlets):
+        if greenlet.exception is not None:
+            log.error('Error waiting for %s', remote.name,
+                      exc_info=greenlet.exc_info)
+        if greenlet.value is None:
+            failed.append(remote.name)
+        else:
+            returned[remote.name] = greenlet.value - start
+            log.info('%s came back after %.1fs', remote.name,
+                     returned[remote.name])
+    log.debug('waited {elapsed}'.format(elapsed=str(time.time() - start)))
+    if failed:
+        raise RuntimeError("Could not reconnect to %s" % ', '.join(failed))
+    return returned
+
+
+def _wait_for_remote(remote, deadline, interval, max_interval):
+    """
+    :returns: When remote was reconnected to, or None if it was not by
+              deadline
+    """
+    while True:
+        probe_timeout = max(
+            min(RECONNECT_PROBE_TIMEOUT, deadline - time.time()), 1)
+        if ssh_banner_reachable(remote.hostname, timeout=probe_timeout):
             log.info('trying to connect to %s', remote.name)
-            success = remote.reconnect()
-            if not success:
-                if time.time() - starttime > timeout:
-                    raise RuntimeError("Could not reconnect to %s" %
-                                       remote.name)
-            else:
-                need_reconnect.remove(remote)
+            if remote.reconnect(socket_timeout=RECONNECT_PROBE_TIMEOUT):
+                return time.time()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
 
-        log.debug('waited {elapsed}'.format(
-            elapsed=str(time.time() - starttime)))
-        time.sleep(1)
+
+def ssh_banner_reachable(hostname, port=22, timeout=RECONNECT_PROBE_TIMEOUT):
+    """
+    :returns: Whether an SSH server greets us on hostname:port
+    """
+    try:
+        with socket.create_connection((hostname, port), timeout) as sock:
+            return sock.recv(256).startswith(b'SSH-')
+    except (OSError, socket.timeout):
+        return False
 
 
 def get_clients(ctx, roles):
@@ -1080,12 +1150,24 @@ def get_valgrind_args(testdir, name, preamble, v, exit_on_first_error=True):
     return args
 
 
-def ssh_keyscan(hostnames, _raise=True):
+# How many hosts a single ssh-keyscan invocation scans (concurrently)
+KEYSCAN_BATCH_SIZE = 100
+# How long a scanned host key is reused for, by default
+KEYSCAN_CACHE_TTL = 30
+# hostname -> (host key, when it was scanned)
+_host_keys = dict()
+
+
+def ssh_keyscan(hostnames, _raise=True, max_age=KEYSCAN_CACHE_TTL):
     """
     Fetch the SSH public key of one or more hosts
 
+    All the hosts are scanned at once, and only the ones whose key could
+    not be fetched are tried again.
+
     :param hostnames: A list of hostnames, or a dict keyed by hostname
     :param _raise: Whether to raise an exception if not all keys are retrieved
+    :param max_age: Reuse keys scanned less than this many seconds ago
     :returns: A dict keyed by hostname, with the host keys as values
     """
     if not isinstance(hostnames, list) and not isinstance(hostnames, dict):
@@ -1093,20 +1175,26 @@ def ssh_keyscan(hostnames, _raise=True):
     hostnames = [canonicalize_hostname(name, user=None) for name in
                  hostnames]
     keys_dict = dict()
+    now = time.time()
     for hostname in hostnames:
-        with safe_while(
-            sleep=1,
-            tries=5 if _raise else 1,
-            _raise=_raise,
-            action="ssh_keyscan " + hostname,
-        ) as proceed:
-            while proceed():
-                key = _ssh_keyscan(hostname)
-                if key:
-                    keys_dict[hostname] = key
-                    break
-    if len(keys_dict) != len(hostnames):
-        missing = set(hostnames) - set(keys_dict.keys())
+        cached = _host_keys.get(hostname)
+        if cached is not None and now - cached[1] < max_age:
+            keys_dict[hostname] = cached[0]
+    missing = [name for name in hostnames if name not in keys_dict]
+    with safe_while(
+        sleep=1,
+        tries=5 if _raise else 1,
+        _raise=False,
+        action="ssh_keyscan " + ' '.join(missing),
+    ) as proceed:
+        while missing and proceed():
+            found = _ssh_keyscan(missing)
+            scanned = time.time()
+            for hostname, key in found.items():
+                _host_keys[hostname] = (key, scanned)
+            keys_dict.update(found)
+            missing = [name for name in missing if name not in keys_dict]
+    if missing:
         msg = "Unable to scan these host keys: %s" % ' '.join(missing)
         if not _raise:
             log.warning(msg)
@@ -1115,28 +1203,44 @@ def ssh_keyscan(hostnames, _raise=True):
     return keys_dict
 
 
-def _ssh_keyscan(hostname):
+def forget_host_keys(hostnames):
+    """
+    Make ssh_keyscan() scan hosts again, e.g. because they were recreated
+    """
+    for hostname in hostnames:
+        _host_keys.pop(canonicalize_hostname(hostname, user=None), None)
+
+
+def _ssh_keyscan(hostnames):
     """
     Fetch the SSH public key of one or more hosts
 
-    :param hostname: The hostname
-    :returns: The host key
+    :param hostnames: The hostnames
+    :returns: A dict keyed by hostname, with the host keys of the hosts
+              which could be scanned as values
     """
-    args = ['ssh-keyscan', '-T', '1', '-t', 'rsa', hostname]
-    p = subprocess.Popen(
-        args=args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    p.wait()
-    for line in p.stderr:
-        line = line.decode()
-        line = line.strip()
-        if line and not line.startswith('#'):
-            log.error(line)
-    for line in p.stdout:
-        host, key = line.strip().decode().split(' ', 1)
-        return key
+    keys_dict = dict()
+    for i in range(0, len(hostnames), KEYSCAN_BATCH_SIZE):
+        batch = hostnames[i:i + KEYSCAN_BATCH_SIZE]
+        args = ['ssh-keyscan', '-T', '1', '-t', 'rsa'] + batch
+        p = subprocess.Popen(
+            args=args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        out, err = p.communicate()
+        for line in err.decode().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                log.error(line)
+        for line in out.decode().splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            host, key = line.split(' ', 1)
+            if host in batch:
+                keys_dict.setdefault(host, key)
+    return keys_dict
 
 
 def ssh_keyscan_wait(hostname):
@@ -1149,7 +1253,7 @@ def ssh_keyscan_wait(hostname):
                     action="ssh_keyscan_wait " + hostname) as proceed:
         success = False
         while proceed():
-            key = _ssh_keyscan(hostname)
+            key = _ssh_keyscan([hostname]).get(hostname)
             if key:
                 success = True
                 break
@@ -11,16 +11,10 @@ import teuthology
 from teuthology import provision
 from teuthology.lock.ops import unlock_one
 from teuthology.lock.query import is_vm, list_locks, \
-    find_stale_locks, get_status
+    find_stale_locks, get_status, get_statuses
 from teuthology.lock.util import locked_since_seconds
-from teuthology.nuke.actions import (
-    check_console, clear_firewall, shutdown_daemons, remove_installed_packages,
-    reboot, remove_osd_mounts, remove_osd_tmpfs, kill_hadoop,
-    remove_ceph_packages, synch_clocks, unlock_firmware_repo,
-    remove_configuration_files, undo_multipath, reset_syslog_dir,
-    remove_ceph_data, remove_testing_tree, remove_yum_timedhosts,
-    kill_valgrind,
-)
+from teuthology.nuke import cleanup
+from teuthology.nuke.actions import check_console, reboot
 from teuthology.config import config, FakeNamespace
 from teuthology.misc import (
     canonicalize_hostname, config_file, decanonicalize_hostname, merge_configs,
@@ -243,6 +237,7 @@ def nuke(ctx, should_unlock, sync_clocks=True, noipmi=False, keep_logs=False, sh
     if ctx.name:
         log.info('Checking targets against current locks')
         locks = list_locks()
+        statuses = {lock['name']: lock for lock in locks}
         # Remove targets who's description doesn't match archive name.
         for lock in locks:
             for target in targets:
@@ -257,6 +252,8 @@ def nuke(ctx, should_unlock, sync_clocks=True, noipmi=False, keep_logs=False, sh
                         log.info(
                             "Not nuking %s because it is down",
                             lock['name'])
+    else:
+        statuses = get_statuses(list(targets), keyed_by_name=True)
     with parallel() as p:
         for target, hostkey in ctx.config['targets'].items():
             p.spawn(
@@ -269,6 +266,7 @@ def nuke(ctx, should_unlock, sync_clocks=True, noipmi=False, keep_logs=False, sh
                 noipmi,
                 keep_logs,
                 should_reboot,
+                statuses.get(canonicalize_hostname(target, user=None)),
             )
         for unnuked in p:
             if unnuked:
@@ -282,7 +280,7 @@ def nuke(ctx, should_unlock, sync_clocks=True, noipmi=False, keep_logs=False, sh
 
 
 def nuke_one(ctx, target, should_unlock, synch_clocks,
-             check_locks, noipmi, keep_logs, should_reboot):
+             check_locks, noipmi, keep_logs, should_reboot, status=None):
     ret = None
     ctx = argparse.Namespace(
         config=dict(targets=target),
@@ -292,6 +290,7 @@ def nuke_one(ctx, target, should_unlock, synch_clocks,
         teuthology_config=config.to_dict(),
         name=ctx.name,
         noipmi=noipmi,
+        status=status,
     )
     try:
         nuke_helper(ctx, should_unlock, keep_logs, should_reboot)
@@ -310,8 +309,12 @@ def nuke_helper(ctx, should_unlock, keep_logs, should_reboot):
     (target,) = ctx.config['targets'].keys()
     host = target.split('@')[-1]
     shortname = host.split('.')[0]
+    # the node's status as looked up for all the targets at once
+    status = getattr(ctx, 'status', None)
+    if status is None:
+        status = get_status(host)
     if should_unlock:
-        if is_vm(shortname):
+        if is_vm(status=status):
             return
     log.debug('shortname: %s' % shortname)
     remote = Remote(host)
@@ -319,7 +322,6 @@ def nuke_helper(ctx, should_unlock, keep_logs, should_reboot):
         # does not check to ensure if the node is 'up'
         # we want to be able to nuke a downed node
         check_lock.check_lock(ctx, None, check_up=False)
-    status = get_status(host)
     if status['machine_type'] in provision.fog.get_types():
         remote.console.power_off()
         return
@@ -343,29 +345,11 @@ def nuke_helper(ctx, should_unlock, keep_logs, should_reboot):
             remote.connect()
     add_remotes(ctx, None)
     connect(ctx, None)
-    clear_firewall(ctx)
-    shutdown_daemons(ctx)
-    kill_valgrind(ctx)
-    # Try to remove packages before reboot
-    remove_installed_packages(ctx)
     remotes = ctx.cluster.remotes.keys()
+    for remote in remotes:
+        cleanup.run_phase(ctx, remote, 'pre-reboot', keep_logs=keep_logs)
     if should_reboot:
         reboot(ctx, remotes)
-    # shutdown daemons again incase of startup
-    shutdown_daemons(ctx)
-    remove_osd_mounts(ctx)
-    remove_osd_tmpfs(ctx)
-    kill_hadoop(ctx)
-    remove_ceph_packages(ctx)
-    synch_clocks(remotes)
-    unlock_firmware_repo(ctx)
-    remove_configuration_files(ctx)
-    undo_multipath(ctx)
-    reset_syslog_dir(ctx)
-    remove_ceph_data(ctx)
-    if not keep_logs:
-        remove_testing_tree(ctx)
-    remove_yum_timedhosts(ctx)
-    # Once again remove packages after reboot
-    remove_installed_packages(ctx)
+    for remote in remotes:
+        cleanup.run_phase(ctx, remote, 'post-reboot', keep_logs=keep_logs)
     log.info('Installed packages removed.')
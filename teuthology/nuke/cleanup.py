@@ -0,0 +1,339 @@
+"""
+Clean up a target with one shell script per phase of nuking it, rather than
+with a separate SSH command for each cleanup step.
+
+Every step of a phase runs in the same SSH exec, as root, under its own
+timeout. The steps are idempotent, so that a phase can simply be run again
+if it was interrupted. The script reports the exit status and the start and
+end times of each step on its stdout, from which run_phase() builds a report
+of the phase.
+"""
+import logging
+import shlex
+import time
+
+from io import StringIO
+
+from teuthology.exceptions import CleanupError
+from teuthology.misc import get_testdir
+from teuthology.task import install as install_task
+
+log = logging.getLogger(__name__)
+
+PHASES = ('pre-reboot', 'post-reboot')
+
+# Marks the lines of the script's output that report on a step
+RESULT_MARKER = 'TEUTHOLOGY-CLEANUP-STEP'
+
+# Run by the script before any step
+PREAMBLE = """\
+export DEBIAN_FRONTEND=noninteractive
+run_step() {{
+    name=$1 limit=$2 body=$3
+    start=$(date +%s.%N)
+    timeout --kill-after=10 "$limit" bash -e -c "$body" 1>&2 </dev/null
+    status=$?
+    end=$(date +%s.%N)
+    echo "{marker} $name $status $start $end"
+}}
+""".format(marker=RESULT_MARKER)
+
+# Exit statuses of timeout(1) when a step timed out
+TIMEOUT_STATUSES = (124, 137)
+
+CEPH_PACKAGES = [
+    'ceph-common', 'ceph-mon', 'ceph-osd', 'libcephfs1', 'libcephfs2',
+    'librados2', 'librgw2', 'librbd1', 'python-rgw', 'ceph-selinux',
+    'python-cephfs', 'ceph-base', 'python-rbd', 'python-rados', 'ceph-mds',
+    'ceph-mgr', 'libcephfs-java', 'libcephfs-jni', 'ceph-deploy',
+    'libapache2-mod-fastcgi',
+]
+
+DAEMONS = [
+    'ceph-mon', 'ceph-osd', 'ceph-mds', 'ceph-mgr', 'ceph-fuse', 'ceph-disk',
+    'radosgw', 'ceph_test_rados', 'rados', 'rbd-fuse', 'apache2',
+]
+
+
+class Step(object):
+    """
+    A cleanup step
+
+    :param name:    The name of the step, as it appears in the report
+    :param body:    The shell commands of the step. They are run with
+                    'bash -e', so the step fails as soon as one of them does.
+    :param timeout: How many seconds the step may take
+    :param check:   Whether the phase fails if the step does
+    """
+    def __init__(self, name, body, timeout=60, check=True):
+        self.name = name
+        self.body = body
+        self.timeout = timeout
+        self.check = check
+
+    def __repr__(self):
+        return 'Step({name!r})'.format(name=self.name)
+
+
+def shutdown_daemons_steps():
+    unmount_fuse = """
+for fs in ceph-fuse rbd-fuse; do
+    grep "$fs" /etc/mtab | grep -o " /.* fuse" | grep -o "/.* " | \\
+        xargs -r -n 1 fusermount -u || true
+done
+"""
+    return [
+        Step('stop_daemons',
+             'stop ceph-all || service ceph stop || '
+             'systemctl stop ceph.target',
+             timeout=180, check=False),
+        Step('kill_daemons',
+             unmount_fuse + 'killall --quiet {daemons} || true'.format(
+                 daemons=' '.join(DAEMONS)),
+             timeout=120),
+    ]
+
+
+def remove_installed_packages_step(ctx, remote):
+    """
+    The equivalent of nuke.actions.remove_installed_packages() for remote
+
+    :returns: A Step, or None if remote is reimaged rather than cleaned up
+    """
+    if remote.is_reimageable:
+        return None
+    conf = dict(project='ceph', debuginfo='true')
+    packages = install_task.get_package_list(ctx, conf)
+    project = conf['project']
+    if remote.os.package_type == 'deb':
+        debs = packages['deb'] + [
+            'salt-common', 'salt-minion', 'calamari-server', 'python-rados',
+            'multipath-tools']
+        dpkg_options = ('-o Dpkg::Options::="--force-confdef" '
+                        '-o Dpkg::Options::="--force-confold"')
+        body = """
+for d in {debs}; do
+    apt-get -y --force-yes {options} purge $d || true
+done
+dpkg -l | grep '^.\\(U\\|H\\)R' | awk '{{print $2}}' | \\
+    xargs --no-run-if-empty dpkg -P --force-remove-reinstreq
+apt-get -y --force-yes {options} autoremove
+rm -f /etc/apt/sources.list.d/{project}.list
+apt-get update || true
+""".format(debs=' '.join(debs), options=dpkg_options, project=project)
+    elif remote.os.name in ['opensuse', 'sle']:
+        body = """
+zypper -n removerepo ceph-rpm-under-test || true
+"""
+    else:
+        body = """
+yum -y erase {project}-release || true
+mv -f /etc/yum/pluginconf.d/priorities.conf.orig \\
+    /etc/yum/pluginconf.d/priorities.conf || true
+yum clean expire-cache
+""".format(project=project)
+    return Step('remove_installed_packages', body, timeout=600)
+
+
+def remove_ceph_packages_step(remote):
+    """
+    The equivalent of nuke.actions.remove_ceph_packages() for remote
+    """
+    if remote.os.package_type == 'rpm':
+        body = """
+rm -f /etc/yum.repos.d/*ceph* /etc/yum.repos.d/*fcgi* \\
+    /etc/yum.repos.d/*samba* /etc/yum.repos.d/*nfs-ganesha*
+rpm --rebuilddb
+"""
+        if remote.os.name in ['opensuse', 'sle']:
+            body += "zypper clean\n"
+        else:
+            body += "yum clean all\n"
+    else:
+        body = """
+rm -f /etc/apt/sources.list.d/*ceph* /etc/apt/sources.list.d/*samba* \\
+    /etc/apt/sources.list.d/*nfs-ganesha*
+apt-get autoclean || true
+dpkg --remove --force-remove-reinstreq {pkgs} || true
+apt-get autoclean
+""".format(pkgs=' '.join(CEPH_PACKAGES))
+    return Step('remove_ceph_packages', body, timeout=600)
+
+
+def get_steps(ctx, remote, phase, keep_logs=False):
+    """
+    :returns: The list of steps of phase for remote, in the order they are
+              run in
+    """
+    if phase not in PHASES:
+        raise ValueError("Unknown nuke phase: %s" % phase)
+    remove_packages = [remove_installed_packages_step(ctx, remote)]
+    if remote.os.package_type == 'deb':
+        remove_packages.insert(0, Step(
+            'dpkg_configure',
+            'dpkg --configure -a ; apt-get -y --force-yes -f install || :',
+            timeout=180, check=False))
+    if phase == 'pre-reboot':
+        steps = [
+            Step('clear_firewall',
+                 'iptables-save | grep -v teuthology | iptables-restore'),
+        ]
+        steps.extend(shutdown_daemons_steps())
+        steps.append(
+            Step('kill_valgrind', 'pkill -f -9 valgrind.bin',
+                 timeout=20, check=False))
+        steps.extend(remove_packages)
+        return [step for step in steps if step is not None]
+
+    # shutdown daemons again in case of startup
+    steps = shutdown_daemons_steps()
+    steps.extend([
+        Step('remove_osd_mounts',
+             "grep /var/lib/ceph/osd/ /etc/mtab | awk '{print $2}' | "
+             "xargs -r umount -l || true",
+             timeout=120),
+        Step('remove_osd_tmpfs',
+             "egrep 'tmpfs\\s+/mnt' /etc/mtab | awk '{print $2}' | "
+             "xargs -r umount || true",
+             timeout=120),
+        Step('kill_hadoop', 'pkill -f -KILL "java.*hadoop"',
+             check=False),
+        remove_ceph_packages_step(remote),
+        Step('synch_clocks', """
+{ systemctl stop ntp.service || systemctl stop ntpd.service || \\
+      systemctl stop chronyd.service ; } &&
+{ ntpdate-debian || ntp -gq || ntpd -gq || chronyc sources ; } &&
+hwclock --systohc --utc &&
+{ systemctl start ntp.service || systemctl start ntpd.service || \\
+      systemctl start chronyd.service ; } || true
+"""),
+        Step('unlock_firmware_repo',
+             'rm -f /lib/firmware/updates/.git/index.lock'),
+        Step('remove_configuration_files',
+             'rm -f /home/ubuntu/.cephdeploy.conf', timeout=30),
+        Step('undo_multipath', 'multipath -F', check=False),
+        Step('reset_syslog_dir', """
+if test -e /etc/rsyslog.d/80-cephtest.conf; then
+    rm -f -- /etc/rsyslog.d/80-cephtest.conf
+    service rsyslog restart
+fi
+"""),
+        Step('remove_ceph_data', 'rm -rf /etc/ceph /var/run/ceph*'),
+    ])
+    if not keep_logs:
+        steps.append(Step(
+            'remove_testing_tree',
+            'rm -rf {testdir} /tmp/cephtest /home/ubuntu/cephtest'.format(
+                testdir=shlex.quote(get_testdir(ctx)))))
+    if remote.os.package_type == 'rpm':
+        steps.append(Step(
+            'remove_yum_timedhosts',
+            "find /var/cache/yum -name 'timedhosts' -exec rm {} \\;",
+            timeout=180, check=False))
+    # once again remove packages after reboot
+    steps.extend(remove_packages)
+    return [step for step in steps if step is not None]
+
+
+def build_script(steps):
+    """
+    :returns: A bash script running each of steps in turn
+    """
+    lines = [PREAMBLE]
+    for step in steps:
+        lines.append('run_step {name} {timeout} {body}'.format(
+            name=step.name,
+            timeout=int(step.timeout),
+            body=shlex.quote(step.body.strip()),
+        ))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_results(steps, phase, output):
+    """
+    Build the report of a phase from the output of its script. Steps the
+    script did not report on, e.g. because the connection was lost, are
+    reported as 'not run'.
+
+    :returns: A list of dicts, one per step, with the keys 'step', 'phase',
+              'status' ('ok', 'failed', 'timeout' or 'not run'),
+              'exitstatus', 'duration' and 'check'
+    """
+    results = dict()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) != 5 or fields[0] != RESULT_MARKER:
+            continue
+        name, exitstatus, start, end = fields[1:]
+        try:
+            results[name] = (int(exitstatus), float(end) - float(start))
+        except ValueError:
+            continue
+    report = list()
+    for step in steps:
+        exitstatus, duration = results.get(step.name, (None, None))
+        if exitstatus is None:
+            status = 'not run'
+        elif exitstatus == 0:
+            status = 'ok'
+        elif exitstatus in TIMEOUT_STATUSES:
+            status = 'timeout'
+        else:
+            status = 'failed'
+        report.append(dict(
+            step=step.name,
+            phase=phase,
+            status=status,
+            exitstatus=exitstatus,
+            duration=duration,
+            check=step.check,
+        ))
+    return report
+
+
+def run_phase(ctx, remote, phase, keep_logs=False):
+    """
+    Run the cleanup steps of phase on remote in a single SSH exec.
+
+    :returns: The report of the phase, as returned by parse_results()
+    :raises:  CleanupError if a step whose failure matters did not succeed
+    """
+    steps = get_steps(ctx, remote, phase, keep_logs=keep_logs)
+    log.info('Running the %s cleanup of %s: %s', phase, remote.shortname,
+             ', '.join(step.name for step in steps))
+    # every step times out by itself, so this only catches a hung connection
+    timeout = sum(step.timeout + 10 for step in steps)
+    start = time.time()
+    proc = remote.run(
+        args=['sudo', 'bash', '-s'],
+        stdin=build_script(steps),
+        stdout=StringIO(),
+        check_status=False,
+        timeout=timeout,
+    )
+    report = parse_results(steps, phase, proc.stdout.getvalue())
+    log_report(remote.shortname, phase, report, time.time() - start)
+    failures = [
+        result for result in report
+        if result['check'] and result['status'] != 'ok'
+    ]
+    if failures:
+        raise CleanupError(remote.shortname, failures)
+    return report
+
+
+def log_report(name, phase, report, duration):
+    for result in report:
+        if result['status'] == 'ok' or not result['check']:
+            log_func = log.debug
+        else:
+            log_func = log.warning
+        if result['duration'] is None:
+            log_func('%s: %s: %s', name, result['step'], result['status'])
+        else:
+            log_func('%s: %s: %s (exit status %s) in %.1fs', name,
+                     result['step'], result['status'], result['exitstatus'],
+                     result['duration'])
+    log.info('%s cleanup of %s took %.1fs; %d of %d steps succeeded',
+             phase, name, duration,
+             len([r for r in report if r['status'] == 'ok']), len(report))
@@ -4,6 +4,7 @@ Connection utilities
 import paramiko
 import os
 import logging
+import time
 
 from teuthology.config import config
 from teuthology.contextutil import safe_while
@@ -11,6 +12,9 @@ from paramiko.hostkeys import HostKeyEntry
 
 log = logging.getLogger(__name__)
 
+# Parsed ssh config files, keyed on their path; values are (mtime, SSHConfig)
+_ssh_configs = dict()
+
 
 def split_user(user_at_host):
     """
@@ -36,6 +40,26 @@ def create_key(keytype, key):
     return ke.key
 
 
+def get_ssh_config(path="~/.ssh/config"):
+    """
+    Return a parsed paramiko.SSHConfig for path, or None if it does not
+    exist. The file is only parsed again when it changes.
+    """
+    path = os.path.expanduser(path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _ssh_configs.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    ssh_config = paramiko.SSHConfig()
+    with open(path) as f:
+        ssh_config.parse(f)
+    _ssh_configs[path] = (mtime, ssh_config)
+    return ssh_config
+
+
 def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
             _SSHClient=None, _create_key=None, retry=True, key_filename=None):
     """
@@ -79,10 +103,8 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
         timeout=timeout
     )
 
-    ssh_config_path = os.path.expanduser("~/.ssh/config")
-    if os.path.exists(ssh_config_path):
-        ssh_config = paramiko.SSHConfig()
-        ssh_config.parse(open(ssh_config_path))
+    ssh_config = get_ssh_config()
+    if ssh_config is not None:
         opts = ssh_config.lookup(host)
         if not key_filename and 'identityfile' in opts:
             key_filename = opts['identityfile']
@@ -108,3 +130,156 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
                     log.error(f"Error authenticating with {host}: {str(e)}")
     ssh.get_transport().set_keepalive(keep_alive)
     return ssh
+
+
+class ConnectionPool(object):
+    """
+    A process-wide pool of SSH connections, keyed on user@host and host key,
+    so that everything in the process talking to the same host shares a
+    connection rather than paying for a handshake and authentication each
+    time.
+
+    A connection is handed out again as long as its transport is healthy
+    and fewer than max_channels channels registered with add_channel() are
+    open on it; otherwise another connection to the same host is opened
+    alongside it. Connections left
+    without any open channel for idle_timeout seconds are closed, unless
+    something holds them; see acquire() and release().
+    """
+    # sshd's default MaxSessions
+    max_channels = 10
+    idle_timeout = 600
+
+    def __init__(self):
+        # (user_at_host, host_key) -> [SSHClient, ...]
+        self._clients = dict()
+        # SSHClient -> the last time it was handed out
+        self._last_used = dict()
+        # SSHClient -> how many holders (e.g. Remotes) it has
+        self._holders = dict()
+        # SSHClient -> the channels opened on it, as far as we know
+        self._channels = dict()
+
+    def get(self, user_at_host, host_key=None, new=False, **kwargs):
+        """
+        Return a healthy connection to user_at_host with a free channel,
+        opening one if necessary.
+
+        :param user_at_host: user@host
+        :param host_key:     The host's ssh key
+        :param new:          Open a new connection even if there is one
+        :param kwargs:       Passed to connect() for new connections
+        """
+        self.reap()
+        key = (user_at_host, host_key)
+        clients = [c for c in self._clients.get(key, list())
+                   if self._check(c)]
+        self._clients[key] = clients
+        for client in clients:
+            if not new and self.has_free_channel(client):
+                break
+        else:
+            client = connect(user_at_host, host_key=host_key, **kwargs)
+            clients.append(client)
+        self._last_used[client] = time.time()
+        return client
+
+    def acquire(self, user_at_host, host_key=None, new=False, **kwargs):
+        """
+        Like get(), but the connection is held, and so never closed for being
+        idle, until release() is called for it
+        """
+        client = self.get(user_at_host, host_key=host_key, new=new, **kwargs)
+        self._holders[client] = self._holders.get(client, 0) + 1
+        return client
+
+    def release(self, client, close=False):
+        """
+        Let go of a connection returned by acquire()
+
+        :param close: Whether to close the connection if nothing else holds
+                      it, e.g. because it is broken. Connections which are
+                      not pooled are always closed.
+        """
+        holders = self._holders.get(client, 0) - 1
+        if holders > 0:
+            self._holders[client] = holders
+            return
+        self._holders.pop(client, None)
+        if close or not self.owns(client):
+            self.discard(client)
+
+    def holders(self, client):
+        return self._holders.get(client, 0)
+
+    def owns(self, client):
+        return client in self._last_used
+
+    def has_free_channel(self, client):
+        return self.open_channels(client) < self.max_channels
+
+    def add_channel(self, client, channel):
+        """
+        Count channel, a paramiko Channel opened on client, against its
+        max_channels until it is closed
+        """
+        if self.owns(client):
+            self._channels.setdefault(client, list()).append(channel)
+
+    def open_channels(self, client):
+        channels = [channel for channel in self._channels.get(client, [])
+                    if not channel.closed]
+        if channels:
+            self._channels[client] = channels
+        else:
+            self._channels.pop(client, None)
+        return len(channels)
+
+    def _check(self, client):
+        """
+        Whether client is still usable; if not, drop it from the pool
+        """
+        transport = client.get_transport()
+        healthy = transport is not None and transport.is_active()
+        if healthy:
+            try:
+                transport.send_ignore()
+            except Exception:
+                healthy = False
+        if not healthy:
+            self.discard(client)
+        return healthy
+
+    def discard(self, client):
+        """
+        Drop client from the pool and close it
+        """
+        self._last_used.pop(client, None)
+        self._holders.pop(client, None)
+        self._channels.pop(client, None)
+        for clients in self._clients.values():
+            if client in clients:
+                clients.remove(client)
+        try:
+            client.close()
+        except Exception:
+            log.debug('Failed to close %s', client, exc_info=True)
+
+    def reap(self):
+        """
+        Close the connections which have been idle for idle_timeout seconds
+        and which nothing holds
+        """
+        deadline = time.time() - self.idle_timeout
+        for client, last_used in list(self._last_used.items()):
+            if last_used < deadline and not self.holders(client) and \
+                    not self.open_channels(client):
+                log.debug('Closing idle connection %s', client)
+                self.discard(client)
+
+    def close_all(self):
+        for client in list(self._last_used):
+            self.discard(client)
+
+
+pool = ConnectionPool()
@@ -13,6 +13,7 @@ from teuthology import misc
 from teuthology.exceptions import CommandFailedError
 from teuthology.misc import host_shortname
 import errno
+import gevent
 import time
 import re
 import logging
@@ -354,7 +355,11 @@ class Remote(RemoteShell):
         if self._reimage_types is None:
             Remote._reimage_types = teuthology.provision.get_reimage_types()
 
-    def connect(self, timeout=None, create_key=None, context='connect'):
+    def connect(self, timeout=None, create_key=None, context='connect',
+                new=False):
+        """
+        :param new: Open a new connection, rather than share a pooled one
+        """
         args = dict(user_at_host=self.name, host_key=self._host_key,
                     keep_alive=self.keep_alive, _create_key=create_key)
         if context == 'reconnect':
@@ -367,8 +372,12 @@ class Remote(RemoteShell):
             args = dict(user_at_host=self.name, _create_key=False, host_key=None)
         if timeout:
             args['timeout'] = timeout
+        args['new'] = new
 
-        self.ssh = connection.connect(**args)
+        client = connection.pool.acquire(**args)
+        if self.ssh is not None:
+            connection.pool.release(self.ssh)
+        self.ssh = client
         return self.ssh
 
     def reconnect(self, timeout=None, socket_timeout=None, sleep_time=30):
@@ -377,7 +386,11 @@ class Remote(RemoteShell):
         for failure.
         """
         if self.ssh is not None:
-            self.ssh.close()
+            # the connection may still look healthy after a reboot, so it is
+            # closed, even though other Remotes may share it; they reconnect
+            # when they next run something
+            connection.pool.discard(self.ssh)
+            self.ssh = None
         if not timeout:
             return self._reconnect(timeout=socket_timeout)
         start_time = time.time()
@@ -396,7 +409,7 @@ class Remote(RemoteShell):
     def _reconnect(self, timeout=None):
         log.info(f"Trying to reconnect to host '{self.name}'")
         try:
-            self.connect(timeout=timeout, context='reconnect')
+            self.connect(timeout=timeout, context='reconnect', new=True)
             return self.is_online
         except Exception as e:
             log.debug(e)
@@ -426,6 +439,10 @@ class Remote(RemoteShell):
 
     def _set_iface_and_cidr(self):
         ip_addr_show = self.sh('PATH=/sbin:/usr/sbin ip addr show')
+        if not self._parse_ip_addr_show(ip_addr_show):
+            raise RuntimeError("Could not determine interface/CIDR!")
+
+    def _parse_ip_addr_show(self, ip_addr_show):
         regexp = 'inet.? %s' % self.ip_address
         for line in ip_addr_show.split('\n'):
             line = line.strip()
@@ -433,8 +450,57 @@ class Remote(RemoteShell):
                 items = line.split()
                 self._interface = items[-1]
                 self._cidr = str(netaddr.IPNetwork(items[1]).cidr)
-                return
-        raise RuntimeError("Could not determine interface/CIDR!")
+                return True
+        return False
+
+    # Prints what the os, arch, init_system, interface and cidr properties
+    # would otherwise each need a command of their own to find out
+    _facts_script = """
+echo '{sep} os-release'
+if test -f /etc/os-release; then
+    cat /etc/os-release
+else
+    echo '{sep} lsb-release'
+    lsb_release -a 2>/dev/null
+fi
+echo '{sep} arch'
+uname -m
+echo '{sep} init'
+which systemctl > /dev/null 2>&1 && echo systemd
+echo '{sep} ip'
+PATH=/sbin:/usr/sbin ip addr show
+true
+""".format(sep='#teuthology-facts#')
+
+    def gather_facts(self):
+        """
+        Find out the remote's OS, architecture, init system and the
+        interface and network of its SSH connection, all with a single
+        command, so that the corresponding properties don't need to run one
+        each.
+        """
+        sections = dict()
+        name = None
+        for line in self.sh(self._facts_script).split('\n'):
+            if line.startswith('#teuthology-facts# '):
+                name = line.split(' ', 1)[1]
+                sections[name] = list()
+            elif name is not None:
+                sections[name].append(line)
+        sections = dict(
+            (name, '\n'.join(lines).strip())
+            for (name, lines) in sections.items()
+        )
+        if sections.get('lsb-release'):
+            self._os = OS.from_lsb_release(sections['lsb-release'])
+        elif sections.get('os-release'):
+            self._os = OS.from_os_release(sections['os-release'])
+        if sections.get('arch'):
+            self._arch = sections['arch']
+        if 'init' in sections:
+            self._init_system = sections['init'] or None
+        if sections.get('ip'):
+            self._parse_ip_addr_show(sections['ip'])
 
     @property
     def hostname(self):
@@ -506,7 +572,29 @@ class Remote(RemoteShell):
            not self.ssh.get_transport() or \
            not self.ssh.get_transport().is_active():
             self.reconnect()
-        r = self._runner(client=self.ssh, name=self.shortname, **kwargs)
+        client = self.ssh
+        overflow = connection.pool.owns(client) and \
+            not connection.pool.has_free_channel(client)
+        if overflow:
+            # don't exceed the channels the server allows per connection
+            client = connection.pool.acquire(
+                self.name, host_key=self._host_key,
+                keep_alive=self.keep_alive)
+        try:
+            r = self._runner(client=client, name=self.shortname, **kwargs)
+        except Exception:
+            if overflow:
+                connection.pool.release(client)
+            raise
+        if connection.pool.owns(client):
+            connection.pool.add_channel(client, r.channel)
+        if overflow:
+            if kwargs.get('wait', True):
+                connection.pool.release(client)
+            else:
+                # hold the connection until the command has exited
+                waiter = gevent.spawn(r.channel.recv_exit_status)
+                waiter.link(lambda _: connection.pool.release(client))
         r.remote = self
         return r
 
@@ -706,8 +794,10 @@ class Remote(RemoteShell):
         return self._init_system
 
     def __del__(self):
+        # pooled connections may be shared with other Remotes, so they are
+        # left for the pool to close once nothing holds them
         if self.ssh is not None:
-            self.ssh.close()
+            connection.pool.release(self.ssh)
 
 
 def getRemoteConsole(name, ipmiuser=None, ipmipass=None, ipmidomain=None,
@@ -2,9 +2,11 @@
 Paramiko run support
 """
 
+import codecs
 import io
+import time
 
-from paramiko import ChannelFile
+from paramiko import ChannelFile, ChannelStderrFile
 
 import gevent
 import gevent.event
@@ -13,12 +15,15 @@ import pipes
 import logging
 import shutil
 
-from teuthology.contextutil import safe_while
 from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
-                                   ConnectionLostError)
+                                   ConnectionLostError, MaxWhileTries)
+from teuthology.trace import NULL_SPAN, tracer
 
 log = logging.getLogger(__name__)
 
+# How much of a command's output copy_to_log() reads at once
+COPY_CHUNK_SIZE = 64 * 1024
+
 
 class RemoteProcess(object):
     """
@@ -29,7 +34,7 @@ class RemoteProcess(object):
         'stdin', 'stdout', 'stderr',
         '_stdin_buf', '_stdout_buf', '_stderr_buf',
         'returncode', 'exitstatus', 'timeout',
-        'greenlets',
+        'greenlets', '_span',
         '_wait', 'logger',
         # for orchestra.remote.Remote to place a backreference
         'remote',
@@ -80,6 +85,7 @@ class RemoteProcess(object):
             (self.hostname, port) = client.get_transport().getpeername()[0:2]
 
         self.greenlets = []
+        self._span = NULL_SPAN
         self.stdin, self.stdout, self.stderr = (None, None, None)
         self.returncode = self.exitstatus = None
         self._wait = wait
@@ -92,6 +98,9 @@ class RemoteProcess(object):
         for line in self.command.split('\n'):
             log.getChild(self.hostname).debug('%s> %s' % (self.label or '', line))
 
+        self._span = tracer.begin(
+            '{host}: {cmd}'.format(host=self.hostname, cmd=self.command),
+            'command', host=self.hostname, label=self.label)
         if hasattr(self, 'timeout'):
             (self._stdin_buf, self._stdout_buf, self._stderr_buf) = \
                 self.client.exec_command(self.command, timeout=self.timeout)
@@ -101,6 +110,13 @@ class RemoteProcess(object):
         (self.stdin, self.stdout, self.stderr) = \
             (self._stdin_buf, self._stdout_buf, self._stderr_buf)
 
+    @property
+    def channel(self):
+        """
+        The paramiko Channel the command runs in
+        """
+        return self._stdout_buf.channel
+
     def add_greenlet(self, greenlet):
         self.greenlets.append(greenlet)
 
@@ -114,7 +130,8 @@ class RemoteProcess(object):
             # FIXME: Is this actually true?
             raise RuntimeError(self.deadlock_warning % 'stdin')
 
-    def setup_output_stream(self, stream_obj, stream_name, quiet=False):
+    def setup_output_stream(self, stream_obj, stream_name, quiet=False,
+                            log_rate=None, log_sample=None):
         if stream_obj is not PIPE:
             # Log the stream
             host_log = self.logger.getChild(self.hostname)
@@ -126,6 +143,8 @@ class RemoteProcess(object):
                     stream_log,
                     stream_obj,
                     quiet,
+                    log_rate,
+                    log_sample,
                 )
             )
             setattr(self, stream_name, stream_obj)
@@ -191,6 +210,8 @@ class RemoteProcess(object):
         """
         status = self._stdout_buf.channel.recv_exit_status()
         self.exitstatus = self.returncode = status
+        self._span.finish(status='ok' if status == 0 else 'failed',
+                          exitstatus=status)
         if status == -1:
             status = None
         return status
@@ -203,6 +224,16 @@ class RemoteProcess(object):
             self._get_exitstatus()
         return ready
 
+    def _wait_exited(self):
+        """
+        Wait for the remote process to exit and its output to be copied
+
+        :returns: self
+        """
+        self._get_exitstatus()
+        gevent.joinall(self.greenlets, timeout=60)
+        return self
+
     def poll(self):
         """
         :returns: self.returncode if the process is finished; else None
@@ -259,9 +290,14 @@ def quote(args):
         return args
 
 
-def copy_to_log(f, logger, loglevel=logging.INFO, capture=None, quiet=False):
+def copy_to_log(f, logger, loglevel=logging.INFO, capture=None, quiet=False,
+                log_rate=None, log_sample=None, chunk_size=COPY_CHUNK_SIZE):
     """
-    Copy line by line from file in f to the log from logger
+    Copy from file in f to the log from logger, one record per line
+
+    The output is read in chunks of whatever is available, up to chunk_size
+    bytes, rather than line by line; each chunk is split into lines and
+    logged at once.
 
     :param f: source stream object
     :param logger: the destination logger object
@@ -269,32 +305,122 @@ def copy_to_log(f, logger, loglevel=logging.INFO, capture=None, quiet=False):
     :param capture: an optional stream object for data copy
     :param quiet: suppress `logger` usage if True, this is useful only
                   in combination with `capture`, defaults False
+    :param log_rate: log at most this many lines per second, and how many
+                     were left out in between
+    :param log_sample: only log every log_sample-th line
+    :param chunk_size: the most bytes to read at once
     """
-    # Work-around for http://tracker.ceph.com/issues/8313
-    if isinstance(f, ChannelFile):
-        f._flags += ChannelFile.FLAG_BINARY
-    for line in f:
-        if capture:
-            if isinstance(capture, io.StringIO):
-                if isinstance(line, str):
-                    capture.write(line)
-                else:
-                    capture.write(line.decode('utf-8', 'replace'))
-            elif isinstance(capture, io.BytesIO):
-                if isinstance(line, str):
-                    capture.write(line.encode())
-                else:
-                    capture.write(line)
-        line = line.rstrip()
-        # Second part of work-around for http://tracker.ceph.com/issues/8313
-        if quiet:
+    write = _capture_writer(capture)
+    if quiet or not logger.isEnabledFor(loglevel):
+        emit = None
+    else:
+        emit = _LogEmitter(logger, loglevel, log_rate, log_sample)
+    pending = b''
+    while True:
+        data = _read_chunk(f, chunk_size)
+        if not data:
+            break
+        if isinstance(data, str):
+            data = data.encode()
+        if write:
+            write(data)
+        if emit is None:
             continue
-        try:
-            if isinstance(line, bytes):
-                line = line.decode('utf-8', 'replace')
-            logger.log(loglevel, line)
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            logger.exception("Encountered unprintable line in command output")
+        end = data.rfind(b'\n')
+        if end == -1:
+            pending += data
+            continue
+        lines = (pending + data[:end]).decode('utf-8', 'replace').split('\n')
+        pending = data[end + 1:]
+        emit(lines)
+    if write:
+        write(b'', final=True)
+    if emit is not None:
+        emit([pending.decode('utf-8', 'replace')] if pending else [],
+             final=True)
+
+
+def _read_chunk(f, size):
+    """
+    Read up to size bytes from f, returning as soon as any are available
+    """
+    if isinstance(f, ChannelStderrFile):
+        return f.channel.recv_stderr(size)
+    if isinstance(f, ChannelFile):
+        # Reading from the file itself would wait for all size bytes. The
+        # file is not read from anywhere else, so nothing is left buffered
+        # in it.
+        return f.channel.recv(size)
+    read1 = getattr(f, 'read1', None)
+    if read1 is not None:
+        return read1(size)
+    return f.read(size)
+
+
+def _capture_writer(capture):
+    """
+    Return a function copying chunks of bytes to the capture stream, which
+    must be a StringIO or BytesIO to receive anything
+    """
+    if isinstance(capture, io.StringIO):
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+        def write(data, final=False):
+            capture.write(decoder.decode(data, final))
+        return write
+    elif isinstance(capture, io.BytesIO):
+        def write(data, final=False):
+            capture.write(data)
+        return write
+    return None
+
+
+class _LogEmitter(object):
+    """
+    Log lines of output as records of logger, skipping lines to stay under
+    the given rate (in lines per second) or to only log one line in sample
+    """
+    def __init__(self, logger, loglevel, rate=None, sample=None):
+        self.logger = logger
+        self.loglevel = loglevel
+        self.rate = rate
+        self.sample = sample
+        self.seen = 0
+        self.window = 0
+        self.logged = 0
+        self.skipped = 0
+
+    def __call__(self, lines, final=False):
+        if self.sample and self.sample > 1:
+            first = (-self.seen) % self.sample
+            self.seen += len(lines)
+            lines = lines[first::self.sample]
+        if self.rate:
+            now = int(time.monotonic())
+            if now != self.window:
+                self._report_skipped()
+                self.window = now
+                self.logged = 0
+            allowed = max(0, self.rate - self.logged)
+            self.skipped += max(0, len(lines) - allowed)
+            lines = lines[:allowed]
+            self.logged += len(lines)
+        for line in lines:
+            self._log(line.rstrip())
+        if final:
+            self._report_skipped()
+
+    def _report_skipped(self):
+        if self.skipped:
+            self._log('(%d lines not logged)' % self.skipped)
+            self.skipped = 0
+
+    def _log(self, msg):
+        # Calling handle() directly rather than log() avoids looking up
+        # the caller's frame for every line
+        logger = self.logger
+        logger.handle(logger.makeRecord(
+            logger.name, self.loglevel, '(unknown file)', 0, msg, None, None))
 
 
 def copy_and_close(src, fdst):
@@ -310,7 +436,8 @@ def copy_and_close(src, fdst):
     fdst.close()
 
 
-def copy_file_to(src, logger, stream=None, quiet=False):
+def copy_file_to(src, logger, stream=None, quiet=False, log_rate=None,
+                 log_sample=None):
     """
     Copy file
     :param src: file to be copied.
@@ -319,8 +446,11 @@ def copy_file_to(src, logger, stream=None, quiet=False):
                    a copy of src.
     :param quiet: disable logger usage if True, useful in combination
                   with `stream` parameter, defaults False.
+    :param log_rate: see copy_to_log()
+    :param log_sample: see copy_to_log()
     """
-    copy_to_log(src, logger, capture=stream, quiet=quiet)
+    copy_to_log(src, logger, capture=stream, quiet=quiet, log_rate=log_rate,
+                log_sample=log_sample)
 
 def spawn_asyncresult(fn, *args, **kwargs):
     """
@@ -394,6 +524,8 @@ def run(
     quiet=False,
     timeout=None,
     cwd=None,
+    log_rate=None,
+    log_sample=None,
     # omit_sudo is used by vstart_runner.py
     omit_sudo=False
 ):
@@ -429,6 +561,10 @@ def run(
     :param timeout: timeout value for args to complete on remote channel of
                     paramiko
     :param cwd: Directory in which the command should be executed.
+    :param log_rate: Log at most this many lines of stdout and stderr per
+                     second each, defaults to no limit.
+    :param log_sample: Only log every log_sample-th line of stdout and
+                       stderr, defaults to every line.
     """
     try:
         transport = client.get_transport()
@@ -449,8 +585,8 @@ def run(
                       cwd=cwd)
     r.execute()
     r.setup_stdin(stdin)
-    r.setup_output_stream(stderr, 'stderr', quiet)
-    r.setup_output_stream(stdout, 'stdout', quiet)
+    r.setup_output_stream(stderr, 'stderr', quiet, log_rate, log_sample)
+    r.setup_output_stream(stdout, 'stdout', quiet, log_rate, log_sample)
     if wait:
         r.wait()
     return r
@@ -462,18 +598,69 @@ def wait(processes, timeout=None):
 
     Raise if any one of them fails.
 
-    Optionally, timeout after 'timeout' seconds.
+    Optionally, timeout after 'timeout' seconds, raising MaxWhileTries.
     """
     if timeout:
         log.info("waiting for %d", timeout)
     if timeout and timeout > 0:
-        with safe_while(tries=(timeout // 6)) as check_time:
-            not_ready = list(processes)
-            while len(not_ready) > 0:
-                check_time()
-                for proc in list(not_ready):
-                    if proc.finished:
-                        not_ready.remove(proc)
+        for proc in as_completed(processes, timeout=timeout):
+            pass
 
     for proc in processes:
         proc.wait()
+
+
+def _spawn_waiters(processes):
+    """
+    :returns: A dict mapping a new greenlet running the _wait_exited() method
+              of each of processes to that process
+    """
+    return dict((gevent.spawn(proc._wait_exited), proc) for proc in processes)
+
+
+def as_completed(processes, timeout=None):
+    """
+    Yield processes as they exit, so that the result of each can be dealt
+    with as soon as it is available. Their exit status is not checked; call
+    their wait() method for that.
+
+    The greenlets waiting for the processes which have not exited are killed
+    on timeout, or if the caller stops iterating early.
+
+    :param timeout: How many seconds to wait for all the processes to exit
+    :raises:        MaxWhileTries if they have not all exited in time
+    """
+    processes = list(processes)
+    pending = _spawn_waiters(processes)
+    try:
+        for greenlet in gevent.iwait(list(pending), timeout=timeout):
+            yield pending.pop(greenlet)
+        if pending:
+            raise MaxWhileTries(
+                "%d of %d processes did not exit within %ss" % (
+                    len(pending), len(processes), timeout))
+    finally:
+        gevent.killall(list(pending))
+
+
+def wait_any(processes, timeout=None):
+    """
+    Wait for the first of processes to exit. The greenlets waiting for the
+    others are killed before returning.
+
+    :returns: That process, or None if there were no processes
+    :raises:  MaxWhileTries if none of them exited within timeout seconds
+    """
+    processes = list(processes)
+    if not processes:
+        return None
+    waiters = _spawn_waiters(processes)
+    try:
+        finished = gevent.wait(list(waiters), timeout=timeout, count=1)
+    finally:
+        gevent.killall(list(waiters))
+    if not finished:
+        raise MaxWhileTries(
+            "None of %d processes exited within %ss" % (
+                len(processes), timeout))
+    return waiters[finished[0]]
@@ -1,3 +1,6 @@
+import os
+import time
+
 from mock import patch, Mock
 
 from teuthology import config
@@ -45,6 +48,21 @@ class TestConnection(object):
         e = assert_raises(AssertionError, connection.split_user, s)
         assert str(e) == 'Bad input to split_user: {s!r}'.format(s=s)
 
+    def test_get_ssh_config(self, tmpdir):
+        path = tmpdir.join('config')
+        assert connection.get_ssh_config(str(path)) is None
+        path.write('Host foo\n    IdentityFile ~/.ssh/foo\n')
+        ssh_config = connection.get_ssh_config(str(path))
+        assert ssh_config.lookup('foo')['identityfile'] == \
+            [os.path.expanduser('~/.ssh/foo')]
+        # parsed only once
+        assert connection.get_ssh_config(str(path)) is ssh_config
+        path.write('Host foo\n    IdentityFile ~/.ssh/bar\n')
+        path.setmtime(path.mtime() + 1)
+        ssh_config = connection.get_ssh_config(str(path))
+        assert ssh_config.lookup('foo')['identityfile'] == \
+            [os.path.expanduser('~/.ssh/bar')]
+
     def test_connect(self):
         self.clear_config()
         config.config.verify_host_keys = True
@@ -117,3 +135,114 @@ class TestConnection(object):
         )
         m_transport.set_keepalive.assert_called_once_with(False)
         assert got is m_ssh_instance
+
+
+class TestConnectionPool(object):
+    def setup(self):
+        self.pool = connection.ConnectionPool()
+        self.patcher_connect = patch(
+            'teuthology.orchestra.connection.connect',
+            side_effect=self.make_client,
+        )
+        self.m_connect = self.patcher_connect.start()
+
+    def teardown(self):
+        self.patcher_connect.stop()
+
+    def make_client(self, *args, **kwargs):
+        client = Mock()
+        transport = client.get_transport.return_value
+        transport.is_active.return_value = True
+        return client
+
+    def test_get_reuses(self):
+        client = self.pool.get('jdoe@host1', host_key='key')
+        assert self.pool.owns(client)
+        assert self.pool.get('jdoe@host1', host_key='key') is client
+        assert self.pool.get('jdoe@host2', host_key='key') is not client
+        assert self.pool.get('jdoe@host1', host_key=None) is not client
+        assert self.m_connect.call_count == 3
+
+    def test_get_channel_limit(self):
+        client = self.pool.get('jdoe@host1')
+        channels = [Mock(closed=False) for i in range(self.pool.max_channels)]
+        for channel in channels:
+            self.pool.add_channel(client, channel)
+        assert not self.pool.has_free_channel(client)
+        overflow = self.pool.get('jdoe@host1')
+        assert overflow is not client
+        channels[0].closed = True
+        assert self.pool.open_channels(client) == self.pool.max_channels - 1
+        assert self.pool.get('jdoe@host1') is client
+
+    def test_get_new(self):
+        client = self.pool.get('jdoe@host1')
+        assert self.pool.get('jdoe@host1', new=True) is not client
+        assert self.m_connect.call_count == 2
+
+    def test_get_unhealthy(self):
+        client = self.pool.get('jdoe@host1')
+        client.get_transport.return_value.is_active.return_value = False
+        assert self.pool.get('jdoe@host1') is not client
+        client.close.assert_called_once_with()
+        assert not self.pool.owns(client)
+
+        client = self.pool.get('jdoe@host1')
+        client.get_transport.return_value.send_ignore.side_effect = \
+            EOFError()
+        assert self.pool.get('jdoe@host1') is not client
+        assert not self.pool.owns(client)
+
+    def test_reap(self):
+        idle = self.pool.get('jdoe@host1')
+        busy = self.pool.get('jdoe@host2')
+        self.pool.add_channel(busy, Mock(closed=False))
+        recent = self.pool.get('jdoe@host3')
+        then = time.time() - self.pool.idle_timeout - 1
+        self.pool._last_used[idle] = self.pool._last_used[busy] = then
+        self.pool.reap()
+        idle.close.assert_called_once_with()
+        assert not self.pool.owns(idle)
+        assert self.pool.owns(busy)
+        assert self.pool.owns(recent)
+
+    def test_reap_held(self):
+        held = self.pool.acquire('jdoe@host1')
+        self.pool._last_used[held] = \
+            time.time() - self.pool.idle_timeout - 1
+        self.pool.reap()
+        assert self.pool.owns(held)
+        assert not held.close.called
+        self.pool.release(held)
+        self.pool.reap()
+        assert not self.pool.owns(held)
+
+    def test_acquire_release(self):
+        client = self.pool.acquire('jdoe@host1')
+        assert self.pool.acquire('jdoe@host1') is client
+        assert self.pool.holders(client) == 2
+        self.pool.release(client, close=True)
+        assert not client.close.called
+        assert self.pool.holders(client) == 1
+        self.pool.release(client, close=True)
+        client.close.assert_called_once_with()
+        assert not self.pool.owns(client)
+
+    def test_release_keeps_unheld(self):
+        client = self.pool.acquire('jdoe@host1')
+        self.pool.release(client)
+        assert self.pool.owns(client)
+        assert not client.close.called
+        assert self.pool.get('jdoe@host1') is client
+
+    def test_release_unpooled(self):
+        client = Mock()
+        self.pool.release(client)
+        client.close.assert_called_once_with()
+
+    def test_close_all(self):
+        clients = [self.pool.get('jdoe@host%d' % i) for i in range(3)]
+        self.pool.close_all()
+        for client in clients:
+            client.close.assert_called_once_with()
+            assert not self.pool.owns(client)
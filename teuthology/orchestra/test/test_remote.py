@@ -1,7 +1,10 @@
+import gevent
+
 from mock import patch, Mock, MagicMock
 
 from io import BytesIO
 
+from teuthology.orchestra import connection
 from teuthology.orchestra import remote
 from teuthology.orchestra import opsys
 from teuthology.orchestra.run import RemoteProcess
@@ -43,6 +46,52 @@ class TestRemote(object):
         assert r.shortname == 'xyzzy'
         assert str(r) == 'jdoe@xyzzy.example.com'
 
+    def test_reconnect_shared(self):
+        pool = connection.ConnectionPool()
+        with patch.object(connection, 'pool', pool), \
+                patch.object(connection, 'connect') as m_connect:
+            m_connect.side_effect = lambda *args, **kwargs: MagicMock()
+            first = remote.Remote(name='jdoe@xyzzy.example.com')
+            second = remote.Remote(name='jdoe@xyzzy.example.com')
+            shared = first.connect()
+            assert second.connect() is shared
+            assert pool.holders(shared) == 2
+            with patch.object(remote.Remote, 'is_online', True):
+                assert first.reconnect()
+            # the connection may be dead even if it looks healthy, so it is
+            # closed, and a new one opened
+            shared.close.assert_called_once_with()
+            assert not pool.owns(shared)
+            assert first.ssh is not shared
+            assert m_connect.call_count == 2
+            assert pool.holders(first.ssh) == 1
+            first.__del__()
+            assert pool.holders(first.ssh) == 0
+
+    def test_run_overflow(self):
+        pool = connection.ConnectionPool()
+        with patch.object(connection, 'pool', pool), \
+                patch.object(connection, 'connect') as m_connect:
+            m_connect.side_effect = lambda *args, **kwargs: MagicMock()
+            rem = remote.Remote(name='jdoe@xyzzy.example.com')
+            full = rem.connect()
+            for i in range(pool.max_channels):
+                pool.add_channel(full, Mock(closed=False))
+            rem._runner = MagicMock()
+            rem.run(args=['true'])
+            client = rem._runner.call_args[1]['client']
+            assert client is not full
+            # the command has exited, so the connection is no longer held
+            assert pool.holders(client) == 0
+            assert pool.open_channels(client) == 0
+            rem._runner.return_value.channel.closed = False
+            rem.run(args=['true'], wait=False)
+            assert rem._runner.call_args[1]['client'] is client
+            assert pool.holders(client) == 1
+            assert pool.open_channels(client) == 1
+            gevent.sleep(0.01)
+            assert pool.holders(client) == 0
+
     def test_run(self):
         m_transport = MagicMock()
         m_transport.getpeername.return_value = ('name', 22)
@@ -121,6 +170,58 @@ class TestRemote(object):
         )
         assert r.arch == 'test_arch'
 
+    def test_gather_facts(self):
+        m_transport = MagicMock()
+        m_transport.getpeername.return_value = ('172.21.0.5', 22)
+        self.m_ssh.get_transport.return_value = m_transport
+        facts = '\n'.join([
+            '#teuthology-facts# os-release',
+            'NAME="Ubuntu"',
+            'ID=ubuntu',
+            'VERSION_ID="20.04"',
+            'VERSION_CODENAME=focal',
+            '#teuthology-facts# arch',
+            'x86_64',
+            '#teuthology-facts# init',
+            'systemd',
+            '#teuthology-facts# ip',
+            '2: eno1: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500',
+            '    inet 172.21.0.5/20 brd 172.21.15.255 scope global eno1',
+            '',
+        ])
+        r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        with patch.object(r, 'sh', return_value=facts) as m_sh:
+            r.gather_facts()
+            assert r.os.name == 'ubuntu'
+            assert r.os.version == '20.04'
+            assert r.arch == 'x86_64'
+            assert r.init_system == 'systemd'
+            assert r.interface == 'eno1'
+            assert r.cidr == '172.21.0.0/20'
+            m_sh.assert_called_once_with(r._facts_script)
+
+    def test_gather_facts_lsb_release(self):
+        facts = '\n'.join([
+            '#teuthology-facts# os-release',
+            '#teuthology-facts# lsb-release',
+            'Distributor ID: Ubuntu',
+            'Description:    Ubuntu 12.04.4 LTS',
+            'Release:        12.04',
+            'Codename:       precise',
+            '#teuthology-facts# arch',
+            'aarch64',
+            '#teuthology-facts# init',
+            '#teuthology-facts# ip',
+        ])
+        r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        with patch.object(r, 'sh', return_value=facts):
+            r.gather_facts()
+        assert r.os.name == 'ubuntu'
+        assert r.os.codename == 'precise'
+        assert r.arch == 'aarch64'
+        assert r._init_system is None
+        assert not hasattr(r, '_interface')
+
     def test_host_key(self):
         m_key = MagicMock()
         m_key.get_name.return_value = 'key_type'
@@ -1,14 +1,20 @@
-from io import BytesIO
+import logging
 
+from io import BytesIO, StringIO
+
+import gevent
+import gevent.event
 import paramiko
 import socket
+import time
 
 from mock import MagicMock, patch
 from pytest import raises
 
+from teuthology import trace
 from teuthology.orchestra import run
 from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
-                                   ConnectionLostError)
+                                   ConnectionLostError, MaxWhileTries)
 
 def set_buffer_contents(buf, contents):
     buf.seek(0)
@@ -133,6 +139,20 @@ class TestRun(object):
             )
         assert str(exc.value) == "Command failed on name with status 42: 'foo'"
 
+    def test_traced(self, tmp_path):
+        self.m_stdout_buf.channel.recv_exit_status.return_value = 42
+        path = str(tmp_path / 'trace.jsonl')
+        run.tracer.open(path)
+        try:
+            run.run(client=self.m_ssh, args=['foo'], check_status=False)
+        finally:
+            run.tracer.close()
+        (span,) = trace.read(path)
+        assert span['name'] == 'name: foo'
+        assert span['cat'] == 'command'
+        assert span['status'] == 'failed'
+        assert span['args']['exitstatus'] == 42
+
     def test_status_bad_nocheck(self):
         self.m_stdout_buf.channel.recv_exit_status.return_value = 42
         proc = run.run(
@@ -264,6 +284,164 @@ class TestRun(object):
         run.copy_and_close(b'', MagicMock())
 
 
+class TestCopyToLog(object):
+    def setup(self):
+        self.logger = logging.getLogger('test_copy_to_log')
+        self.logger.setLevel(logging.DEBUG)
+        self.records = []
+        self.logger.handle = self.records.append
+
+    def teardown(self):
+        del self.logger.handle
+
+    def messages(self):
+        return [record.getMessage() for record in self.records]
+
+    def test_lines(self):
+        data = 'foo\nb\u00e4r  \nbaz'.encode()
+        capture = BytesIO()
+        # split in the middle of a line, and of a character
+        run.copy_to_log(BytesIO(data), self.logger, capture=capture,
+                        chunk_size=6)
+        assert self.messages() == ['foo', 'b\u00e4r', 'baz']
+        assert self.records[0].levelno == logging.INFO
+        assert self.records[0].name == 'test_copy_to_log'
+        assert capture.getvalue() == data
+
+    def test_capture_text(self):
+        data = 'foo\nb\u00e4r\n'
+        capture = StringIO()
+        run.copy_to_log(BytesIO(data.encode()), self.logger, capture=capture,
+                        quiet=True, chunk_size=5)
+        assert capture.getvalue() == data
+        assert self.records == []
+
+    def test_disabled_level(self):
+        run.copy_to_log(BytesIO(b'foo\n'), self.logger,
+                        loglevel=logging.NOTSET + 1)
+        assert self.records == []
+
+    def test_log_sample(self):
+        data = ''.join('%d\n' % i for i in range(10)).encode()
+        run.copy_to_log(BytesIO(data), self.logger, log_sample=3,
+                        chunk_size=4)
+        assert self.messages() == ['0', '3', '6', '9']
+
+    def test_log_rate(self):
+        data = ''.join('%d\n' % i for i in range(10)).encode()
+        with patch('teuthology.orchestra.run.time.monotonic') as m_monotonic:
+            m_monotonic.side_effect = [1.0, 1.5, 2.0, 2.5, 2.9, 2.9]
+            run.copy_to_log(BytesIO(data), self.logger, log_rate=3,
+                            chunk_size=4)
+        assert self.messages() == [
+            '0', '1', '2', '(1 lines not logged)', '4', '5', '6',
+            '(3 lines not logged)']
+
+    def test_channel_file(self):
+        channel = MagicMock()
+        channel.recv.side_effect = [b'foo\nb', b'ar\n', b'baz', b'']
+        capture = BytesIO()
+        run.copy_to_log(paramiko.ChannelFile(channel), self.logger,
+                        capture=capture, chunk_size=1024)
+        assert self.messages() == ['foo', 'bar', 'baz']
+        assert capture.getvalue() == b'foo\nbar\nbaz'
+        channel.recv.assert_called_with(1024)
+        channel.recv_stderr.assert_not_called()
+
+    def test_channel_stderr_file(self):
+        channel = MagicMock()
+        channel.recv_stderr.side_effect = [b'oops\n', b'']
+        run.copy_to_log(paramiko.ChannelStderrFile(channel), self.logger)
+        assert self.messages() == ['oops']
+        channel.recv.assert_not_called()
+
+
+class TestWait(object):
+    def setup_method(self):
+        self.waiters = list()
+
+    def make_proc(self, hostname, status=0):
+        proc = run.RemoteProcess(MagicMock(), ['true'], hostname=hostname)
+        event = gevent.event.Event()
+        channel = MagicMock()
+
+        def recv_exit_status():
+            self.waiters.append(gevent.getcurrent())
+            event.wait()
+            return status
+        channel.recv_exit_status.side_effect = recv_exit_status
+        channel.exit_status_ready.side_effect = event.is_set
+        proc._stdout_buf = MagicMock(channel=channel)
+        return proc, event
+
+    def exit_later(self, event, delay):
+        gevent.spawn_later(delay, event.set)
+
+    def test_as_completed(self):
+        procs = dict()
+        for name, delay in (('slow', 0.2), ('fast', 0.01), ('medium', 0.1)):
+            proc, event = self.make_proc(name)
+            procs[name] = proc
+            self.exit_later(event, delay)
+        order = [proc.hostname for proc in run.as_completed(procs.values())]
+        assert order == ['fast', 'medium', 'slow']
+        assert all(proc.returncode == 0 for proc in procs.values())
+
+    def test_wait_any(self):
+        slow, _ = self.make_proc('slow')
+        fast, fast_event = self.make_proc('fast')
+        self.exit_later(fast_event, 0.01)
+        assert run.wait_any([slow, fast], timeout=5) is fast
+        with raises(MaxWhileTries):
+            run.wait_any([slow], timeout=0.05)
+        assert run.wait_any([]) is None
+
+    def test_wait_returns_promptly(self):
+        procs = list()
+        for delay in (0.01, 0.05):
+            proc, event = self.make_proc('host')
+            procs.append(proc)
+            self.exit_later(event, delay)
+        start = time.time()
+        run.wait(procs, timeout=10)
+        assert time.time() - start < 1
+
+    def test_wait_timeout(self):
+        proc, event = self.make_proc('host')
+        done, done_event = self.make_proc('done')
+        done_event.set()
+        start = time.time()
+        with raises(MaxWhileTries):
+            run.wait([done, proc], timeout=0.1)
+        assert time.time() - start < 1
+        assert all(waiter.dead for waiter in self.waiters)
+
+    def test_as_completed_stopped(self):
+        procs = list()
+        for i in range(3):
+            proc, event = self.make_proc('host')
+            procs.append(proc)
+        event.set()
+        completed = run.as_completed(procs, timeout=5)
+        assert next(completed) is proc
+        completed.close()
+        assert len(self.waiters) == 3
+        assert all(waiter.dead for waiter in self.waiters)
+
+    def test_wait_any_timeout(self):
+        procs = [self.make_proc('host')[0] for i in range(2)]
+        with raises(MaxWhileTries):
+            run.wait_any(procs, timeout=0.05)
+        assert len(self.waiters) == 2
+        assert all(waiter.dead for waiter in self.waiters)
+
+    def test_wait_failure(self):
+        proc, event = self.make_proc('host', status=1)
+        event.set()
+        with raises(CommandFailedError):
+            run.wait([proc], timeout=5)
+
+
 class TestQuote(object):
     def test_quote_simple(self):
         got = run.quote(['a b', ' c', 'd e '])
@@ -20,6 +20,7 @@ from teuthology.exceptions import (VersionNotFoundError, CommitNotFoundError,
 from teuthology.misc import sudo_write_file
 from teuthology.orchestra.opsys import OS, DEFAULT_OS_VERSION
 from teuthology.orchestra.run import Raw
+from teuthology.trace import record_response
 
 log = logging.getLogger(__name__)
 
@@ -868,6 +869,7 @@ class ShamanProject(GitbuilderProject):
         resp = requests.get(
             uri,
             headers={'content-type': 'application/json'},
+            hooks=dict(response=record_response),
         )
         resp.raise_for_status()
         return resp
@@ -989,7 +991,8 @@ class ShamanProject(GitbuilderProject):
         build_url = urljoin(self.query_url, path)
 
         try:
-            resp = requests.get(build_url)
+            resp = requests.get(build_url,
+                                hooks=dict(response=record_response))
             resp.raise_for_status()
         except requests.HttpError:
             return False
@@ -1009,7 +1012,8 @@ class ShamanProject(GitbuilderProject):
         return False
 
     def _get_repo(self):
-        resp = requests.get(self.repo_url)
+        resp = requests.get(self.repo_url,
+                            hooks=dict(response=record_response))
         resp.raise_for_status()
         return str(resp.text)
 
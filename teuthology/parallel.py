@@ -1,5 +1,6 @@
 import logging
 import sys
+import time
 
 import gevent
 import gevent.pool
@@ -44,7 +45,9 @@ class parallel(object):
             for foo in bar:
                 p.spawn(quux, foo, baz=True)
 
-    You can iterate over the results (which are in arbitrary order)::
+    You can iterate over the results (which are in arbitrary order, unless
+    ordered=True is passed, in which case they are in the order the
+    functions were spawned in)::
 
         with parallel() as p:
             for foo in bar:
@@ -57,27 +60,53 @@ class parallel(object):
 
     At the end of the with block, the main thread waits until all
     spawned functions have completed, or, if one exited with an exception,
-    kills the rest and raises the exception.
+    kills the rest and raises the exception. The rest are killed as well if
+    the with block itself raises.
+
+    If max_workers is given, at most that many functions run at once, and
+    spawn() blocks until one of them is done.
+
+    How long each function took, and how it ended, is recorded in
+    p.records; see CallRecord.
     """
 
-    def __init__(self):
-        self.group = gevent.pool.Group()
+    def __init__(self, max_workers=None, ordered=False):
+        if max_workers:
+            self.group = gevent.pool.Pool(max_workers)
+        else:
+            self.group = gevent.pool.Group()
+        self.ordered = ordered
         self.results = gevent.queue.Queue()
         self.count = 0
         self.any_spawned = False
         self.iteration_stopped = False
+        self.cancelled = False
+        self.records = []
+        # results that arrived ahead of their turn, when ordered
+        self._pending = dict()
+        self._next_index = 0
 
     def spawn(self, func, *args, **kwargs):
         self.count += 1
         self.any_spawned = True
-        greenlet = self.group.spawn(capture_traceback, func, *args, **kwargs)
-        greenlet.link(self._finish)
+        record = CallRecord(len(self.records), func, args)
+        self.records.append(record)
+        greenlet = self.group.spawn(self._run, record, func, args, kwargs)
+        greenlet.link(lambda greenlet: self._finish(record, greenlet))
+
+    def cancel(self):
+        """
+        Kill the functions that are still running
+        """
+        self.cancelled = True
+        self.group.kill(block=True)
 
     def __enter__(self):
         return self
 
     def __exit__(self, type_, value, traceback):
         if value is not None:
+            self.cancel()
             return False
 
         # raises if any greenlets exited with an exception
@@ -92,24 +121,101 @@ class parallel(object):
     def __next__(self):
         if not self.any_spawned or self.iteration_stopped:
             raise StopIteration()
-        result = self.results.get()
+        result = self._get()
 
         try:
             resurrect_traceback(result)
         except StopIteration:
             self.iteration_stopped = True
             raise
+        except BaseException:
+            self.iteration_stopped = True
+            self.cancel()
+            raise
 
         return result
 
     next = __next__
 
-    def _finish(self, greenlet):
+    def _get(self):
+        if not self.ordered:
+            return self.results.get()[1]
+        while self._next_index not in self._pending:
+            index, result = self.results.get()
+            if index is None or isinstance(
+                    result, (ExceptionHolder, BaseException)):
+                return result
+            self._pending[index] = result
+        self._next_index += 1
+        return self._pending.pop(self._next_index - 1)
+
+    @staticmethod
+    def _run(record, func, args, kwargs):
+        record.started = time.time()
+        return capture_traceback(func, *args, **kwargs)
+
+    def _finish(self, record, greenlet):
+        record.finished = time.time()
         if greenlet.successful():
-            self.results.put(greenlet.value)
+            result = greenlet.value
+        else:
+            result = greenlet.exception
+        if isinstance(result, gevent.GreenletExit) or (
+                self.cancelled and record.started is None):
+            record.outcome = 'cancelled'
+        elif isinstance(result, (ExceptionHolder, BaseException)):
+            record.outcome = 'failed'
         else:
-            self.results.put(greenlet.exception)
+            record.outcome = 'ok'
+        self.results.put((record.index, result))
 
         self.count -= 1
         if self.count <= 0:
-            self.results.put(StopIteration())
+            self.results.put((None, StopIteration()))
+            self._log_records()
+
+    def _log_records(self):
+        timed = [r for r in self.records if r.duration is not None]
+        if not timed:
+            return
+        slowest = max(timed, key=lambda r: r.duration)
+        log.debug('%d parallel calls; slowest: %s', len(self.records),
+                  slowest)
+
+
+class CallRecord(object):
+    """
+    What happened to a function spawned by parallel
+
+    :param index:    The order the function was spawned in
+    :param func:     The function
+    :param args:     Its positional arguments
+    :param started:  When it started running, or None if it has not
+    :param finished: When it finished, or None if it has not
+    :param outcome:  'ok', 'failed', 'cancelled', or None if it has not
+                     finished
+    """
+    def __init__(self, index, func, args):
+        self.index = index
+        self.func = func
+        self.args = args
+        self.started = None
+        self.finished = None
+        self.outcome = None
+
+    @property
+    def duration(self):
+        """
+        How many seconds the function ran for, or None
+        """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def __repr__(self):
+        name = getattr(self.func, '__name__', repr(self.func))
+        if self.args:
+            name += '(%r, ...)' % (self.args[0],)
+        if self.duration is None:
+            return '%s: %s' % (name, self.outcome)
+        return '%s: %s in %.1fs' % (name, self.outcome, self.duration)
@@ -1,11 +1,17 @@
+import collections
 import gzip
+import humanfriendly
 import logging
 import os
 import shutil
 import time
 
+from gevent.threadpool import ThreadPool
+
 import teuthology
+from teuthology.archive_index import INDEX_FILE, RunIndex
 from teuthology.contextutil import safe_while
+from teuthology.parallel import ExceptionHolder, capture_traceback
 
 log = logging.getLogger(__name__)
 
@@ -13,6 +19,12 @@ log = logging.getLogger(__name__)
 # If we see this in any directory, we do not prune it
 PRESERVE_FILE = '.preserve'
 
+# Subdirectories of jobs removed after --remotes days
+REMOTE_SUBDIRS = dict(
+    remote='remote logs',
+    data='mon data',
+)
+
 
 def main(args):
     """
@@ -27,9 +39,15 @@ def main(args):
     fail_days = int(args['--fail'])
     remotes_days = int(args['--remotes'])
     compress_days = int(args['--compress'])
+    workers = int(args['--workers'])
+    max_iops = int(args['--max-iops'])
+    max_bandwidth = humanfriendly.parse_size(args['--max-bandwidth'])
+    index = args['--index']
 
     prune_archive(
-        archive_dir, pass_days, fail_days, remotes_days, compress_days, dry_run
+        archive_dir, pass_days, fail_days, remotes_days, compress_days,
+        dry_run, workers=workers, max_iops=max_iops,
+        max_bandwidth=max_bandwidth, index=index,
     )
 
 
@@ -40,17 +58,30 @@ def prune_archive(
         remotes_days,
         compress_days,
         dry_run=False,
+        workers=4,
+        max_iops=0,
+        max_bandwidth=0,
+        index=False,
 ):
     """
-    Walk through the archive_dir, calling the cleanup functions to process
-    directories that might be old enough
+    Walk through the archive_dir, and remove or compress whatever in the
+    directories that might be old enough needs to be.
+
+    Each run directory is scanned once, and the resulting removals and
+    compressions are carried out by a pool of worker threads. max_iops and
+    max_bandwidth (in bytes per second) limit the rate at which directories
+    are scanned and files are compressed or removed; 0 means unlimited.
+
+    If index is True, the job index of each run scanned that lacks one is
+    written too, so that listing its jobs no longer parses their YAML files.
     """
+    # with every operation skipped, e.g. to only index runs, look at them all
     min_days = min(filter(
-        lambda n: n >= 0, [pass_days, fail_days, remotes_days]))
-    log.debug("Archive {archive} has {count} children".format(
-        archive=archive_dir, count=len(os.listdir(archive_dir))))
+        lambda n: n >= 0, [pass_days, fail_days, remotes_days]), default=0)
     # Use full paths
     children = [os.path.join(archive_dir, p) for p in listdir(archive_dir)]
+    log.debug("Archive {archive} has {count} children".format(
+        archive=archive_dir, count=len(children)))
     run_dirs = list()
     for child in children:
         # Ensure that the path is not a symlink, is a directory, and is old
@@ -59,172 +90,326 @@ def prune_archive(
                 is_old_enough(child, min_days)):
             run_dirs.append(child)
     run_dirs.sort(key=lambda p: os.path.getctime(p), reverse=True)
-    for run_dir in run_dirs:
-        log.debug("Processing %s ..." % run_dir)
-        maybe_remove_jobs(run_dir, pass_days, fail_days, dry_run)
-        maybe_remove_remotes(run_dir, remotes_days, dry_run)
-        maybe_compress_logs(run_dir, compress_days, dry_run)
+    pruner = Pruner(
+        pass_days, fail_days, remotes_days, compress_days, dry_run,
+        workers=workers, budget=IOBudget(max_iops, max_bandwidth),
+        index=index,
+    )
+    pruner.prune(run_dirs)
+    return pruner.stats
 
 
-def listdir(path):
-    with safe_while(sleep=1, increment=1, tries=10) as proceed:
-        while proceed():
-            try:
-                return os.listdir(path)
-            except OSError:
-                log.exception("Failed to list %s !" % path)
+class IOBudget(object):
+    """
+    Limits the rate at which I/O operations are started, so that pruning
+    does not starve the jobs writing to the same filesystem.
+    """
+    def __init__(self, iops=0, bandwidth=0):
+        """
+        :param iops:      The maximum number of operations per second, or 0
+        :param bandwidth: The maximum number of bytes per second, or 0
+        """
+        self.iops = iops
+        self.bandwidth = bandwidth
+        self._next = 0
+
+    def consume(self, ops=1, nbytes=0):
+        """
+        Wait until the budget allows for ops more operations, involving
+        nbytes more bytes.
+        """
+        cost = 0
+        if self.iops:
+            cost = max(cost, ops / self.iops)
+        if self.bandwidth:
+            cost = max(cost, nbytes / self.bandwidth)
+        if not cost:
+            return
+        now = time.time()
+        start = max(self._next, now)
+        self._next = start + cost
+        if start > now:
+            time.sleep(start - now)
 
 
-def should_preserve(dir_name):
+class Pruner(object):
     """
-    Should the directory be preserved?
+    Scans run directories and removes or compresses their contents as
+    needed, using a pool of worker threads.
 
-    :returns: True if the directory contains a file named '.preserve'; False
-              otherwise
+    Scanning happens in the workers too, a few runs ahead of the one being
+    processed; the workers never log, so that they don't need to share any
+    locks with the gevent hub.
     """
-    preserve_path = os.path.join(dir_name, PRESERVE_FILE)
-    if os.path.isdir(dir_name) and os.path.exists(preserve_path):
-        return True
-    return False
+    # How often to log progress, in seconds
+    progress_interval = 60
 
+    def __init__(self, pass_days, fail_days, remotes_days, compress_days,
+                 dry_run=False, workers=4, budget=None, index=False):
+        self.pass_days = pass_days
+        self.fail_days = fail_days
+        self.remotes_days = remotes_days
+        self.compress_days = compress_days
+        self.dry_run = dry_run
+        self.workers = max(1, workers)
+        self.budget = budget or IOBudget()
+        self.index = index
+        self.stats = dict(
+            runs=0,
+            jobs=0,
+            removed=0,
+            compressed=0,
+            compressed_bytes=0,
+            indexed=0,
+            errors=0,
+        )
 
-def is_old_enough(file_name, days):
-    """
-    :returns: True if the file's modification date is earlier than the amount
-              of days specified
-    """
-    if days < 0:
-        return False
-    now = time.time()
-    secs_to_days = lambda s: s / (60 * 60 * 24)
-    age = now - os.path.getmtime(file_name)
-    if secs_to_days(age) > days:
-        return True
-    return False
+    def prune(self, run_dirs):
+        """
+        :param run_dirs: A list of run directories, in the order in which to
+                         process them
+        """
+        self.total_runs = len(run_dirs)
+        self.pool = ThreadPool(self.workers)
+        self.pending = list()
+        self.start_time = self.last_progress = time.time()
+        scans = collections.deque()
+        run_dirs = iter(run_dirs)
+        try:
+            while True:
+                # stay a few runs ahead of the one being processed
+                while len(scans) < self.workers:
+                    run_dir = next(run_dirs, None)
+                    if run_dir is None:
+                        break
+                    scans.append((run_dir, self.pool.spawn(
+                        capture_traceback, scan_run, run_dir,
+                        self.pass_days, self.fail_days, self.remotes_days,
+                        self.compress_days, self.index,
+                    )))
+                if not scans:
+                    break
+                run_dir, scan = scans.popleft()
+                log.debug("Processing %s ..." % run_dir)
+                self._process(run_dir, scan.get())
+                self._reap()
+                self._maybe_report_progress()
+            self._reap(wait=True)
+        finally:
+            self.pool.kill()
+        self._report_progress()
 
+    def _process(self, run_dir, result):
+        self.stats['runs'] += 1
+        if isinstance(result, ExceptionHolder):
+            self.stats['errors'] += 1
+            log.error("Failed to scan %s !", run_dir,
+                      exc_info=result.exc_info)
+            return
+        njobs, actions = result
+        self.stats['jobs'] += njobs
+        # scanning took a listing of the run and of each of its jobs
+        self.budget.consume(ops=njobs + 1)
+        for (action, path, message, size) in actions:
+            log.info(message)
+            if self.dry_run:
+                continue
+            if action == 'remove':
+                self.budget.consume()
+                func = _remove
+            elif action == 'index':
+                # reading a summary, info and config of each job
+                self.budget.consume(ops=3 * njobs)
+                func = _index_run
+            else:
+                self.budget.consume(nbytes=size)
+                func = _compress_log
+            self.pending.append(
+                (action, path, size, self.pool.spawn(
+                    capture_traceback, func, path)))
 
-def remove(path):
-    """
-    Attempt to recursively remove a directory. If an OSError is encountered,
-    log it and continue.
-    """
-    try:
-        shutil.rmtree(path)
-    except OSError:
-        log.exception("Failed to remove %s !" % path)
+    def _reap(self, wait=False):
+        """
+        Account for the removals and compressions that have finished; if
+        wait is True, wait for all of them to finish first.
+        """
+        pending = list()
+        for item in self.pending:
+            (action, path, size, result) = item
+            if not (wait or result.ready()):
+                pending.append(item)
+                continue
+            value = result.get()
+            if isinstance(value, ExceptionHolder):
+                self.stats['errors'] += 1
+                if action == 'remove':
+                    log.error("Failed to remove %s !", path,
+                              exc_info=value.exc_info)
+                elif action == 'index':
+                    log.error("Failed to index %s", path,
+                              exc_info=value.exc_info)
+                else:
+                    log.error("Failed to compress %s", path,
+                              exc_info=value.exc_info)
+            elif action == 'remove':
+                self.stats['removed'] += 1
+            elif action == 'index':
+                self.stats['indexed'] += 1
+            else:
+                self.stats['compressed'] += 1
+                self.stats['compressed_bytes'] += size
+        self.pending = pending
+
+    def _maybe_report_progress(self):
+        if time.time() - self.last_progress >= self.progress_interval:
+            self._report_progress()
 
+    def _report_progress(self):
+        self.last_progress = now = time.time()
+        elapsed = max(now - self.start_time, 0.001)
+        stats = self.stats
+        log.info(
+            "Scanned %d/%d runs and %d jobs (%.1f jobs/s); removed %d "
+            "directories, compressed %d logs (%s, %s/s), indexed %d runs, "
+            "%d errors",
+            stats['runs'], self.total_runs, stats['jobs'],
+            stats['jobs'] / elapsed, stats['removed'], stats['compressed'],
+            humanfriendly.format_size(stats['compressed_bytes']),
+            humanfriendly.format_size(stats['compressed_bytes'] / elapsed),
+            stats['indexed'], stats['errors'],
+        )
 
-def maybe_remove_jobs(run_dir, pass_days, fail_days, dry_run=False):
+
+def scan_run(run_dir, pass_days, fail_days, remotes_days, compress_days,
+             index=False):
     """
-    Remove entire job log directories if they are old enough and the job passed
+    Look at each of the directories in run_dir once, and decide what to do
+    about it.
+
+    :param index: Whether to index the run if it has no job index
+    :returns: A tuple of the number of directories looked at, and a list of
+              (action, path, message, size) tuples, where action is either
+              'remove', 'compress' or 'index'.
     """
-    if pass_days < 0 and fail_days < 0:
-        return
-    contents = listdir(run_dir)
-    if PRESERVE_FILE in contents:
-        return
-    for child in contents:
-        job_path = os.path.join(run_dir, child)
-        # Ensure the path isn't marked for preservation and that it is a
-        # directory
-        if should_preserve(job_path) or not os.path.isdir(job_path):
+    actions = list()
+    entries = list(os.scandir(run_dir))
+    if any(entry.name == PRESERVE_FILE for entry in entries):
+        return 0, actions
+    if index and not any(entry.name == INDEX_FILE for entry in entries):
+        actions.append(('index', run_dir, (
+            "{run} has no job index; writing one".format(run=run_dir)), 0))
+    remove_jobs = pass_days >= 0 or fail_days >= 0
+    njobs = 0
+    for entry in entries:
+        if not entry.is_dir():
             continue
-        # Is it a job dir?
-        summary_path = os.path.join(job_path, 'summary.yaml')
-        if not os.path.exists(summary_path):
-            continue
-        # Depending on whether it passed or failed, we have a different age
-        # threshold
-        summary_lines = [line.strip() for line in
-                         open(summary_path).readlines()]
-        if 'success: true' in summary_lines:
-            status = 'passed'
-            days = pass_days
-        elif 'success: false' in summary_lines:
-            status = 'failed'
-            days = fail_days
-        else:
+        njobs += 1
+        job_path = entry.path
+        try:
+            contents = dict(
+                (child.name, child) for child in os.scandir(job_path))
+            job_mtime = entry.stat().st_mtime
+        except OSError:
             continue
-        # Ensure the directory is old enough to remove
-        if not is_old_enough(summary_path, days):
+        # Ensure the path isn't marked for preservation
+        if PRESERVE_FILE in contents:
             continue
-        log.info("{job} is a {days}-day old {status} job; removing".format(
-            job=job_path, days=days, status=status))
-        if not dry_run:
-            remove(job_path)
+        if remove_jobs and 'summary.yaml' in contents:
+            removal = _job_removal(
+                contents['summary.yaml'], pass_days, fail_days)
+            if removal:
+                (days, status) = removal
+                actions.append(('remove', job_path, (
+                    "{job} is a {days}-day old {status} job; removing".format(
+                        job=job_path, days=days, status=status)), 0))
+                continue
+        if _is_older_than(job_mtime, remotes_days):
+            for (subdir, description) in REMOTE_SUBDIRS.items():
+                child = contents.get(subdir)
+                if child is None or not child.is_dir():
+                    continue
+                actions.append(('remove', child.path, (
+                    "{job} is {days} days old; removing {desc}".format(
+                        job=job_path, days=remotes_days, desc=description)),
+                    0))
+        log_name = 'teuthology.log'
+        child = contents.get(log_name)
+        if child is not None and _is_older_than(job_mtime, compress_days):
+            actions.append(('compress', child.path, (
+                "{job} is {days} days old; compressing {name}".format(
+                    job=job_path, days=compress_days, name=log_name)),
+                child.stat().st_size))
+    return njobs, actions
 
 
-def maybe_remove_remotes(run_dir, days, dry_run=False):
+def _job_removal(summary_entry, pass_days, fail_days):
     """
-    Remove remote logs (not teuthology logs) from job directories if they are
-    old enough
+    :returns: A (days, status) tuple if the job whose summary.yaml is
+              summary_entry should be removed, None otherwise
     """
+    # Depending on whether it passed or failed, we have a different age
+    # threshold
+    with open(summary_entry.path) as f:
+        summary_lines = [line.strip() for line in f.readlines()]
+    if 'success: true' in summary_lines:
+        status = 'passed'
+        days = pass_days
+    elif 'success: false' in summary_lines:
+        status = 'failed'
+        days = fail_days
+    else:
+        return None
+    # Ensure the directory is old enough to remove
+    if not _is_older_than(summary_entry.stat().st_mtime, days):
+        return None
+    return days, status
+
+
+def _is_older_than(mtime, days):
     if days < 0:
-        return
-    contents = listdir(run_dir)
-    subdirs = dict(
-        remote='remote logs',
-        data='mon data',
-    )
-    if PRESERVE_FILE in contents:
-        return
-    for child in contents:
-        item = os.path.join(run_dir, child)
-        # Ensure the path isn't marked for preservation, that it is a
-        # directory, and that it is old enough
-        if (should_preserve(item) or not os.path.isdir(item) or not
-                is_old_enough(item, days)):
-            continue
-        for (subdir, description) in subdirs.items():
-            _maybe_remove_subdir(item, subdir, days, description, dry_run)
+        return False
+    return (time.time() - mtime) / (60 * 60 * 24) > days
 
 
-def _maybe_remove_subdir(job_dir, subdir, days, description, dry_run=False):
-    # Does the subdir exist?
-    subdir_path = os.path.join(job_dir, subdir)
-    if not os.path.isdir(subdir_path):
-        return
-    log.info("{job} is {days} days old; removing {desc}".format(
-        job=job_dir,
-        days=days,
-        desc=description,
-    ))
-    if not dry_run:
-        remove(subdir_path)
+def _remove(path):
+    shutil.rmtree(path)
 
 
-def maybe_compress_logs(run_dir, days, dry_run=False):
-    if days < 0:
-        return
-    contents = listdir(run_dir)
-    if PRESERVE_FILE in contents:
-        return
-    for child in contents:
-        item = os.path.join(run_dir, child)
-        # Ensure the path isn't marked for preservation, that it is a
-        # directory, and that it is old enough
-        if (should_preserve(item) or not os.path.isdir(item) or not
-                is_old_enough(item, days)):
-            continue
-        log_name = 'teuthology.log'
-        log_path = os.path.join(item, log_name)
-        if not os.path.exists(log_path):
-            continue
-        log.info("{job} is {days} days old; compressing {name}".format(
-            job=item,
-            days=days,
-            name=log_name,
-        ))
-        if dry_run:
-            continue
-        zlog_path = log_path + '.gz'
-        try:
-            _compress(log_path, zlog_path)
-        except Exception:
-            log.exception("Failed to compress %s", log_path)
+def _index_run(run_dir):
+    # keep the run's modification time, which decides when it is pruned
+    stat = os.stat(run_dir)
+    RunIndex(run_dir).rebuild()
+    os.utime(run_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def _compress_log(log_path):
+    zlog_path = log_path + '.gz'
+    try:
+        _compress(log_path, zlog_path)
+    except Exception:
+        if os.path.exists(zlog_path):
             os.remove(zlog_path)
-        else:
-            os.remove(log_path)
+        raise
+    os.remove(log_path)
+
+
+def listdir(path):
+    with safe_while(sleep=1, increment=1, tries=10) as proceed:
+        while proceed():
+            try:
+                return os.listdir(path)
+            except OSError:
+                log.exception("Failed to list %s !" % path)
+
+
+def is_old_enough(file_name, days):
+    """
+    :returns: True if the file's modification date is earlier than the amount
+              of days specified
+    """
+    if days < 0:
+        return False
+    return _is_older_than(os.path.getmtime(file_name), days)
 
 
 def _compress(in_path, out_path):
@@ -1,17 +1,21 @@
 import os
 import yaml
 import json
-import re
 import requests
 import logging
 import random
 import socket
+import time
 from datetime import datetime
 
+import gevent.pool
+
 import teuthology
+from teuthology.archive_index import RunIndex
 from teuthology.config import config
 from teuthology.contextutil import safe_while
 from teuthology.job_status import get_status, set_status
+from teuthology.trace import record_response
 
 report_exceptions = (requests.exceptions.RequestException, socket.error)
 
@@ -40,10 +44,11 @@ def main(args):
     archive_base = os.path.abspath(os.path.expanduser(args['--archive'])) or \
         config.archive_base
     save = not args['--no-save']
+    workers = int(args['--workers'])
 
     log = init_logging()
     reporter = ResultsReporter(archive_base, save=save, refresh=refresh,
-                               log=log)
+                               log=log, workers=workers)
     if dead and not job:
         for run_name in run:
             try_mark_run_dead(run[0])
@@ -80,6 +85,10 @@ class ResultsSerializer(object):
         :param job_id:   The job's id.
         :param simple(bool): Read less data for speed (only orig.config.yaml/info.yaml)
         :returns:        A dict.
+
+        Unlike the other lookups, this reads the job's YAML files rather than
+        the run's archive index: the results server wants the whole config
+        and summary, and the index only keeps a few fields of them.
         """
         job_archive_dir = os.path.join(self.archive_base,
                                        run_name,
@@ -139,28 +148,23 @@ class ResultsSerializer(object):
         :returns:        A dict like: {'1': '/path/to/1', '2': 'path/to/2'}
         """
         archive_dir = os.path.join(self.archive_base, run_name)
-        if not os.path.isdir(archive_dir):
-            return {}
-        jobs = {}
-        for item in os.listdir(archive_dir):
-            if not re.match('\d+$', item):
-                continue
-            job_id = item
-            job_dir = os.path.join(archive_dir, job_id)
-            if os.path.isdir(job_dir):
-                jobs[job_id] = job_dir
-        return jobs
+        return dict(
+            (job_id, os.path.join(archive_dir, job_id))
+            for job_id in RunIndex(archive_dir).job_ids()
+        )
 
     def running_jobs_for_run(self, run_name):
         """
-        Like jobs_for_run(), but only returns jobs with no summary.yaml
+        Like jobs_for_run(), but only returns jobs with no summary.yaml,
+        according to the run's archive index
 
         :param run_name: The name of the run.
         :returns:        A dict like: {'1': '/path/to/1', '2': 'path/to/2'}
         """
         jobs = self.jobs_for_run(run_name)
-        for job_id in list(jobs):
-            if os.path.exists(os.path.join(jobs[job_id], 'summary.yaml')):
+        index = RunIndex(os.path.join(self.archive_base, run_name))
+        for job_id, record in index.jobs(list(jobs)).items():
+            if record.get('finished'):
                 jobs.pop(job_id)
         return jobs
 
@@ -183,9 +187,17 @@ class ResultsSerializer(object):
 
 class ResultsReporter(object):
     last_run_file = 'last_successful_run'
+    # How many jobs to send in each request to the bulk endpoint
+    batch_size = 50
 
     def __init__(self, archive_base=None, base_uri=None, save=False,
-                 refresh=False, log=None):
+                 refresh=False, log=None, workers=1, bulk=None):
+        """
+        :param workers: How many requests to the results server may be in
+                        flight at once when reporting several jobs
+        :param bulk:    Whether to try reporting several jobs in one request.
+                        Defaults to config.results_server_bulk.
+        """
         self.log = log or init_logging()
         self.archive_base = archive_base or config.archive_base
         self.base_uri = base_uri or config.results_server
@@ -195,6 +207,12 @@ class ResultsReporter(object):
         self.serializer = ResultsSerializer(archive_base, log=self.log)
         self.save_last_run = save
         self.refresh = refresh
+        self.workers = max(1, workers)
+        if bulk is None:
+            bulk = config.results_server_bulk
+        # Whether the results server accepts several jobs in one request;
+        # None until we have tried
+        self.bulk_supported = None if bulk else False
         self.session = self._make_session()
 
         if not self.base_uri:
@@ -203,8 +221,13 @@ class ResultsReporter(object):
 
     def _make_session(self, max_retries=10):
         session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(max_retries=max_retries)
+        # keep a connection alive for each worker
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=max_retries,
+            pool_maxsize=self.workers,
+        )
         session.mount('http://', adapter)
+        session.hooks['response'].append(record_response)
         return session
 
     def report_all_runs(self):
@@ -229,13 +252,15 @@ class ResultsReporter(object):
         num_runs = len(run_names)
         num_jobs = 0
         self.log.info("Posting %s runs", num_runs)
+        start = time.time()
         for run in run_names:
             job_count = self.report_run(run)
             num_jobs += job_count
             if self.save_last_run:
                 self.last_run = run
         del self.last_run
-        self.log.info("Total: %s jobs in %s runs", num_jobs, len(run_names))
+        self.log.info("Total: %s jobs in %s runs%s", num_jobs, len(run_names),
+                      self._throughput(num_jobs, start))
 
     def report_run(self, run_name, dead=False):
         """
@@ -257,20 +282,107 @@ class ResultsReporter(object):
                 if response.status_code == 200:
                     self.log.info("    already present; skipped")
                     return 0
+            start = time.time()
             self.report_jobs(run_name, jobs.keys(), dead=dead)
+            self.log.info("    reported%s", self._throughput(len(jobs), start))
         elif not jobs:
             self.log.debug("    no jobs; skipped")
         return len(jobs)
 
+    @staticmethod
+    def _throughput(num_jobs, start):
+        elapsed = time.time() - start
+        rate = num_jobs / elapsed if elapsed else 0
+        return " in {elapsed:.1f}s ({rate:.1f} jobs/s)".format(
+            elapsed=elapsed, rate=rate)
+
     def report_jobs(self, run_name, job_ids, dead=False):
         """
         Report several jobs to the results server.
 
+        If the results server supports it, jobs are sent in batches of
+        batch_size; otherwise one at a time. Up to self.workers requests are
+        made concurrently.
+
         :param run_name: The name of the run.
         :param job_ids:  The jobs' ids
         """
-        for job_id in job_ids:
-            self.report_job(run_name, job_id, dead=dead)
+        job_ids = list(job_ids)
+        if self.bulk_supported is None and len(job_ids) > 1:
+            # find out whether the server supports bulk reporting
+            batch = job_ids[:self.batch_size]
+            self.report_batch(run_name, batch, dead=dead)
+            job_ids = job_ids[len(batch):]
+        if self.bulk_supported and len(job_ids) > 1:
+            batches = [job_ids[i:i + self.batch_size]
+                       for i in range(0, len(job_ids), self.batch_size)]
+            self._map(
+                lambda batch: self.report_batch(run_name, batch, dead=dead),
+                batches)
+        else:
+            self._map(
+                lambda job_id: self.report_job(run_name, job_id, dead=dead),
+                job_ids)
+
+    def _map(self, func, items):
+        if self.workers == 1 or len(items) <= 1:
+            return list(map(func, items))
+        pool = gevent.pool.Pool(self.workers)
+        return pool.map(func, items)
+
+    def report_batch(self, run_name, job_ids, dead=False):
+        """
+        Report several jobs to the results server with a single request, if
+        it supports that; otherwise, report each of them with report_job().
+
+        :param run_name: The name of the run. The run must already exist.
+        :param job_ids:  The jobs' ids
+        """
+        job_infos = [self.serializer.job_info(run_name, job_id)
+                     for job_id in job_ids]
+        if dead:
+            for job_info in job_infos:
+                if get_status(job_info) is None:
+                    set_status(job_info, 'dead')
+        if self.bulk_supported is not False and len(job_ids) > 1:
+            bulk_uri = "{base}/runs/{name}/jobs/bulk/".format(
+                base=self.base_uri, name=run_name,)
+            try:
+                response = self.session.post(
+                    bulk_uri, data=json.dumps(job_infos),
+                    headers={'content-type': 'application/json'})
+            except report_exceptions:
+                self.log.exception("POST to %s failed", bulk_uri)
+                response = None
+            if response is not None:
+                if response.status_code == 200:
+                    self.bulk_supported = True
+                    return
+                if response.status_code in (405, 501) or (
+                        response.status_code == 404 and
+                        self._run_exists(run_name)):
+                    self.log.warning(
+                        "%s does not support bulk reporting", self.base_uri)
+                    self.bulk_supported = False
+                elif response.status_code == 404:
+                    # the run does not exist yet; reporting a job creates it
+                    self.log.debug(
+                        "Run %s not found; reporting jobs one at a time",
+                        run_name)
+                else:
+                    self.log.warning(
+                        "POST to %s failed with status %s; reporting jobs "
+                        "one at a time", bulk_uri, response.status_code)
+        for job_id, job_info in zip(job_ids, job_infos):
+            self.report_job(run_name, job_id, job_info=job_info, dead=dead)
+
+    def _run_exists(self, run_name):
+        try:
+            response = self.session.head("{base}/runs/{name}/".format(
+                base=self.base_uri, name=run_name))
+        except report_exceptions:
+            return False
+        return response.status_code == 200
 
     def report_job(self, run_name, job_id, job_info=None, dead=False):
         """
@@ -509,6 +621,45 @@ def try_push_job_info(job_config, extra_info=None):
                       config.results_server)
 
 
+def try_push_jobs_info(job_configs, extra_info=None, reporter=None):
+    """
+    Like try_push_job_info(), but for several jobs at once. A single
+    ResultsReporter - and therefore a single keep-alive session - is used for
+    all of them, and a failure to push one job does not prevent the others
+    from being pushed.
+
+    :param job_configs: A list of job config dicts to push
+    :param extra_info:  Optional second dict to push along with each job
+    :param reporter:    The ResultsReporter to use, so that its session can
+                        be reused across calls. A new one by default.
+    """
+    log = init_logging()
+
+    if not config.results_server:
+        log.warning('No results_server in config; not reporting results')
+        return
+
+    if reporter is None:
+        reporter = ResultsReporter()
+    log.debug("Pushing info for %d jobs to %s", len(job_configs),
+              config.results_server)
+    for job_config in job_configs:
+        if job_config.get('job_id') is None:
+            log.warning('No job_id found; not reporting results')
+            continue
+
+        job_info = job_config.copy()
+        if extra_info is not None:
+            job_info.update(extra_info)
+
+        try:
+            reporter.report_job(job_config['name'], job_config['job_id'],
+                                job_info)
+        except report_exceptions:
+            log.exception("Could not report results to %s",
+                          config.results_server)
+
+
 def try_delete_jobs(run_name, job_ids, delete_empty_run=True):
     """
     Using the same error checking and retry mechanism as try_push_job_info(),
@@ -4,6 +4,7 @@ import sys
 import logging
 
 import teuthology
+from teuthology import archive_index
 from teuthology import install_except_hook
 from teuthology import report
 from teuthology.job_status import get_status
@@ -54,6 +55,10 @@ def write_initial_metadata(archive, config, name, description, owner):
         with open(os.path.join(archive, 'info.yaml'), 'w') as f:
             yaml.safe_dump(info, f, default_flow_style=False)
 
+        if 'job_id' in config:
+            archive_index.record_job(
+                archive, dict(info, machine_type=config.get('machine_type')))
+
 
 def fetch_tasks_if_needed(job_config):
     """
@@ -273,6 +278,9 @@ def report_outcome(config, archive, summary, fake_ctx):
     if archive is not None:
         with open(os.path.join(archive, 'summary.yaml'), 'w') as f:
             yaml.safe_dump(summary, f, default_flow_style=False)
+        if 'job_id' in config:
+            archive_index.record_job(
+                archive, dict(summary, status=status), finished=True)
 
     summary_dump = yaml.safe_dump(summary)
     log.info('Summary data:\n%s' % summary_dump)
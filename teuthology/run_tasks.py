@@ -15,6 +15,7 @@ from teuthology.exceptions import ConnectionLostError
 from teuthology.job_status import set_status, get_status
 from teuthology.misc import get_http_log_path, get_results_url
 from teuthology.timer import Timer
+from teuthology.trace import tracer
 
 log = logging.getLogger(__name__)
 
@@ -77,9 +78,14 @@ def run_tasks(tasks, ctx):
             path=os.path.join(archive_path, 'timing.yaml'),
             sync=True,
         )
+        tracer.open(os.path.join(archive_path, 'trace.jsonl'))
     else:
         timer = Timer()
+    # let tasks add their own data to timing.yaml
+    ctx.timer = timer
     stack = []
+    # the spans of the tasks, finished as the tasks are
+    spans = []
     try:
         for taskdict in tasks:
             try:
@@ -88,10 +94,13 @@ def run_tasks(tasks, ctx):
                 raise RuntimeError('Invalid task definition: %s' % taskdict)
             log.info('Running task %s...', taskname)
             timer.mark('%s enter' % taskname)
+            spans.append(tracer.begin_task(taskname))
             manager = run_one_task(taskname, ctx=ctx, config=config)
             if hasattr(manager, '__enter__'):
                 stack.append((taskname, manager))
                 manager.__enter__()
+            else:
+                spans.pop().finish()
     except BaseException as e:
         if isinstance(e, ConnectionLostError):
             # Prevent connection issues being flagged as failures
@@ -168,13 +177,18 @@ def run_tasks(tasks, ctx):
                     .format(sleep_before_teardown))
                 notify_sleep_before_teardown(ctx, stack, sleep_before_teardown)
                 time.sleep(sleep_before_teardown)
+            if len(spans) > len(stack):
+                # the task which failed before it could be entered
+                spans.pop().finish(status='error')
             while stack:
                 taskname, manager = stack.pop()
                 log.debug('Unwinding manager %s', taskname)
                 timer.mark('%s exit' % taskname)
+                span = spans.pop()
                 try:
                     suppress = manager.__exit__(*exc_info)
                 except Exception as e:
+                    span.finish(status='error')
                     if isinstance(e, ConnectionLostError):
                         # Prevent connection issues being flagged as failures
                         set_status(ctx.summary, 'dead')
@@ -195,6 +209,7 @@ def run_tasks(tasks, ctx):
                             'Saw failure during task cleanup, going into interactive mode...')
                         interactive.task(ctx=ctx, config=None)
                 else:
+                    span.finish()
                     if suppress:
                         exc_info = (None, None, None)
 
@@ -205,6 +220,7 @@ def run_tasks(tasks, ctx):
         finally:
             # be careful about cyclic references
             del exc_info
+            tracer.close()
         timer.mark("tasks complete")
 
 
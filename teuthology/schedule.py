@@ -1,12 +1,79 @@
+import docopt
 import os
 import yaml
 
 import teuthology.beanstalk
+from teuthology.config import config
 from teuthology.misc import get_user, merge_configs
 from teuthology import report
 
 
+doc = """
+usage: teuthology-schedule -h
+       teuthology-schedule [options] --name <name> [--] [<conf_file> ...]
+
+Schedule ceph integration tests
+
+positional arguments:
+  <conf_file>                          Config file to read
+
+optional arguments:
+  -h, --help                           Show this help message and exit
+  -v, --verbose                        Be more verbose
+  -b <backend>, --queue-backend <backend>
+                                       Queue backend name, use prefix '@'
+                                       to append job config to the given
+                                       file path as yaml.
+                                       [default: beanstalk]
+  -n <name>, --name <name>             Name of suite run the job is part of
+  -d <desc>, --description <desc>      Job description
+  -o <owner>, --owner <owner>          Job owner
+  -w <worker>, --worker <worker>       Which worker to use (type of machine)
+                                       [default: plana]
+  -p <priority>, --priority <priority> Job priority (lower is sooner)
+                                       [default: 1000]
+  -N <num>, --num <num>                Number of times to run/queue the job
+                                       [default: 1]
+
+  --first-in-suite                     Mark the first job in a suite so suite
+                                       can note down the rerun-related info
+                                       [default: False]
+  --last-in-suite                      Mark the last job in a suite so suite
+                                       post-processing can be run
+                                       [default: False]
+  --email <email>                      Where to send the results of a suite.
+                                       Only applies to the last job in a suite.
+  --timeout <timeout>                  How many seconds to wait for jobs to
+                                       finish before emailing results. Only
+                                       applies to the last job in a suite.
+  --seed <seed>                        The random seed for rerunning the suite.
+                                       Only applies to the last job in a suite.
+  --subset <subset>                    The subset option passed to teuthology-suite.
+                                       Only applies to the last job in a suite.
+  --dry-run                            Instead of scheduling, just output the
+                                       job config.
+
+"""
+
+
+def parse_args(argv):
+    """
+    :param argv: A teuthology-schedule argument list
+    :returns:    A dict of teuthology-schedule arguments, as main() expects
+    """
+    return docopt.docopt(doc, argv=argv)
+
+
 def main(args):
+    check_args(args)
+    schedule_jobs([args])
+
+
+def check_args(args):
+    """
+    Validate a dict of teuthology-schedule arguments, raising ValueError if
+    any of them are used inappropriately.
+    """
     if not args['--first-in-suite']:
         first_job_args = ['subset', 'seed']
         for arg in first_job_args:
@@ -23,25 +90,54 @@ def main(args):
             if args[opt]:
                 raise ValueError(msg_fmt.format(opt=opt))
 
-    if args['--first-in-suite'] or args['--last-in-suite']:
-        report_status = False
-    else:
-        report_status = True
-
     name = args['--name']
     if not name or name.isdigit():
         raise ValueError("Please use a more descriptive value for --name")
-    job_config = build_config(args)
-    backend = args['--queue-backend']
-    if args['--dry-run']:
-        print('---\n' + yaml.safe_dump(job_config))
-    elif backend == 'beanstalk':
-        schedule_job(job_config, args['--num'], report_status)
-    elif backend.startswith('@'):
-        dump_job_to_file(backend.lstrip('@'), job_config, args['--num'])
-    else:
-        raise ValueError("Provided schedule backend '%s' is not supported. "
-                         "Try 'beanstalk' or '@path-to-a-file" % backend)
+
+
+def schedule_jobs(args_list):
+    """
+    Schedule several jobs in-process, as if teuthology-schedule had been run
+    once for each of the argument dicts in args_list.
+
+    Jobs destined for beanstalk share a single connection. Each job's
+    'queued' status is pushed to the results server as soon as it has been
+    put, before a worker can have started it and reported it running, over a
+    single session shared by all of them.
+
+    :param args_list: A list of dicts of teuthology-schedule arguments, as
+                      returned by docopt
+    """
+    beanstalk = None
+    reporter = None
+    try:
+        for args in args_list:
+            check_args(args)
+            report_status = not (
+                args['--first-in-suite'] or args['--last-in-suite'])
+            job_config = build_config(args)
+            backend = args['--queue-backend']
+            if args['--dry-run']:
+                print('---\n' + yaml.safe_dump(job_config))
+            elif backend == 'beanstalk':
+                if beanstalk is None:
+                    beanstalk = teuthology.beanstalk.connect()
+                jobs = put_job(beanstalk, job_config, args['--num'])
+                if report_status:
+                    if reporter is None and config.results_server:
+                        reporter = report.ResultsReporter()
+                    report.try_push_jobs_info(
+                        jobs, dict(status='queued'), reporter=reporter)
+            elif backend.startswith('@'):
+                dump_job_to_file(backend.lstrip('@'), job_config,
+                                 args['--num'])
+            else:
+                raise ValueError(
+                    "Provided schedule backend '%s' is not supported. "
+                    "Try 'beanstalk' or '@path-to-a-file" % backend)
+    finally:
+        if beanstalk is not None:
+            beanstalk.close()
 
 
 def build_config(args):
@@ -93,11 +189,30 @@ def schedule_job(job_config, num=1, report_status=True):
     :param job_config: The complete job dict
     :param num:      The number of times to schedule the job
     """
+    beanstalk = teuthology.beanstalk.connect()
+    try:
+        for queued in put_job(beanstalk, job_config, num):
+            if report_status:
+                report.try_push_job_info(queued, dict(status='queued'))
+    finally:
+        beanstalk.close()
+
+
+def put_job(beanstalk, job_config, num=1):
+    """
+    Put a job into its tube using an existing beanstalk connection, and add
+    it to the tube's queue index.
+
+    :param beanstalk:  A beanstalkc.Connection
+    :param job_config: The complete job dict
+    :param num:      The number of times to schedule the job
+    :returns:        A list of job dicts, one per job put, with 'job_id' set
+    """
     num = int(num)
     job = yaml.safe_dump(job_config)
     tube = job_config.pop('tube')
-    beanstalk = teuthology.beanstalk.connect()
     beanstalk.use(tube)
+    jobs = list()
     while num > 0:
         jid = beanstalk.put(
             job,
@@ -107,9 +222,11 @@ def schedule_job(job_config, num=1, report_status=True):
         print('Job scheduled with name {name} and ID {jid}'.format(
             name=job_config['name'], jid=jid))
         job_config['job_id'] = str(jid)
-        if report_status:
-            report.try_push_job_info(job_config, dict(status='queued'))
+        jobs.append(job_config.copy())
         num -= 1
+    teuthology.beanstalk.QueueIndex(tube).add(
+        [job['job_id'] for job in jobs], job_config['name'])
+    return jobs
 
 
 def dump_job_to_file(path, job_config, num=1):
@@ -3,7 +3,8 @@
 
 import difflib
 from errno import ENOENT
-from gzip import GzipFile
+import functools
+import gzip
 import sys
 import os
 import yaml
@@ -13,12 +14,30 @@ import logging
 import subprocess
 
 import six
+from gevent.threadpool import ThreadPool
+
+from teuthology.parallel import ExceptionHolder, capture_traceback
 
 log = logging.getLogger('scrape')
 log.addHandler(logging.StreamHandler())
 log.setLevel(logging.INFO)
 
 
+@functools.lru_cache(maxsize=65536)
+def similar(a, b):
+    """
+    Whether difflib rates a and b more than half alike.
+
+    The upper bounds difflib provides are tried first, since they are
+    cheaper to compute and never rule out a pair that ratio() would accept.
+    """
+    if a == b:
+        return True
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return matcher.real_quick_ratio() > 0.5 and \
+        matcher.quick_ratio() > 0.5 and matcher.ratio() > 0.5
+
+
 class Reason(object):
     def get_description(self):
         return self.description
@@ -27,19 +46,6 @@ class Reason(object):
         return None
 
 
-def grep(path, expr):
-    """
-    Call out to native grep rather than feeding massive log files through python line by line
-    """
-    p = subprocess.Popen(["grep", expr, path], stdout=subprocess.PIPE)
-    p.wait()
-    out, err = p.communicate()
-    if p.returncode == 0:
-        return six.ensure_str(out).split("\n")
-    else:
-        return []
-
-
 class GenericReason(Reason):
     """
     A reason inferred from a Job: matches Jobs with an apparently-similar failure
@@ -78,8 +84,7 @@ class GenericReason(Reason):
         # If we have the same backtrace, we're a match even if the teuthology failure_reason
         # doesn't match (a crash is a crash, it can have different symptoms)
         if self.backtrace:
-            ratio = difflib.SequenceMatcher(None, self.backtrace, job.get_backtrace()).ratio()
-            return ratio > 0.5
+            return similar(self.backtrace, job.get_backtrace())
         else:
             if "Test failure:" in self.failure_reason:
                 return self.failure_reason == job.get_failure_reason()
@@ -88,8 +93,7 @@ class GenericReason(Reason):
                 other_match = re.search("workunit test (.*)\) on ", job.get_failure_reason())
                 return other_match is not None and workunit_name == other_match.group(1)
             else:
-                reason_ratio = difflib.SequenceMatcher(None, self.failure_reason, job.get_failure_reason()).ratio()
-                return reason_ratio > 0.5
+                return similar(self.failure_reason, job.get_failure_reason())
 
 
 class RegexReason(Reason):
@@ -158,8 +162,7 @@ class LockdepReason(AssertionReason):
 
         if self.backtrace:
             if job.get_backtrace():
-                ratio = difflib.SequenceMatcher(None, self.backtrace, job.get_backtrace()).ratio()
-                return ratio > 0.5
+                return similar(self.backtrace, job.get_backtrace())
             else:
                 return False
         else:
@@ -193,16 +196,13 @@ class DeadReason(Reason):
         if self.backtrace:
             if job.get_backtrace():
                 # We both have backtrace: use that to decide if we're the same
-                ratio = difflib.SequenceMatcher(None, self.backtrace, job.get_backtrace()).ratio()
-                return ratio > 0.5
+                return similar(self.backtrace, job.get_backtrace())
             else:
                 # I have BT but he doesn't, so we're different
                 return False
 
         if self.last_tlog_line or job.get_last_tlog_line():
-            ratio = difflib.SequenceMatcher(None, self.last_tlog_line,
-                                            job.get_last_tlog_line()).ratio()
-            return ratio > 0.5
+            return similar(self.last_tlog_line, job.get_last_tlog_line())
         return True
 
 
@@ -248,9 +248,145 @@ class TimeoutReason(Reason):
     def match(self, job):
         return self.get_timeout(job) == (self.timeout, self.command)
 
-MAX_TEUTHOLOGY_LOG = 1024 * 1024 * 100
-MAX_SVC_LOG = 100 * 1024 * 1024
 MAX_BT_LINES = 100
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+# Lines longer than this are not looked at
+MAX_SCAN_LINE = 1024 * 1024
+
+# Everything _LogScan.scan_line() looks for; lines without any of these are
+# skipped without being looked at individually
+SCAN_MARKERS = re.compile(
+    r'ceph version|FAILED assert|NOTE: a copy of the executable|'
+    r'command crashed with signal|</kind> in ')
+
+
+def read_log(path, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    Read the log at path, which may be gzipped, in chunks of about
+    chunk_size bytes, each ending at the end of a line.
+
+    :returns: A generator of chunks of text
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        pending = b''
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            end = data.rfind(b'\n')
+            if end == -1:
+                pending += data
+                if len(pending) > MAX_SCAN_LINE:
+                    pending = b''
+                continue
+            yield (pending + data[:end + 1]).decode('utf-8', 'replace')
+            pending = data[end + 1:]
+        if pending:
+            yield pending.decode('utf-8', 'replace')
+
+
+class _LogScan(object):
+    """
+    What scan_log() found in a log
+    """
+    def __init__(self, stop_at_backtrace):
+        self.stop_at_backtrace = stop_at_backtrace
+        self.backtrace = None
+        self.assertion = None
+        # Lines saying a daemon crashed
+        self.crashes = []
+        # Lines reporting valgrind issues
+        self.valgrind = []
+        # (level, message) tuples to be logged about the log
+        self.notes = []
+        self.bt_lines = []
+
+    def scan(self, text):
+        """
+        Scan a chunk of complete lines.
+
+        :returns: Whether the rest of the log needs scanning
+        """
+        pos = 0
+        size = len(text)
+        while pos < size:
+            if self.bt_lines:
+                # every line of a backtrace is needed
+                start = pos
+            else:
+                match = SCAN_MARKERS.search(text, pos)
+                if match is None:
+                    break
+                start = text.rfind('\n', 0, match.start()) + 1
+            end = text.find('\n', start)
+            end = size if end == -1 else end + 1
+            pos = end
+            if not self.scan_line(text[start:end]):
+                return False
+        return True
+
+    def scan_line(self, line):
+        if "command crashed with signal" in line:
+            self.crashes.append(line.rstrip('\n'))
+        if "</kind> in " in line:
+            self.valgrind.append(line.rstrip('\n'))
+
+        # Log prefix from teuthology.log
+        if ".stderr:" in line:
+            line = line.split(".stderr:")[1]
+
+        if "FAILED assert" in line and self.backtrace is None:
+            self.assertion = line.strip()
+
+        bt_lines = self.bt_lines
+        if line.startswith(" ceph version"):
+            # The start of a backtrace!
+            self.bt_lines = [line]
+        elif line.startswith(" NOTE: a copy of the executable"):
+            # The backtrace terminated, if we have a buffer keep it
+            if len(bt_lines):
+                if self.backtrace is None:
+                    self.backtrace = ("".join(bt_lines)).strip()
+                self.bt_lines = []
+                return not self.stop_at_backtrace
+            else:
+                self.notes.append(
+                    (logging.WARNING, "Saw end of BT but not start"))
+        elif bt_lines:
+            # We're in a backtrace, push the line onto the list
+            if len(bt_lines) > MAX_BT_LINES:
+                # Something wrong with our parsing, drop it
+                self.notes.append((
+                    logging.WARNING,
+                    "Ignoring malparsed backtrace: {0}".format(
+                        ", ".join(bt_lines[0:3]))))
+                self.bt_lines = bt_lines = []
+            bt_lines.append(line)
+        return True
+
+
+def scan_log(path, stop_at_backtrace=True, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    Look through the log at path, which may be gzipped, for the first
+    complete backtrace, the assertion that caused it, and the lines
+    reporting crashed daemons and valgrind issues, all in a single pass.
+
+    The log is read in chunks, so memory use does not depend on its size.
+    Neither does anything get logged, so that this can run in any thread.
+
+    :param path:              The log's path
+    :param stop_at_backtrace: Stop reading the log once a backtrace is found
+    :param chunk_size:        How much to read from the log at once
+    :returns:                 An object with backtrace, assertion, crashes,
+                              valgrind and notes attributes; notes are
+                              (level, message) tuples to be logged
+    """
+    result = _LogScan(stop_at_backtrace)
+    for text in read_log(path, chunk_size):
+        if not result.scan(text):
+            break
+    return result
 
 
 class Job(object):
@@ -274,6 +410,7 @@ class Job(object):
 
         self.backtrace = None
         self.assertion = None
+        self.valgrind_lines = []
         self.populated = False
 
     def get_success(self):
@@ -296,38 +433,6 @@ class Job(object):
             out, err = subprocess.Popen(["tail", "-n", "1", t_path], stdout=subprocess.PIPE).communicate()
             return out.strip()
 
-    def _search_backtrace(self, file_obj):
-        bt_lines = []
-        assertion = None
-        for line in file_obj:
-            # Log prefix from teuthology.log
-            if ".stderr:" in line:
-                line = line.split(".stderr:")[1]
-
-            if "FAILED assert" in line:
-                assertion = line.strip()
-
-            if line.startswith(" ceph version"):
-                # The start of a backtrace!
-                bt_lines = [line]
-            elif line.startswith(" NOTE: a copy of the executable"):
-                # The backtrace terminated, if we have a buffer return it
-                if len(bt_lines):
-                    return ("".join(bt_lines)).strip(), assertion
-                else:
-                    log.warning("Saw end of BT but not start")
-            elif bt_lines:
-                # We're in a backtrace, push the line onto the list
-                if len(bt_lines) > MAX_BT_LINES:
-                    # Something wrong with our parsing, drop it
-                    log.warning("Ignoring malparsed backtrace: {0}".format(
-                        ", ".join(bt_lines[0:3])
-                    ))
-                    bt_lines = []
-                bt_lines.append(line)
-
-        return None, assertion
-
     def get_assertion(self):
         if not self.populated:
             self._populate_backtrace()
@@ -338,57 +443,76 @@ class Job(object):
             self._populate_backtrace()
         return self.backtrace
 
+    def get_valgrind_lines(self):
+        """
+        The lines of teuthology.log reporting valgrind issues
+        """
+        if not self.populated:
+            self._populate_backtrace()
+        return self.valgrind_lines
+
     def _populate_backtrace(self):
-        tlog_path = os.path.join(self.path, "teuthology.log")
-        try:
-            s = os.stat(tlog_path)
-        except OSError:
-            log.warning("Missing teuthology log {0}".format(tlog_path))
-            return None
-        size = s.st_size
-        if size > MAX_TEUTHOLOGY_LOG:
-            log.debug("Ignoring teuthology log for job {0}, it is {1} bytes".format(self.job_id, size))
-            return None
+        for level, msg in self.scan():
+            log.log(level, msg)
 
-        self.backtrace, self.assertion = self._search_backtrace(open(tlog_path))
+    def scan(self):
+        """
+        Look for a backtrace, assertion and valgrind issues in the job's
+        logs: teuthology.log first, then the logs of any daemons it says
+        crashed. Nothing is logged, so that jobs can be scanned
+        concurrently.
+
+        :returns: A list of (level, message) tuples to be logged
+        """
+        self.populated = True
+        notes = []
+        tlog_path = os.path.join(self.path, "teuthology.log")
+        if not os.path.exists(tlog_path):
+            notes.append(
+                (logging.WARNING, "Missing teuthology log {0}".format(tlog_path)))
+            return notes
+
+        # The valgrind issues are only needed to tell valgrind failures
+        # apart, and are reported anywhere in the log
+        failure_reason = self.get_failure_reason()
+        want_valgrind = bool(failure_reason) and \
+            "saw valgrind issues" in failure_reason
+        found = scan_log(tlog_path, stop_at_backtrace=not want_valgrind)
+        notes.extend(found.notes)
+        self.backtrace, self.assertion = found.backtrace, found.assertion
+        self.valgrind_lines = found.valgrind
         if self.backtrace:
-            return
+            return notes
 
-        for line in grep(tlog_path, "command crashed with signal"):
-            log.debug("Found a crash indication: {0}".format(line))
+        for line in found.crashes:
+            notes.append((logging.DEBUG, "Found a crash indication: {0}".format(line)))
             # tasks.ceph.osd.1.plana82.stderr
             match = re.search("tasks.ceph.([^\.]+).([^\.]+).([^\.]+).stderr", line)
             if not match:
-                log.warning("Not-understood crash indication {0}".format(line))
+                notes.append((logging.WARNING,
+                              "Not-understood crash indication {0}".format(line)))
                 continue
             svc, svc_id, hostname = match.groups()
             gzipped_log_path = os.path.join(
                 self.path, "remote", hostname, "log", "ceph-{0}.{1}.log.gz".format(svc, svc_id))
 
             try:
-                s = os.stat(gzipped_log_path)
-            except OSError as e:
+                found = scan_log(gzipped_log_path)
+            except (IOError, OSError) as e:
                 if e.errno == ENOENT:
-                    log.warning("Missing log {0}".format(gzipped_log_path))
+                    notes.append((logging.WARNING,
+                                  "Missing log {0}".format(gzipped_log_path)))
                     continue
                 else:
                     raise
+            notes.extend(found.notes)
+            if found.assertion and not self.assertion:
+                self.assertion = found.assertion
+            if found.backtrace:
+                self.backtrace = found.backtrace
+                break
 
-            size = s.st_size
-            if size > MAX_SVC_LOG:
-                log.warning("Not checking for backtrace from {0}:{1}.{2} log, too large ({3})".format(
-                    hostname, svc, svc_id, size
-                ))
-                continue
-
-            bt, ass = self._search_backtrace(GzipFile(gzipped_log_path))
-            if ass and not self.assertion:
-                self.assertion = ass
-            if bt:
-                self.backtrace = bt
-                return
-
-        return None
+        return notes
 
 
 class ValgrindReason(Reason):
@@ -404,7 +528,7 @@ class ValgrindReason(Reason):
         result = defaultdict(list)
         # Lines like:
         # 2014-08-22T20:07:18.668 ERROR:tasks.ceph:saw valgrind issue   <kind>Leak_DefinitelyLost</kind> in /var/log/ceph/valgrind/osd.3.log.gz
-        for line in grep(os.path.join(job.path, "teuthology.log"), "</kind> in "):
+        for line in job.get_valgrind_lines():
             match = re.search("<kind>(.+)</kind> in .+/(.+)", line)
             if not match:
                 log.warning("Misunderstood line: {0}".format(line))
@@ -462,8 +586,9 @@ def give_me_a_reason(job):
 
 
 class Scraper(object):
-    def __init__(self, target_dir):
+    def __init__(self, target_dir, workers=4):
         self.target_dir = target_dir
+        self.workers = workers
         log.addHandler(logging.FileHandler(os.path.join(target_dir,
                                                      "scrape.log")))
 
@@ -476,24 +601,34 @@ class Scraper(object):
                 jobs.append(Job(job_dir, entry))
 
         log.info("Found {0} jobs".format(len(jobs)))
+        self.scan([job for job in jobs if not job.get_success()])
 
         passes = []
         reasons = defaultdict(list)
+        # Jobs failing in exactly the same way end up with the same reason;
+        # remember which that was rather than matching them all over again
+        reason_for = dict()
 
         for job in jobs:
             if job.get_success():
                 passes.append(job)
                 continue
 
-            matched = False
-            for reason, reason_jobs in reasons.items():
-                if reason.match(job):
-                    reason_jobs.append(job)
-                    matched = True
-                    break
-
-            if not matched:
-                reasons[give_me_a_reason(job)].append(job)
+            key = self._match_key(job)
+            reason = reason_for.get(key)
+            if reason is None:
+                for reason in reasons:
+                    if reason.match(job):
+                        break
+                else:
+                    reason = give_me_a_reason(job)
+                    if not reason.match(job):
+                        # e.g. a failure without a failure reason, which
+                        # gets a reason of its own every time
+                        reasons[reason].append(job)
+                        continue
+                reason_for[key] = reason
+            reasons[reason].append(job)
 
         log.info("Found {0} distinct failure reasons".format(len(reasons)))
         for reason, jobs in list(reasons.items()):
@@ -511,5 +646,43 @@ class Scraper(object):
                 log.info("suites: {0}".format(sorted(suites[0])))
             log.info("")
 
+    @staticmethod
+    def _match_key(job):
+        """
+        Everything about job that Reason.match() looks at
+        """
+        key = (
+            job.summary_data is None,
+            bool(job.summary_data),
+            job.get_failure_reason(),
+            job.get_backtrace(),
+            job.get_assertion(),
+            tuple(job.get_valgrind_lines()),
+        )
+        if job.summary_data is None:
+            key += (job.get_last_tlog_line(),)
+        return key
+
+    def scan(self, jobs):
+        """
+        Scan the logs of jobs in a pool of threads. Only reading and
+        decompressing the logs overlaps; matching the regexes holds the GIL,
+        so it is done for one log at a time.
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            results = [pool.spawn(capture_traceback, job.scan) for job in jobs]
+            for job, result in zip(jobs, results):
+                notes = result.get()
+                if isinstance(notes, ExceptionHolder):
+                    log.warning("Failed to scan the logs of job {0}".format(
+                        job.job_id), exc_info=notes.exc_info)
+                    continue
+                for level, msg in notes:
+                    log.log(level, msg)
+        finally:
+            pool.kill()
+
+
 if __name__ == '__main__':
     Scraper(sys.argv[1]).analyze()
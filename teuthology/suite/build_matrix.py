@@ -1,13 +1,23 @@
+import hashlib
 import logging
 import os
+import pickle
 import random
+import stat
+import subprocess
+import tempfile
 
+from teuthology.config import config
 from teuthology.suite import matrix
 
 log = logging.getLogger(__name__)
 
+# Bump this whenever the matrix classes change in a way that makes
+# previously cached matrices unusable
+MATRIX_CACHE_VERSION = 2
 
-def build_matrix(path, subset=None, seed=None):
+
+def build_matrix(path, subset=None, seed=None, lazy=False):
     """
     Return a list of items descibed by path such that if the list of
     items is chunked into mincyclicity pieces, each piece is still a
@@ -44,9 +54,14 @@ def build_matrix(path, subset=None, seed=None):
     component will appear as a file with braces listing the selection
     of chosen subitems.
 
+    If lazy is True, a Combinations object is returned instead of a list:
+    it has the same length and yields the same items in the same order, but
+    only generates each item as it is iterated over.
+
     :param path:        The path to search for yaml fragments
     :param subset:	(index, outof)
     :param seed:        The seed for repeatable random test
+    :param lazy:        Generate items on demand rather than up front
     """
     if subset:
         log.info(
@@ -55,6 +70,8 @@ def build_matrix(path, subset=None, seed=None):
         )
     random.seed(seed)
     mat, first, matlimit = _get_matrix(path, subset)
+    if lazy:
+        return Combinations(path, mat, first, matlimit)
     return generate_combinations(path, mat, first, matlimit)
 
 
@@ -64,7 +81,7 @@ def _get_matrix(path, subset=None):
     matlimit = None
     if subset:
         (index, outof) = subset
-        mat = _build_matrix(path, mincyclicity=outof)
+        mat = _load_matrix(path, mincyclicity=outof)
         first = (mat.size() // outof) * index
         if index == outof or index == outof - 1:
             matlimit = mat.size()
@@ -72,11 +89,120 @@ def _get_matrix(path, subset=None):
             matlimit = (mat.size() // outof) * (index + 1)
     else:
         first = 0
-        mat = _build_matrix(path)
+        mat = _load_matrix(path)
         matlimit = mat.size()
     return mat, first, matlimit
 
 
+def _load_matrix(path, mincyclicity=0):
+    """
+    Like _build_matrix(), but consult the on-disk cache in
+    config.suite_matrix_cache_path first, and populate it afterwards.
+
+    Cache entries are keyed on the suite path and the state of the tree
+    below it. In a git checkout, like those of fetch_qa_suite(), that is the
+    checked-out commit, so that a cache hit costs two git commands rather
+    than a walk of the tree; matrices of paths with uncommitted changes are
+    not cached. Changes outside the path, e.g. to what its symlinks point
+    to, are not noticed unless they are committed. Elsewhere the key is a
+    digest of the modification times of all of the directories below the
+    path, which change whenever an entry is added or removed.
+    """
+    cache_path = config.suite_matrix_cache_path
+    key = _matrix_cache_key(path, mincyclicity) if cache_path else None
+    if key is None:
+        return _build_matrix(path, mincyclicity)
+    cache_file = os.path.join(cache_path, key)
+    try:
+        with open(cache_file, 'rb') as f:
+            mat = pickle.load(f)
+        log.debug('Loaded matrix for %s from %s', path, cache_file)
+        return mat
+    except FileNotFoundError:
+        pass
+    except Exception:
+        log.warning('Ignoring unreadable matrix cache file %s', cache_file,
+                    exc_info=True)
+    mat = _build_matrix(path, mincyclicity)
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=cache_path, prefix='.' + key, delete=False) as f:
+            pickle.dump(mat, f)
+        os.rename(f.name, cache_file)
+    except OSError:
+        log.warning('Could not write matrix cache file %s', cache_file,
+                    exc_info=True)
+    return mat
+
+
+def _matrix_cache_key(path, mincyclicity):
+    path = os.path.abspath(path)
+    try:
+        if not stat.S_ISDIR(os.stat(path).st_mode):
+            return None
+    except OSError:
+        return None
+    head = _git_head(path)
+    if head is None:
+        state = _dir_mtime_digest(path)
+    elif _git_dirty(path):
+        state = None
+    else:
+        state = 'git ' + head
+    if state is None:
+        return None
+    key = '\n'.join(
+        [str(MATRIX_CACHE_VERSION), path, str(mincyclicity), state])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _git_head(path):
+    """
+    Return the commit checked out at path, or None if path is not part of a
+    git checkout
+    """
+    try:
+        head = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=path,
+            stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head.decode().strip()
+
+
+def _git_dirty(path):
+    """
+    Return whether there are uncommitted changes below path in its checkout
+    """
+    try:
+        status = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--', path],
+            cwd=path, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return True
+    return bool(status.strip())
+
+
+def _dir_mtime_digest(path):
+    """
+    Return a digest of the modification times of every directory below path
+    that _build_matrix() would look into, or None if there are none.
+    """
+    digest = hashlib.sha1()
+    found = False
+    for dirpath, dirnames, _ in os.walk(path, followlinks=True):
+        # like _build_matrix(), skip hidden entries; this also keeps us out
+        # of the .qa symlinks pointing back up the tree
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        digest.update(('%s %d\n' % (
+            dirpath, os.stat(dirpath).st_mtime_ns)).encode())
+        found = True
+    if not found:
+        return None
+    return 'mtime ' + digest.hexdigest()
+
+
 def _build_matrix(path, mincyclicity=0, item=''):
     if os.path.basename(path)[0] == '.':
         return None
@@ -183,13 +309,52 @@ def generate_combinations(path, mat, generate_from, generate_to):
     """
     ret = []
     for i in range(generate_from, generate_to):
-        output = mat.index(i)
-        ret.append((
-            matrix.generate_desc(combine_path, output).replace('.yaml', ''),
-            matrix.generate_paths(path, output, combine_path)))
+        ret.append(_generate_item(path, mat, i))
     return ret
 
 
+def _generate_item(path, mat, i):
+    output = mat.index(i)
+    return (
+        matrix.generate_desc(combine_path, output).replace('.yaml', ''),
+        matrix.generate_paths(path, output, combine_path))
+
+
+class Combinations(object):
+    """
+    A lazily generated equivalent of the list returned by
+    generate_combinations().
+
+    Items are only generated as they are iterated over, so consumers that
+    filter or stop early do not pay for generating the whole suite. The
+    state of the random module is captured on creation and kept separate
+    from the global one, so every iteration yields exactly the items that
+    generate_combinations() would have returned at that point, regardless
+    of what else uses random in between.
+    """
+    def __init__(self, path, mat, generate_from, generate_to):
+        self.path = path
+        self.mat = mat
+        self.generate_from = generate_from
+        self.generate_to = generate_to
+        self._random_state = random.getstate()
+
+    def __len__(self):
+        return self.generate_to - self.generate_from
+
+    def __iter__(self):
+        state = self._random_state
+        for i in range(self.generate_from, self.generate_to):
+            outer_state = random.getstate()
+            random.setstate(state)
+            try:
+                item = _generate_item(self.path, self.mat, i)
+                state = random.getstate()
+            finally:
+                random.setstate(outer_state)
+            yield item
+
+
 def combine_path(left, right):
     """
     os.path.join(a, b) doesn't like it when b is None
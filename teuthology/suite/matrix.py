@@ -1,6 +1,5 @@
 import os
 import random
-import heapq
 from math import gcd
 from functools import reduce
 
@@ -149,26 +148,23 @@ class Product(Matrix):
         """
         assert len(submats) > 0, \
             "_index requires non-empty submats"
-        if len(submats) == 1:
-            return frozenset([submats[0][1].index(i)])
-
-        lmat = submats[0][1]
-        lsize = lmat.size()
-
-        rsize = submats[0][0]
-
-        cycles = gcd(rsize, lsize)
-        clen = (rsize * lsize) // cycles
-        off = (i // clen) % cycles
-
-        def combine(r, s=frozenset()):
-            if isinstance(r, frozenset):
-                return s | r
-            return s | frozenset([r])
-
-        litems = lmat.index((i - off) % lmat.size())
-        ritems = self._index(i, submats[1:])
-        return combine(litems, combine(ritems))
+        # Walk the dimensions iteratively rather than recursing on
+        # submats[1:]; submats[n][0] is the size of the product of
+        # submats[n+1:], i.e. the rmat of each two dimension step.
+        items = set()
+        for rsize, lmat in submats[:-1]:
+            lsize = lmat.size()
+            cycles = gcd(rsize, lsize)
+            clen = (rsize * lsize) // cycles
+            off = (i // clen) % cycles
+
+            litems = lmat.index((i - off) % lsize)
+            if isinstance(litems, frozenset):
+                items |= litems
+            else:
+                items.add(litems)
+        items.add(submats[-1][1].index(i))
+        return frozenset(items)
 
     def index(self, i):
         items = self._index(i, self.submats)
@@ -242,9 +238,14 @@ class Sum(Matrix):
     an offset (position in input list) and a multiple (pseudo_size / size)
     such that the psuedo_index for index i is <offset> + i*<multiple>.
 
-    I don't have a good way to map index to pseudo index, so we'll
-    precompute a mapping in the constructor (self._i_so_sis) from
-    index to (subset_index, subset).
+    Index i is the (i+1)th smallest pseudo index in use, so we map it
+    back with a binary search over [0, pseudo_size) for the smallest
+    pseudo index pi with pseudo_index_to_index(pi) == i.  Since every
+    multiple is itself a multiple of the number of subsequences, pi
+    modulo that number is the offset of the subsequence it belongs to.
+    This keeps index() at O(len(submats) * log(pseudo_size)) without
+    any per-index state, so building a Sum costs the same whatever the
+    size of the suite below it.
     """
     def __init__(self, item, _submats):
         assert len(_submats) > 0, \
@@ -266,22 +267,6 @@ class Sum(Matrix):
 
             return submat.minscanlen() * multiple
 
-        def index_to_pindex_generator(submats):
-            assert len(submats) > 0, "submats must be non-empty"
-            h = []
-            for (offset, multiple), submat in submats:
-                heapq.heappush(h, (offset, 0, multiple, submat))
-            while True:
-                cur, si, multiple, submat = heapq.heappop(h)
-                heapq.heappush(
-                    h,
-                    (cur + multiple, si + 1, multiple, submat))
-                yield si, submat
-
-        self._i_to_sis = dict(
-            zip(range(self._size), index_to_pindex_generator(self._submats))
-        )
-
         self._minscanlen = self.pseudo_index_to_index(
             max(map(sm_to_pmsl, self._submats)))
 
@@ -312,8 +297,22 @@ class Sum(Matrix):
     def size(self):
         return self._size
 
+    def index_to_sis(self, i):
+        """
+        Map index i (0 <= i < size) to (subset_index, subset)
+        """
+        lo, hi = 0, self._pseudo_size - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.pseudo_index_to_index(mid) < i:
+                lo = mid + 1
+            else:
+                hi = mid
+        (offset, multiple), submat = self._submats[lo % len(self._submats)]
+        return (lo - offset) // multiple, submat
+
     def index(self, i):
-        si, submat = self._i_to_sis[i % self._size]
+        si, submat = self.index_to_sis(i % self._size)
         return (self.item, submat.index(si))
 
 def generate_lists(result):
@@ -26,13 +26,64 @@ from teuthology.suite.placeholder import substitute_placeholders, dict_templ
 log = logging.getLogger(__name__)
 
 
+class FragmentCache(object):
+    """
+    Cache of parsed yaml fragments, keyed by path and modification time, so
+    that a fragment shared by many jobs is only read and parsed once per run.
+    """
+    def __init__(self):
+        self._fragments = dict()
+
+    def get(self, path):
+        """
+        Return a (text, parsed) tuple for the fragment at path. If the
+        fragment cannot be parsed on its own, parsed is None.
+        """
+        key = (path, os.path.getmtime(path))
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            with open(path, 'r') as f:
+                text = f.read()
+            try:
+                parsed = yaml.safe_load(text)
+            except yaml.YAMLError:
+                parsed = None
+            else:
+                if parsed is None:
+                    parsed = dict()
+                elif not isinstance(parsed, dict):
+                    parsed = None
+            fragment = self._fragments[key] = (text, parsed)
+        return fragment
+
+    def load(self, paths):
+        """
+        Return the job config made of the fragments at paths, exactly as if
+        their text had been concatenated and parsed as a single yaml
+        document: top-level keys of later fragments replace those of earlier
+        ones.
+
+        Fragments that can only be parsed as part of the concatenation (e.g.
+        because they use anchors defined by another fragment) are handled by
+        falling back to parsing the concatenated text.
+        """
+        fragments = [self.get(path) for path in paths]
+        if any(parsed is None for _, parsed in fragments):
+            return yaml.safe_load('\n'.join(text for text, _ in fragments))
+        job_config = dict()
+        for _, parsed in fragments:
+            job_config.update(parsed)
+        # the cached fragments must not be modified through the job configs
+        return copy.deepcopy(job_config)
+
+
 class Run(object):
     WAIT_MAX_JOB_TIME = 30 * 60
     WAIT_PAUSE = 5 * 60
     __slots__ = (
         'args', 'name', 'base_config', 'suite_repo_path', 'base_yaml_paths',
         'base_args', 'package_versions', 'kernel_dict', 'config_input',
-        'timestamp', 'user',
+        'timestamp', 'user', 'fragment_cache',
     )
 
     def __init__(self, args):
@@ -55,6 +106,8 @@ class Run(object):
         self.base_config = self.create_initial_config()
         # caches package versions to minimize requests to gbs
         self.package_versions = dict()
+        # caches parsed yaml fragments, which are shared between many jobs
+        self.fragment_cache = FragmentCache()
 
         # Interpret any relative paths as being relative to ceph-qa-suite
         # (absolute paths are unchanged by this)
@@ -403,16 +456,18 @@ class Run(object):
     def collect_jobs(self, arch, configs, newest=False, limit=0):
         jobs_to_schedule = []
         jobs_missing_packages = []
+        # (job, flavor) pairs, flavor being None for jobs that don't verify
+        # the ceph hash
+        candidates = []
+        sha1 = self.base_config.sha1
         for description, fragment_paths in configs:
-            if limit > 0 and len(jobs_to_schedule) >= limit:
+            if limit > 0 and len(candidates) >= limit:
                 log.info(
                     'Stopped after {limit} jobs due to --limit={limit}'.format(
                         limit=limit))
                 break
 
-            raw_yaml = '\n'.join([open(a, 'r').read() for a in fragment_paths])
-
-            parsed_yaml = yaml.safe_load(raw_yaml)
+            parsed_yaml = self.fragment_cache.load(fragment_paths)
             os_type = parsed_yaml.get('os_type') or self.base_config.os_type
             os_version = parsed_yaml.get('os_version') or self.base_config.os_version
             exclude_arch = parsed_yaml.get('exclude_arch')
@@ -439,20 +494,30 @@ class Run(object):
             job = dict(
                 yaml=parsed_yaml,
                 desc=description,
-                sha1=self.base_config.sha1,
+                sha1=sha1,
                 args=arg
             )
 
-            sha1 = self.base_config.sha1
+            flavor = None
             if parsed_yaml.get('verify_ceph_hash',
                                config.suite_verify_ceph_hash):
                 full_job_config = copy.deepcopy(self.base_config.to_dict())
                 deep_merge(full_job_config, parsed_yaml)
                 flavor = util.get_install_task_flavor(full_job_config)
-                # Get package versions for this sha1, os_type and flavor. If
-                # we've already retrieved them in a previous loop, they'll be
-                # present in package_versions and gitbuilder will not be asked
-                # again for them.
+            candidates.append((job, (os_type, os_version, flavor)))
+
+        # Ask gitbuilder/shaman about every distinct os_type, os_version and
+        # flavor at once rather than one job at a time
+        distros = [distro for _, distro in candidates if distro[2] is not None]
+        if distros:
+            self.package_versions = util.prefetch_package_versions(
+                sha1, distros, self.package_versions)
+
+        for job, (os_type, os_version, flavor) in candidates:
+            if flavor is not None:
+                # Anything prefetched above is already present in
+                # package_versions, and gitbuilder will not be asked again
+                # for it.
                 try:
                     self.package_versions = util.get_package_versions(
                         sha1,
@@ -479,6 +544,13 @@ class Run(object):
         return jobs_missing_packages, jobs_to_schedule
 
     def schedule_jobs(self, jobs_missing_packages, jobs_to_schedule, name):
+        """
+        Schedule each of the collected jobs. Unless this is a dry run, jobs
+        are scheduled in-process and in bulk; with --throttle each job is
+        submitted on its own, followed by the requested pause.
+        """
+        throttle = self.args.throttle
+        pending = []
         for job in jobs_to_schedule:
             log.info(
                 'Scheduling %s', job['desc']
@@ -496,16 +568,22 @@ class Run(object):
                         "hash {sha1}.".format(sha1=self.base_config.sha1),
                         name,
                     )
-            util.teuthology_schedule(
-                args=job['args'],
-                dry_run=self.args.dry_run,
-                verbose=self.args.verbose,
-                log_prefix=log_prefix,
-            )
-            throttle = self.args.throttle
-            if not self.args.dry_run and throttle:
+            if self.args.dry_run:
+                util.teuthology_schedule(
+                    args=job['args'],
+                    dry_run=self.args.dry_run,
+                    verbose=self.args.verbose,
+                    log_prefix=log_prefix,
+                )
+                continue
+            pending.append(job['args'])
+            if throttle:
+                util.teuthology_schedule_jobs(pending)
+                pending = []
                 log.info("pause between jobs : --throttle " + str(throttle))
                 time.sleep(int(throttle))
+        if pending:
+            util.teuthology_schedule_jobs(pending)
 
     def check_priority(self, jobs_to_schedule):
         priority = self.args.priority
@@ -557,7 +635,8 @@ Note: If you still want to go ahead, use --job-threshold 0'''
         log.debug('Suite %s in %s' % (suite_name, suite_path))
         configs = build_matrix(suite_path,
                                subset=self.args.subset,
-                               seed=self.args.seed)
+                               seed=self.args.seed,
+                               lazy=True)
         log.info('Suite %s in %s generated %d jobs (not yet filtered)' % (
             suite_name, suite_path, len(configs)))
 
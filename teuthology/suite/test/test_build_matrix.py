@@ -7,6 +7,18 @@ from teuthology.suite import build_matrix
 from teuthology.test.fake_fs import make_fake_fstools
 
 
+def setup_module():
+    # keep tests from writing to the real matrix cache
+    global patcher_cache_path
+    patcher_cache_path = patch.dict(
+        build_matrix.config._conf, suite_matrix_cache_path=None)
+    patcher_cache_path.start()
+
+
+def teardown_module():
+    patcher_cache_path.stop()
+
+
 class TestBuildMatrixSimple(object):
     def test_combine_path(self):
         result = build_matrix.combine_path("/path/to/left", "right/side")
@@ -576,6 +588,43 @@ class TestBuildMatrix(object):
         assert fragments[0] == 'thrash/ceph/base.yaml'
         assert fragments[1] == 'thrash/ceph-thrash/default.yaml'
 
+    def test_lazy(self):
+        fake_fs = {
+            'd0_0': {
+                '%': None,
+                'd1_0': {
+                    'd1_0_0.yaml': None,
+                    'd1_0_1.yaml': None,
+                    'd1_0_2.yaml': None,
+                },
+                'd1_1': {
+                    'd1_1_0.yaml': None,
+                    'd1_1_1.yaml': None,
+                },
+                'd1_2': {
+                    '$': None,
+                    'd1_2_0.yaml': None,
+                    'd1_2_1.yaml': None,
+                    'd1_2_2.yaml': None,
+                },
+            },
+        }
+        self.start_patchers(fake_fs)
+        for subset in (None, (0, 2), (1, 2)):
+            expected = build_matrix.build_matrix(
+                'd0_0', subset=subset, seed=42)
+            result = build_matrix.build_matrix(
+                'd0_0', subset=subset, seed=42, lazy=True)
+            assert len(result) == len(expected)
+            # other users of random must not disturb the combinations
+            lazy_items = []
+            for item in result:
+                random.random()
+                lazy_items.append(item)
+            assert lazy_items == expected
+            # iterating again yields the very same items
+            assert list(result) == expected
+
 class TestSubset(object):
     patchpoints = [
         'os.path.exists',
@@ -722,3 +771,71 @@ class TestSubset(object):
             dlist, mat, first, matlimit = self.generate_description_list(tree, subset)
             self.verify_facets(tree, dlist, subset, mat, first, matlimit)
             self.stop_patchers()
+
+
+class TestMatrixCache(object):
+    def make_suite(self, tmpdir):
+        suite = tmpdir.mkdir('suite')
+        suite.join('%').write('')
+        for facet in ('a', 'b'):
+            for i in range(2):
+                suite.ensure(facet, '%s%d.yaml' % (facet, i))
+        return str(suite)
+
+    @patch('teuthology.suite.build_matrix._git_head')
+    def test_cache(self, m_git_head, tmpdir):
+        m_git_head.return_value = None
+        suite = self.make_suite(tmpdir)
+        cache_path = str(tmpdir.join('cache'))
+        with patch.dict(build_matrix.config._conf,
+                        suite_matrix_cache_path=cache_path):
+            expected = build_matrix.build_matrix(suite)
+            assert len(os.listdir(cache_path)) == 1
+            with patch.object(build_matrix, '_build_matrix') as m_build:
+                assert build_matrix.build_matrix(suite) == expected
+                m_build.assert_not_called()
+            # adding a fragment invalidates the cached matrix
+            tmpdir.join('suite', 'a').ensure('a2.yaml')
+            assert len(build_matrix.build_matrix(suite)) == 6
+            assert len(os.listdir(cache_path)) == 2
+
+    @patch('teuthology.suite.build_matrix.subprocess.check_output')
+    def test_cache_git(self, m_check_output, tmpdir):
+        suite = self.make_suite(tmpdir)
+        cache_path = str(tmpdir.join('cache'))
+        with patch.dict(build_matrix.config._conf,
+                        suite_matrix_cache_path=cache_path):
+            # HEAD, then a clean 'git status'
+            m_check_output.side_effect = [b'sha1\n', b'']
+            key = build_matrix._matrix_cache_key(suite, 0)
+            # the tree changing does not matter as long as HEAD is the same
+            tmpdir.join('suite', 'a').ensure('a2.yaml')
+            m_check_output.side_effect = [b'sha1\n', b'']
+            assert build_matrix._matrix_cache_key(suite, 0) == key
+            # but with uncommitted changes, nothing is cached
+            m_check_output.side_effect = [b'sha1\n', b'?? a/a2.yaml\n']
+            assert build_matrix._matrix_cache_key(suite, 0) is None
+            # only the suite's part of the checkout is looked at
+            args = m_check_output.call_args[0][0]
+            assert args == ['git', 'status', '--porcelain', '--', suite]
+
+    @patch('teuthology.suite.build_matrix._dir_mtime_digest')
+    @patch('teuthology.suite.build_matrix.subprocess.check_output')
+    def test_cache_git_no_walk(self, m_check_output, m_dir_mtime_digest,
+                               tmpdir):
+        suite = self.make_suite(tmpdir)
+        m_check_output.side_effect = [b'sha1\n', b'']
+        with patch.object(build_matrix.os, 'walk') as m_walk:
+            assert build_matrix._matrix_cache_key(suite, 0) is not None
+            m_walk.assert_not_called()
+        m_dir_mtime_digest.assert_not_called()
+
+    def test_no_cache(self, tmpdir):
+        suite = self.make_suite(tmpdir)
+        with patch.dict(build_matrix.config._conf,
+                        suite_matrix_cache_path=None):
+            with patch.object(build_matrix, '_build_matrix',
+                              wraps=build_matrix._build_matrix) as m_build:
+                build_matrix.build_matrix(suite)
+                build_matrix.build_matrix(suite)
+                assert m_build.call_count > 2
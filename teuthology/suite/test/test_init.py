@@ -45,10 +45,16 @@ def setup_module():
         sleep=m_sleep,
     )
     patcher_time_sleep.start()
+    # keep tests from writing to the real matrix cache
+    global patcher_cache_path
+    patcher_cache_path = patch.dict(
+        config._conf, suite_matrix_cache_path=None)
+    patcher_cache_path.start()
 
 
 def teardown_module():
     patcher_time_sleep.stop()
+    patcher_cache_path.stop()
 
 
 @patch.object(suite.ResultsReporter, 'get_jobs')
@@ -190,6 +196,7 @@ class TestSuiteMain(object):
             'teuthology.suite.util',
             fetch_repos=DEFAULT,
             teuthology_schedule=DEFAULT,
+            teuthology_schedule_jobs=DEFAULT,
             get_arch=lambda x: 'x86_64',
             get_gitbuilder_hash=DEFAULT,
             git_ls_remote=lambda *args: '1234',
@@ -218,6 +225,7 @@ class TestSuiteMain(object):
             'teuthology.suite.util',
             fetch_repos=DEFAULT,
             teuthology_schedule=DEFAULT,
+            teuthology_schedule_jobs=DEFAULT,
             get_arch=lambda x: 'x86_64',
             get_gitbuilder_hash=DEFAULT,
             git_ls_remote=lambda *args: '12345',
@@ -80,3 +80,18 @@ class TestMatrix(object):
                     mbs(2, range(2)),
                     mbs(4, range(9)),
                     ]))
+
+    def test_sum_index_order(self):
+        # Sum.index() must visit the subsequences in increasing pseudo
+        # index order, i.e. the order a heap merge of them would produce
+        submats = [mbs(1, range(6)), mbs(2, range(4)), mbs(3, range(9)),
+                   mbs(4, range(1))]
+        mat = matrix.Sum(1, submats)
+        pindices = sorted(
+            (offset + si * (mat._pseudo_size // submat.size()), si, offset)
+            for offset, submat in enumerate(submats)
+            for si in range(submat.size())
+        )
+        assert [mat.index(i) for i in range(mat.size())] == [
+            (1, submats[offset].index(si)) for (_, si, offset) in pindices
+        ]
@@ -204,12 +204,19 @@ class TestScheduleSuite(object):
             base_yaml_paths=list(),
         )
         self.args = YamlConfig.from_dict(self.args_dict)
+        self.cache_patcher = patch.object(
+            config, 'suite_package_versions_cache_path', None)
+        self.cache_patcher.start()
+
+    def teardown(self):
+        self.cache_patcher.stop()
 
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.run.Run.write_rerun_memo')
     @patch('teuthology.suite.util.has_packages_for_distro')
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
+    @patch('teuthology.suite.run.os.path.getmtime')
     @patch('teuthology.suite.run.open')
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
@@ -224,6 +231,7 @@ class TestScheduleSuite(object):
         m_git_ls_remote,
         m_build_matrix,
         m_open,
+        m_getmtime,
         m_get_install_task_flavor,
         m_get_package_versions,
         m_has_packages_for_distro,
@@ -242,6 +250,7 @@ class TestScheduleSuite(object):
         m_build_matrix.return_value = build_matrix_output
         frag1_read_output = 'field1: val1'
         frag2_read_output = 'field2: val2'
+        m_getmtime.return_value = 0
         m_open.side_effect = [
             StringIO(frag1_read_output),
             StringIO(frag2_read_output),
@@ -289,6 +298,7 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.util.has_packages_for_distro')
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
+    @patch('teuthology.suite.run.os.path.getmtime')
     @patch('teuthology.suite.run.open', create=True)
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
@@ -303,6 +313,7 @@ class TestScheduleSuite(object):
         m_git_ls_remote,
         m_build_matrix,
         m_open,
+        m_getmtime,
         m_get_install_task_flavor,
         m_get_package_versions,
         m_has_packages_for_distro,
@@ -319,6 +330,7 @@ class TestScheduleSuite(object):
             (build_matrix_desc, build_matrix_frags),
         ]
         m_build_matrix.return_value = build_matrix_output
+        m_getmtime.return_value = 0
         m_open.side_effect = [StringIO('field: val\n') for i in range(11)]
         m_get_install_task_flavor.return_value = 'default'
         m_get_package_versions.return_value = dict()
@@ -344,6 +356,7 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.util.has_packages_for_distro')
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
+    @patch('teuthology.suite.run.os.path.getmtime')
     @patch('teuthology.suite.run.open', create=True)
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
@@ -358,6 +371,7 @@ class TestScheduleSuite(object):
         m_git_ls_remote,
         m_build_matrix,
         m_open,
+        m_getmtime,
         m_get_install_task_flavor,
         m_get_package_versions,
         m_has_packages_for_distro,
@@ -378,11 +392,12 @@ class TestScheduleSuite(object):
             (build_matrix_desc, build_matrix_frags),
         ]
         m_build_matrix.return_value = build_matrix_output
+        m_getmtime.return_value = 0
+        # the fragment is only read once, however many times we backtrack
         m_open.side_effect = [
-            StringIO('field: val\n') for i in range(NUM_FAILS+1)
-        ] + [
+            StringIO('field: val\n'),
             contextlib.closing(BytesIO())
-        ] 
+        ]
         m_get_install_task_flavor.return_value = 'default'
         m_get_package_versions.return_value = dict()
         # NUM_FAILS, then success
@@ -403,3 +418,83 @@ class TestScheduleSuite(object):
         m_find_git_parent.assert_has_calls(
             [call('ceph', 'ceph_sha1' + i * '^') for i in range(NUM_FAILS)]
         )
+
+    @patch('teuthology.suite.run.time.sleep')
+    @patch('teuthology.suite.util.teuthology_schedule_jobs')
+    @patch('teuthology.suite.util.teuthology_schedule')
+    @patch('teuthology.suite.run.Run.create_initial_config')
+    def test_schedule_jobs_bulk(
+        self,
+        m_create_initial_config,
+        m_teuthology_schedule,
+        m_teuthology_schedule_jobs,
+        m_sleep,
+    ):
+        m_create_initial_config.return_value = run.JobConfig()
+        self.args.dry_run = False
+        runobj = self.klass(self.args)
+        jobs = [dict(desc='desc%d' % i, args=['arg%d' % i]) for i in range(3)]
+        runobj.schedule_jobs([], jobs, runobj.name)
+        m_teuthology_schedule.assert_not_called()
+        m_teuthology_schedule_jobs.assert_called_once_with(
+            [['arg0'], ['arg1'], ['arg2']])
+        m_sleep.assert_not_called()
+
+        m_teuthology_schedule_jobs.reset_mock()
+        self.args.throttle = '3'
+        runobj.schedule_jobs([], jobs, runobj.name)
+        m_teuthology_schedule_jobs.assert_has_calls(
+            [call([['arg0']]), call([['arg1']]), call([['arg2']])])
+        assert m_sleep.call_args_list == [call(3)] * 3
+
+    @patch('teuthology.suite.util.teuthology_schedule_jobs')
+    @patch('teuthology.suite.util.teuthology_schedule')
+    @patch('teuthology.suite.run.Run.create_initial_config')
+    def test_schedule_jobs_dry_run(
+        self,
+        m_create_initial_config,
+        m_teuthology_schedule,
+        m_teuthology_schedule_jobs,
+    ):
+        m_create_initial_config.return_value = run.JobConfig()
+        self.args.dry_run = True
+        self.args.verbose = 1
+        runobj = self.klass(self.args)
+        jobs = [dict(desc='desc%d' % i, args=['arg%d' % i]) for i in range(2)]
+        runobj.schedule_jobs([], jobs, runobj.name)
+        m_teuthology_schedule_jobs.assert_not_called()
+        m_teuthology_schedule.assert_has_calls([
+            call(args=['arg0'], dry_run=True, verbose=1, log_prefix=''),
+            call(args=['arg1'], dry_run=True, verbose=1, log_prefix=''),
+        ])
+
+
+class TestFragmentCache(object):
+    def write(self, tmpdir, name, text):
+        path = tmpdir.join(name)
+        path.write(text)
+        return str(path)
+
+    def test_load(self, tmpdir):
+        paths = [
+            self.write(tmpdir, 'a.yaml', 'os_type: ubuntu\ntasks:\n- a:\n'),
+            self.write(tmpdir, 'b.yaml', '# nothing but a comment\n'),
+            self.write(tmpdir, 'c.yaml', 'tasks:\n- c:\nroles: [[mon.a]]\n'),
+        ]
+        cache = run.FragmentCache()
+        expected = yaml.safe_load(
+            '\n'.join(open(path).read() for path in paths))
+        assert cache.load(paths) == expected
+        # modifying a job config must not leak into other jobs
+        cache.load(paths)['tasks'].append('x')
+        with patch('teuthology.suite.run.open') as m_open:
+            assert cache.load(paths) == expected
+            m_open.assert_not_called()
+
+    def test_load_cross_fragment_alias(self, tmpdir):
+        paths = [
+            self.write(tmpdir, 'a.yaml', 'base: &base {a: 1}\n'),
+            self.write(tmpdir, 'b.yaml', 'other: *base\n'),
+        ]
+        assert run.FragmentCache().load(paths) == \
+            dict(base=dict(a=1), other=dict(a=1))
@@ -1,6 +1,8 @@
 import os
 import pytest
+import shutil
 import tempfile
+import time
 
 from copy import deepcopy
 from mock import Mock, patch
@@ -303,6 +305,70 @@ class TestMissingPackages(object):
         assert not result
 
 
+
+class TestPrefetchPackageVersions(object):
+    distros = [
+        ('ubuntu', '20.04', 'default'),
+        ('centos', '8', 'default'),
+        ('ubuntu', '20.04', 'default'),
+    ]
+
+    def setup(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.cache_patcher = patch.object(
+            config, 'suite_package_versions_cache_path', self.cache_path)
+        self.cache_patcher.start()
+
+    def teardown(self):
+        self.cache_patcher.stop()
+        shutil.rmtree(self.cache_path)
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch(self, m_package_version_for_hash):
+        m_package_version_for_hash.side_effect = \
+            lambda sha1, flavor, distro, distro_version: \
+            None if distro == 'centos' else '1.0'
+        result = util.prefetch_package_versions('sha1', self.distros)
+        assert result == {
+            'sha1': {
+                'ubuntu': {'20.04': {'default': '1.0'}},
+                'centos': {'8': {'default': None}},
+            }
+        }
+        assert m_package_version_for_hash.call_count == 2
+        assert len(os.listdir(self.cache_path)) == 2
+
+        # a second invocation is served from the cache
+        m_package_version_for_hash.reset_mock()
+        assert util.prefetch_package_versions('sha1', self.distros) == result
+        assert m_package_version_for_hash.call_count == 0
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch_expired(self, m_package_version_for_hash):
+        m_package_version_for_hash.side_effect = \
+            lambda sha1, flavor, distro, distro_version: \
+            None if distro == 'centos' else '1.0'
+        util.prefetch_package_versions('sha1', self.distros)
+        # missing packages are retried sooner than found ones
+        past = time.time() - util.PACKAGE_VERSION_MISSING_TTL - 1
+        for name in os.listdir(self.cache_path):
+            os.utime(os.path.join(self.cache_path, name), (past, past))
+        m_package_version_for_hash.reset_mock()
+        util.prefetch_package_versions('sha1', self.distros)
+        m_package_version_for_hash.assert_called_once_with(
+            'sha1', 'default', distro='centos', distro_version='8')
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch_no_cache(self, m_package_version_for_hash):
+        m_package_version_for_hash.return_value = '1.0'
+        pv = {'sha1': {'ubuntu': {'20.04': {'default': '0.9'}}}}
+        config.suite_package_versions_cache_path = None
+        util.prefetch_package_versions('sha1', self.distros, pv)
+        m_package_version_for_hash.assert_called_once_with(
+            'sha1', 'default', distro='centos', distro_version='8')
+        assert pv['sha1']['ubuntu']['20.04']['default'] == '0.9'
+        assert os.listdir(self.cache_path) == []
+
 class TestDistroDefaults(object):
     def setup(self):
         config.use_shaman = False
@@ -1,4 +1,7 @@
 import copy
+import gevent.pool
+import hashlib
+import json
 import logging
 import os
 import requests
@@ -6,15 +9,19 @@ import smtplib
 import socket
 import subprocess
 import sys
+import tempfile
+import time
 
 from email.mime.text import MIMEText
 
 import teuthology.lock.query
 import teuthology.lock.util
+import teuthology.schedule
 from teuthology import repo_utils
 
 from teuthology.config import config
-from teuthology.exceptions import BranchNotFoundError, ScheduleFailError
+from teuthology.exceptions import (BranchNotFoundError, ScheduleFailError,
+                                   VersionNotFoundError)
 from teuthology.misc import deep_merge
 from teuthology.repo_utils import fetch_qa_suite, fetch_teuthology
 from teuthology.orchestra.opsys import OS
@@ -23,11 +30,15 @@ from teuthology.repo_utils import build_git_url
 from teuthology.suite.build_matrix import combine_path
 from teuthology.task.install import get_flavor
 
+
 log = logging.getLogger(__name__)
 
 CONTAINER_DISTRO = 'centos/8'       # the one to check for build_complete
 CONTAINER_FLAVOR = 'default'
 
+# how long the absence of packages is remembered across invocations
+PACKAGE_VERSION_MISSING_TTL = 5 * 60
+
 
 def fetch_repos(branch, test_name):
     """
@@ -382,9 +393,10 @@ def get_package_versions(sha1, os_type, os_version, flavor,
 
     os_type = str(os_type)
 
-    os_types = package_versions.get(sha1, dict())
-    os_versions = os_types.get(os_type, dict())
-    flavors = os_versions.get(os_version, dict())
+    # create the nested dicts before querying, so that concurrent callers
+    # sharing package_versions do not clobber each other's results
+    flavors = package_versions.setdefault(sha1, dict()).setdefault(
+        os_type, dict()).setdefault(os_version, dict())
     if flavor not in flavors:
         package_version = package_version_for_hash(
             sha1,
@@ -393,13 +405,118 @@ def get_package_versions(sha1, os_type, os_version, flavor,
             distro_version=os_version,
         )
         flavors[flavor] = package_version
-        os_versions[os_version] = flavors
-        os_types[os_type] = os_versions
-        package_versions[sha1] = os_types
 
     return package_versions
 
 
+def prefetch_package_versions(sha1, distros, package_versions=None,
+                              max_workers=8):
+    """
+    Retrieve the package versions for the given sha1 and each of the given
+    (os_type, os_version, flavor) tuples at once, so that a later
+    get_package_versions() or has_packages_for_distro() call for any of them
+    does not need to ask gitbuilder/shaman.
+
+    Results are looked up in, and added to, the on-disk cache in
+    config.suite_package_versions_cache_path, which is shared between
+    teuthology-suite invocations. Anything not found there is queried
+    concurrently, at most max_workers at a time.
+
+    :param sha1:             The sha1 hash of the ceph version.
+    :param distros:          An iterable of (os_type, os_version, flavor)
+    :param package_versions: A dict as described in get_package_versions()
+    :param max_workers:      The maximum number of concurrent queries
+    :returns:                The updated package_versions dict
+    """
+    if package_versions is None:
+        package_versions = dict()
+
+    def known(os_type, os_version, flavor):
+        return flavor in package_versions.get(sha1, dict()).get(
+            os_type, dict()).get(os_version, dict())
+
+    def fetch(os_type, os_version, flavor):
+        try:
+            get_package_versions(sha1, os_type, os_version, flavor,
+                                 package_versions)
+        except VersionNotFoundError:
+            # leave it to get_package_versions() callers to deal with
+            return
+        if known(os_type, os_version, flavor):
+            _write_cached_package_version(
+                sha1, os_type, os_version, flavor,
+                package_versions[sha1][os_type][os_version][flavor])
+
+    pool = gevent.pool.Pool(max_workers)
+    for os_type, os_version, flavor in set(distros):
+        os_type = str(os_type)
+        if known(os_type, os_version, flavor):
+            continue
+        cached = _read_cached_package_version(
+            sha1, os_type, os_version, flavor)
+        if cached is not None:
+            package_versions.setdefault(sha1, dict()).setdefault(
+                os_type, dict()).setdefault(
+                os_version, dict())[flavor] = cached['version']
+            continue
+        pool.spawn(fetch, os_type, os_version, flavor)
+    pool.join(raise_error=True)
+    return package_versions
+
+
+def _package_version_cache_file(sha1, os_type, os_version, flavor):
+    cache_path = config.suite_package_versions_cache_path
+    if not cache_path:
+        return None
+    # the answer also depends on which build server we would ask
+    key = json.dumps([sha1, os_type, os_version, flavor, config.use_shaman,
+                      config.shaman_host, config.gitbuilder_host])
+    return os.path.join(cache_path, hashlib.sha1(key.encode()).hexdigest())
+
+
+def _read_cached_package_version(sha1, os_type, os_version, flavor):
+    """
+    :returns: A dict like {'version': version} if a fresh enough result is
+              in the cache, None otherwise. Missing packages are only
+              trusted for PACKAGE_VERSION_MISSING_TTL seconds, since they
+              may be built at any time.
+    """
+    cache_file = _package_version_cache_file(
+        sha1, os_type, os_version, flavor)
+    if cache_file is None:
+        return None
+    try:
+        age = time.time() - os.path.getmtime(cache_file)
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    ttl = config.suite_package_versions_cache_ttl
+    if not cached.get('version'):
+        ttl = min(ttl, PACKAGE_VERSION_MISSING_TTL)
+    if age > ttl:
+        return None
+    return cached
+
+
+def _write_cached_package_version(sha1, os_type, os_version, flavor,
+                                  version):
+    cache_file = _package_version_cache_file(
+        sha1, os_type, os_version, flavor)
+    if cache_file is None:
+        return
+    cache_path = os.path.dirname(cache_file)
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'w', dir=cache_path, prefix='.', delete=False) as f:
+            json.dump(dict(version=version), f)
+        os.rename(f.name, cache_file)
+    except OSError:
+        log.warning('Could not write package version cache file %s',
+                    cache_file, exc_info=True)
+
+
 def has_packages_for_distro(sha1, os_type, os_version, flavor,
                             package_versions=None):
     """
@@ -459,6 +576,20 @@ def teuthology_schedule(args, verbose, dry_run, log_prefix=''):
         subprocess.check_call(args=args)
 
 
+def teuthology_schedule_jobs(args_list):
+    """
+    Schedule several jobs without forking a teuthology-schedule process for
+    each of them. Each item of args_list is parsed exactly as
+    teuthology-schedule would parse its command line, and the resulting jobs
+    are queued over a single beanstalk connection.
+
+    :param args_list: A list of teuthology-schedule argument lists
+    """
+    teuthology.schedule.schedule_jobs(
+        [teuthology.schedule.parse_args(args) for args in args_list]
+    )
+
+
 def find_git_parent(project, sha1):
 
     base_url = config.githelper_base_url
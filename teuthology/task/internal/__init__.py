@@ -4,7 +4,7 @@ Note that there is no corresponding task defined for this module.  All of
 the calls are made from other modules, most notably teuthology/run.py
 """
 import contextlib
-import functools
+import gevent.pool
 import gzip
 import logging
 import os
@@ -23,6 +23,7 @@ from teuthology.config import config as teuth_config
 from teuthology.exceptions import ConfigError, VersionNotFoundError
 from teuthology.job_status import get_status, set_status
 from teuthology.orchestra import cluster, remote, run
+from teuthology.trace import tracer
 # the below import with noqa is to workaround run.py which does not support multilevel submodule import
 from teuthology.task.internal.redhat import (setup_cdn_repo, setup_base_repo,            # noqa
                                              setup_additional_repo,                      # noqa
@@ -30,6 +31,9 @@ from teuthology.task.internal.redhat import (setup_cdn_repo, setup_base_repo,
 
 log = logging.getLogger(__name__)
 
+# How many remotes to connect to at once
+CONNECT_PARALLELISM = 16
+
 
 @contextlib.contextmanager
 def base(ctx, config):
@@ -172,12 +176,24 @@ def add_remotes(ctx, config):
 
 def connect(ctx, config):
     """
-    Connect to all remotes in ctx.cluster
+    Connect to all remotes in ctx.cluster, at most CONNECT_PARALLELISM at a
+    time, and gather the facts about each of them that later tasks will
+    need.
     """
     log.info('Opening connections...')
-    for rem in ctx.cluster.remotes.keys():
+
+    def connect_one(rem):
         log.debug('connecting to %s', rem.name)
         rem.connect()
+        try:
+            rem.gather_facts()
+        except Exception:
+            # each fact will be looked up on its own when needed
+            log.warning('Could not gather facts about %s', rem.name,
+                        exc_info=True)
+
+    pool = gevent.pool.Pool(CONNECT_PARALLELISM)
+    pool.map(connect_one, ctx.cluster.remotes.keys())
 
 
 def push_inventory(ctx, config):
@@ -342,6 +358,73 @@ def fetch_binaries_for_coredumps(path, remote):
             remote.get_file(debug_path, coredump_path)
 
 
+def pull_archive(remote, archive_dir, path, compress_min_size):
+    """
+    Pull archive_dir from remote into path, followed by the binaries for any
+    coredumps found in it.
+
+    :returns: A dict with the number of bytes transferred, and the time it
+              took.
+    """
+    transferred = dict(bytes=0)
+
+    def write_to(src, tarinfo, local_path):
+        gzip_if_too_large(compress_min_size, src, tarinfo, local_path)
+        transferred['bytes'] += tarinfo.size
+
+    with tracer.span('archive %s' % remote.shortname, 'archive',
+                     host=remote.shortname) as span:
+        start = time.time()
+        misc.pull_directory(remote, archive_dir, path, write_to)
+        elapsed = time.time() - start
+        # Check for coredumps and pull binaries
+        fetch_binaries_for_coredumps(path, remote)
+        span.args['bytes'] = transferred['bytes']
+    return dict(
+        bytes=transferred['bytes'],
+        elapsed=round(elapsed, 3),
+        bytes_per_second=int(transferred['bytes'] / elapsed) if elapsed else 0,
+    )
+
+
+def transfer_archives(remotes, archive_dir, logdir, compress_min_size,
+                      parallelism=8, timer=None):
+    """
+    Pull archive_dir from each of the remotes into a subdirectory of logdir
+    named after it, at most parallelism remotes at a time.
+
+    Per-remote transfer statistics are logged and, if a timer is given,
+    recorded in it under 'archive'. If any of the transfers failed, the first
+    failure is raised once all of them are done.
+    """
+    pool = gevent.pool.Pool(max(1, parallelism))
+    greenlets = dict()
+    for rem in remotes:
+        path = os.path.join(logdir, rem.shortname)
+        greenlets[rem.shortname] = pool.spawn(
+            pull_archive, rem, archive_dir, path, compress_min_size)
+    pool.join()
+
+    stats = dict()
+    for shortname, greenlet in greenlets.items():
+        if greenlet.successful():
+            stats[shortname] = greenlet.value
+            log.info(
+                'Transferred %s from %s in %.1f seconds (%s/s)',
+                humanfriendly.format_size(greenlet.value['bytes']), shortname,
+                greenlet.value['elapsed'],
+                humanfriendly.format_size(greenlet.value['bytes_per_second']),
+            )
+        else:
+            log.error('Failed to transfer archived files from %s: %s',
+                      shortname, greenlet.exception)
+    if timer is not None:
+        timer.record('archive', stats)
+    for greenlet in greenlets.values():
+        if not greenlet.successful():
+            raise greenlet.exception
+
+
 def gzip_if_too_large(compress_min_size, src, tarinfo, local_path):
     if tarinfo.size >= compress_min_size:
         with gzip.open(local_path + '.gz', 'wb') as dest:
@@ -381,22 +464,19 @@ def archive(ctx, config):
             logdir = os.path.join(ctx.archive, 'remote')
             if (not os.path.exists(logdir)):
                 os.mkdir(logdir)
-            for rem in ctx.cluster.remotes.keys():
-                path = os.path.join(logdir, rem.shortname)
-                min_size_option = ctx.config.get('log-compress-min-size',
-                                                 '128MB')
-                try:
-                    compress_min_size_bytes = \
-                        humanfriendly.parse_size(min_size_option)
-                except humanfriendly.InvalidSize:
-                    msg = 'invalid "log-compress-min-size": {}'.format(min_size_option)
-                    log.error(msg)
-                    raise ConfigError(msg)
-                maybe_compress = functools.partial(gzip_if_too_large,
-                                                   compress_min_size_bytes)
-                misc.pull_directory(rem, archive_dir, path, maybe_compress)
-                # Check for coredumps and pull binaries
-                fetch_binaries_for_coredumps(path, rem)
+            min_size_option = ctx.config.get('log-compress-min-size',
+                                             '128MB')
+            try:
+                compress_min_size_bytes = \
+                    humanfriendly.parse_size(min_size_option)
+            except humanfriendly.InvalidSize:
+                msg = 'invalid "log-compress-min-size": {}'.format(min_size_option)
+                log.error(msg)
+                raise ConfigError(msg)
+            parallelism = ctx.config.get('archive-parallelism', 8)
+            transfer_archives(ctx.cluster.remotes.keys(), archive_dir, logdir,
+                              compress_min_size_bytes, parallelism,
+                              getattr(ctx, 'timer', None))
 
         log.info('Removing archive directory...')
         run.wait(
@@ -1,6 +1,7 @@
 import logging
 
 import teuthology.lock.query
+import teuthology.misc
 import teuthology.lock.util
 
 from teuthology.config import config as teuth_config
@@ -16,8 +17,11 @@ def check_lock(ctx, config, check_up=True):
         log.info('Lock checking disabled.')
         return
     log.info('Checking locks...')
-    for machine in ctx.config['targets'].keys():
-        status = teuthology.lock.query.get_status(machine)
+    machines = list(ctx.config['targets'].keys())
+    statuses = teuthology.lock.query.get_statuses(machines, keyed_by_name=True)
+    for machine in machines:
+        status = statuses.get(
+            teuthology.misc.canonicalize_hostname(machine, user=None))
         log.debug('machine status is %s', repr(status))
         assert status is not None, \
             'could not read lock status for {name}'.format(name=machine)
@@ -5,6 +5,7 @@ import teuthology.lock.ops
 import teuthology.lock.query
 import teuthology.lock.util
 from teuthology.job_status import get_status
+from teuthology.trace import tracer
 
 log = logging.getLogger(__name__)
 
@@ -20,7 +21,8 @@ def lock_machines(ctx, config):
     machine_type = config[1]
     total_requested = config[0]
     # We want to make sure there are always this many machines available
-    teuthology.lock.ops.block_and_lock_machines(ctx, total_requested, machine_type)
+    with tracer.span('lock %d %s' % (total_requested, machine_type), 'lock'):
+        teuthology.lock.ops.block_and_lock_machines(ctx, total_requested, machine_type)
     try:
         yield
     finally:
@@ -1,5 +1,10 @@
+import pytest
+
+from mock import Mock, patch
+
 from teuthology.config import FakeNamespace
 from teuthology.task import internal
+from teuthology.timer import Timer
 
 
 class TestInternal(object):
@@ -55,3 +60,38 @@ class TestInternal(object):
         assert internal.buildpackages_prep(self.ctx,
                                            self.ctx.config) == internal.BUILDPACKAGES_REMOVED
         assert self.ctx.config == {'tasks': []}
+
+    @patch('teuthology.task.internal.fetch_binaries_for_coredumps')
+    @patch('teuthology.task.internal.misc.pull_directory')
+    def test_transfer_archives(self, m_pull_directory, m_fetch_binaries):
+        def pull_directory(remote, remotedir, localdir, write_to):
+            if remote.shortname == 'bad':
+                raise RuntimeError('no route to host')
+            tarinfo = Mock(size=remote.size)
+            write_to(None, tarinfo, localdir + '/log')
+
+        m_pull_directory.side_effect = pull_directory
+        remotes = [Mock(shortname='a', size=100), Mock(shortname='b', size=0)]
+        timer = Timer()
+        with patch('teuthology.task.internal.gzip_if_too_large') as m_gzip:
+            internal.transfer_archives(
+                remotes, '/archive', '/logs', 1024, parallelism=1,
+                timer=timer)
+        assert m_gzip.call_count == 2
+        m_fetch_binaries.assert_any_call('/logs/a', remotes[0])
+        m_fetch_binaries.assert_any_call('/logs/b', remotes[1])
+        stats = timer.data['archive']
+        assert sorted(stats) == ['a', 'b']
+        assert stats['a']['bytes'] == 100
+        assert stats['b']['bytes'] == 0
+        assert set(stats['a']) == {'bytes', 'elapsed', 'bytes_per_second'}
+
+        # the other remotes are still transferred when one of them fails
+        m_fetch_binaries.reset_mock()
+        remotes.append(Mock(shortname='bad'))
+        with patch('teuthology.task.internal.gzip_if_too_large'):
+            with pytest.raises(RuntimeError):
+                internal.transfer_archives(
+                    remotes, '/archive', '/logs', 1024, timer=timer)
+        assert m_fetch_binaries.call_count == 2
+        assert sorted(timer.data['archive']) == ['a', 'b']
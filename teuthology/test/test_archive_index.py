@@ -0,0 +1,83 @@
+import json
+import os
+
+from teuthology import archive_index
+
+
+class TestRunIndex(object):
+    def make_job(self, run_dir, job_id, **yamls):
+        job_dir = os.path.join(run_dir, job_id)
+        os.mkdir(job_dir)
+        for name, content in yamls.items():
+            with open(os.path.join(job_dir, name + '.yaml'), 'w') as f:
+                f.write(content)
+        return job_dir
+
+    def test_record_job(self, tmpdir):
+        run_dir = str(tmpdir)
+        job_dir = self.make_job(run_dir, '1')
+        archive_index.record_job(
+            job_dir, dict(owner='me', machine_type='smithi', tasks=[]))
+        archive_index.record_job(
+            job_dir + '/', dict(status='fail', failure_reason='reasons'),
+            finished=True)
+        index = archive_index.RunIndex(run_dir)
+        assert index.read() == {
+            '1': dict(job_id='1', owner='me', machine_type='smithi',
+                      status='fail', failure_reason='reasons', finished=True),
+        }
+
+    def test_record_job_failure(self, tmpdir):
+        # the run directory does not exist; this must not raise
+        archive_index.record_job(
+            os.path.join(str(tmpdir), 'run', '1'), dict(owner='me'))
+
+    def test_partial_line(self, tmpdir):
+        run_dir = str(tmpdir)
+        index = archive_index.RunIndex(run_dir)
+        index.update('1', dict(owner='me'))
+        with open(index.path, 'a') as f:
+            f.write('{"job_id": "1", "sta')
+        assert index.read() == {'1': dict(job_id='1', owner='me')}
+
+    def test_jobs_reads_missing(self, tmpdir):
+        run_dir = str(tmpdir)
+        self.make_job(
+            run_dir, '1',
+            info='name: run\nowner: me\npid: 42\n',
+            summary='success: true\nduration: 3\n',
+        )
+        self.make_job(run_dir, '2', **{'orig.config': 'machine_type: smithi\n'})
+        os.mkdir(os.path.join(run_dir, 'not_a_job'))
+        index = archive_index.RunIndex(run_dir)
+        jobs = index.jobs()
+        assert jobs == {
+            '1': dict(job_id='1', name='run', owner='me', pid=42,
+                      status='pass', duration=3, finished=True),
+            '2': dict(job_id='2', machine_type='smithi'),
+        }
+        # looking jobs up does not write to the index
+        assert not os.path.exists(index.path)
+
+    def test_jobs_refreshes_unfinished(self, tmpdir):
+        run_dir = str(tmpdir)
+        self.make_job(run_dir, '1', summary='status: dead\n')
+        self.make_job(run_dir, '2')
+        index = archive_index.RunIndex(run_dir)
+        index.update('1', dict(owner='me'))
+        index.update('2', dict(owner='me'))
+        assert index.jobs() == {
+            '1': dict(job_id='1', owner='me', status='dead', finished=True),
+            '2': dict(job_id='2', owner='me'),
+        }
+
+    def test_rebuild(self, tmpdir):
+        run_dir = str(tmpdir)
+        self.make_job(run_dir, '1', summary='status: dead\n')
+        index = archive_index.RunIndex(run_dir)
+        index.update('1', dict(owner='stale'))
+        index.update('3', dict(owner='gone'))
+        index.rebuild()
+        with open(index.path) as f:
+            lines = [json.loads(line) for line in f]
+        assert lines == [dict(job_id='1', status='dead', finished=True)]
@@ -0,0 +1,170 @@
+import beanstalkc
+import os
+import yaml
+
+from mock import patch, Mock
+
+from teuthology import beanstalk
+
+
+class FakeConnection(object):
+    """
+    Just enough of a beanstalkc.Connection for a single tube
+    """
+    def __init__(self, tube, jobs):
+        self.tube = tube
+        # job ID -> (priority, run name, state)
+        self.jobs = jobs
+        self.reserved = list()
+        self.stats_calls = list()
+
+    def stats_job(self, jid):
+        self.stats_calls.append(jid)
+        if jid not in self.jobs:
+            raise beanstalkc.CommandFailed('stats-job', 'NOT_FOUND', [])
+        pri, name, state = self.jobs[jid]
+        return dict(id=jid, tube=self.tube, pri=pri, state=state)
+
+    def stats_tube(self, tube):
+        stats = dict(('current-jobs-' + state, 0) for state in
+                     ('ready', 'reserved', 'delayed', 'buried'))
+        for pri, name, state in self.jobs.values():
+            stats['current-jobs-' + state] += 1
+        return stats
+
+    def body(self, jid):
+        return yaml.safe_dump(dict(name=self.jobs[jid][1], description=''))
+
+    def peek(self, jid):
+        if jid not in self.jobs:
+            return None
+        return beanstalkc.Job(self, jid, self.body(jid), reserved=False)
+
+    def reserve(self, timeout=None):
+        ready = sorted(
+            (pri, jid) for (jid, (pri, name, state)) in self.jobs.items()
+            if state == 'ready'
+        )
+        if not ready:
+            return None
+        jid = ready[0][1]
+        pri, name, _ = self.jobs[jid]
+        self.jobs[jid] = (pri, name, 'reserved')
+        self.reserved.append(jid)
+        job = Mock(jid=jid, body=self.body(jid))
+        job.stats.return_value = self.stats_job(jid)
+        job.release.side_effect = \
+            lambda priority: self.jobs.update({jid: (pri, name, 'ready')})
+        return job
+
+    def delete(self, jid):
+        del self.jobs[jid]
+
+
+class TestQueueIndex(object):
+    def make_jobs(self):
+        return {
+            1: (100, 'run_a', 'ready'),
+            2: (50, 'run_b', 'ready'),
+            3: (100, 'run_b', 'ready'),
+            4: (100, 'run_a', 'reserved'),
+        }
+
+    def test_add_and_read(self, tmp_path):
+        index = beanstalk.QueueIndex('tube', str(tmp_path / 'queue'))
+        index.add([1, 2], 'run_a')
+        index.add(['3'], 'run_b')
+        assert index.read() == {'1': 'run_a', '2': 'run_a', '3': 'run_b'}
+
+    def test_reconcile(self, tmp_path):
+        conn = FakeConnection('tube', self.make_jobs())
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        index.add([1, 4, 5], 'run_a')
+        index.add([2, 3], 'run_b')
+        jobs = index.reconcile(conn)
+        assert list(jobs.items()) == [
+            ('2', dict(name='run_b', pri=50)),
+            ('1', dict(name='run_a', pri=100)),
+            ('3', dict(name='run_b', pri=100)),
+        ]
+        # nothing was reserved, and the job that is gone was forgotten
+        assert conn.reserved == []
+        assert index.read() == {
+            '1': 'run_a', '2': 'run_b', '3': 'run_b', '4': 'run_a'}
+
+    def test_reconcile_missing(self, tmp_path):
+        conn = FakeConnection('tube', self.make_jobs())
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        index.add([1], 'run_a')
+        jobs = index.reconcile(conn)
+        assert list(jobs) == ['2', '1', '3']
+        assert sorted(conn.reserved) == [1, 2, 3]
+        # the jobs went back into the tube
+        assert [conn.jobs[jid][2] for jid in (1, 2, 3)] == ['ready'] * 3
+        assert index.read() == {'1': 'run_a', '2': 'run_b', '3': 'run_b'}
+        conn.reserved = list()
+        index.reconcile(conn)
+        assert conn.reserved == []
+
+    def test_reconcile_pattern(self, tmp_path):
+        conn = FakeConnection('tube', self.make_jobs())
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        index.add([1, 4], 'run_a')
+        index.add([2, 3], 'run_b')
+        jobs = index.reconcile(conn, pattern='run_b')
+        assert list(jobs) == ['2', '3']
+        # only the jobs of run_b were looked up
+        assert sorted(conn.stats_calls) == [2, 3]
+        assert conn.reserved == []
+
+    def test_reconcile_pattern_stale(self, tmp_path):
+        conn = FakeConnection('tube', self.make_jobs())
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        # job 5 is gone, and job 1 is missing from the index; the number of
+        # jobs in the index still is that of the tube
+        index.add([4, 5], 'run_a')
+        index.add([2, 3], 'run_b')
+        jobs = index.reconcile(conn, pattern='run_b')
+        assert list(jobs) == ['2', '3']
+        assert conn.reserved == []
+        conn.delete(4)
+        # now they disagree: every job is checked, and the tube indexed
+        conn.stats_calls = list()
+        jobs = index.reconcile(conn, pattern='run_a')
+        assert list(jobs) == ['1']
+        assert conn.stats_calls[:2] == [4, 5]
+        assert sorted(conn.stats_calls[2:4]) == [2, 3]
+        assert sorted(conn.reserved) == [1, 2, 3]
+        assert index.read() == {'1': 'run_a', '2': 'run_b', '3': 'run_b'}
+
+    def test_update_keeps_added(self, tmp_path):
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        index.add([1, 2], 'run_a')
+        # a job put while the index was being reconciled
+        index.add([3], 'run_b')
+        index.update(gone=['1'], found={'4': 'run_c'})
+        assert index.read() == {'2': 'run_a', '3': 'run_b', '4': 'run_c'}
+        assert os.stat(index.lock_path).st_mode & 0o777 == index.file_mode
+
+    def test_shared_location(self, tmp_path):
+        with patch.object(beanstalk.config, 'queue_index_dir', None), \
+                patch.object(beanstalk.config, 'archive_base', str(tmp_path)):
+            index = beanstalk.QueueIndex('tube')
+        assert index.path == str(tmp_path / '.queue_index' / 'tube.jsonl')
+        index.add([1], 'run_a')
+        assert os.stat(index.path).st_mode & 0o777 == index.file_mode
+        index.write({'2': 'run_b'})
+        assert os.stat(index.path).st_mode & 0o777 == index.file_mode
+
+    @patch('teuthology.beanstalk.report.try_delete_jobs')
+    def test_walk_jobs_delete(self, m_try_delete_jobs, tmp_path):
+        conn = FakeConnection('tube', self.make_jobs())
+        index = beanstalk.QueueIndex('tube', str(tmp_path))
+        index.add([1, 4], 'run_a')
+        index.add([2, 3], 'run_b')
+        with patch.object(beanstalk.config, 'queue_index_dir', str(tmp_path)):
+            beanstalk.walk_jobs(conn, 'tube', beanstalk.JobDeleter('run_b'),
+                                pattern='run_b')
+        assert sorted(conn.jobs) == [1, 4]
+        assert conn.reserved == []
+        assert m_try_delete_jobs.call_count == 2
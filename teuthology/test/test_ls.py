@@ -1,8 +1,9 @@
+import os
 import pytest
 
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, ANY
 
-from teuthology import ls
+from teuthology import archive_index, ls
 
 
 class TestLs(object):
@@ -23,7 +24,31 @@ class TestLs(object):
         m_safe_load_all.return_value = [{"failure_reason": "reasons"}]
         ls.ls("some/archive/div", True)
 
-    @patch("teuthology.ls.open")
+    def test_ls_index(self, tmpdir, capsys):
+        run_dir = str(tmpdir)
+        for job_id in ("1", "2", "3"):
+            os.mkdir(os.path.join(run_dir, job_id))
+        with open(os.path.join(run_dir, "1", "summary.yaml"), "w") as f:
+            f.write("success: false\nowner: me\nduration: 12.5\n"
+                    "failure_reason: reasons\n")
+        archive_index.record_job(
+            os.path.join(run_dir, "2"), dict(owner="you", description="d"))
+        archive_index.record_job(
+            os.path.join(run_dir, "2"), dict(status="pass", duration=3),
+            finished=True)
+        with patch("teuthology.ls.print_debug_info") as m_print_debug_info:
+            ls.ls(run_dir, True)
+        m_print_debug_info.assert_called_once_with("3", ANY, run_dir)
+        assert capsys.readouterr().out.splitlines() == [
+            "1 fail me - 12s",
+            "    reasons",
+            "2 pass you d 3s",
+        ]
+        # listing jobs does not write to the index
+        index = archive_index.RunIndex(run_dir)
+        assert "1" not in index.read()
+
+    @patch("teuthology.archive_index.open")
     @patch("teuthology.ls.get_jobs")
     def test_ls_ioerror(self, m_get_jobs, m_open):
         m_get_jobs.return_value = ["1", "2"]
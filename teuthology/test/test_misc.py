@@ -386,3 +386,142 @@ class TestIsInDict(object):
 
     def test_nonmembership_with_presence_at_lower_level(self):
         assert not misc.is_in_dict('a', 'foo', {'a':{'a': 'foo'}})
+
+
+class TestSSHKeyscan(object):
+    def setup(self):
+        misc._host_keys.clear()
+        self.up = set()
+        self.scanned = []
+
+        def keyscan(hostnames):
+            self.scanned.append(list(hostnames))
+            return dict((name, 'ssh-rsa KEY-' + name)
+                        for name in hostnames if name in self.up)
+
+        self.patcher = patch('teuthology.misc._ssh_keyscan',
+                             side_effect=keyscan)
+        self.patcher.start()
+        self.patcher_sleep = patch('time.sleep')
+        self.patcher_sleep.start()
+
+    def teardown(self):
+        self.patcher.stop()
+        self.patcher_sleep.stop()
+
+    def test_retries_missing(self):
+        hosts = [misc.canonicalize_hostname('host%d' % i, user=None)
+                 for i in range(3)]
+        self.up.update(hosts[:2])
+        keys = misc.ssh_keyscan(hosts, _raise=False)
+        assert sorted(keys) == hosts[:2]
+        assert self.scanned == [hosts]
+        with pytest.raises(RuntimeError):
+            misc.ssh_keyscan(hosts)
+        # only the missing host was scanned again, five times
+        assert self.scanned[1:] == [hosts[2:]] * 5
+
+    def test_cache(self):
+        hosts = [misc.canonicalize_hostname('host%d' % i, user=None)
+                 for i in (1, 2)]
+        self.up.update(hosts)
+        misc.ssh_keyscan(hosts[:1])
+        assert misc.ssh_keyscan(hosts) == dict(
+            (host, 'ssh-rsa KEY-' + host) for host in hosts)
+        assert self.scanned == [hosts[:1], hosts[1:]]
+        misc.ssh_keyscan(hosts, max_age=0)
+        misc.forget_host_keys(hosts[:1])
+        misc.ssh_keyscan(hosts)
+        assert self.scanned[2:] == [hosts, hosts[:1]]
+
+    def test_ssh_keyscan_batches(self):
+        hosts = [misc.canonicalize_hostname('host%d' % i, user=None)
+                 for i in range(3)]
+        out = ''.join('%s ssh-rsa KEY-%s\n' % (h, h) for h in hosts[:2])
+        self.patcher.stop()
+        try:
+            with patch('teuthology.misc.subprocess.Popen') as m_popen, \
+                    patch('teuthology.misc.KEYSCAN_BATCH_SIZE', 2):
+                m_popen.return_value.communicate.side_effect = [
+                    (out.encode(), b'# host0 SSH-2.0\n'),
+                    (b'', b'host2: Connection refused\n'),
+                ]
+                keys = misc._ssh_keyscan(hosts)
+        finally:
+            self.patcher.start()
+        assert keys == dict(
+            (host, 'ssh-rsa KEY-' + host) for host in hosts[:2])
+        assert m_popen.call_args_list[0][1]['args'][-2:] == hosts[:2]
+        assert m_popen.call_args_list[1][1]['args'][-1:] == hosts[2:]
+
+
+class TestWaitForRemotes(object):
+    def make_remote(self, name, probes_until_up):
+        remote = Mock(hostname=name)
+        remote.name = 'ubuntu@' + name
+        remote.reconnect.return_value = True
+        self.probes[name] = 0
+        self.up_after[name] = probes_until_up
+        return remote
+
+    def probe(self, hostname, timeout=None):
+        self.probes[hostname] += 1
+        self.order.append(hostname)
+        return self.probes[hostname] > self.up_after[hostname]
+
+    def setup_method(self):
+        self.probes = dict()
+        self.up_after = dict()
+        self.order = list()
+        self.patcher = patch('teuthology.misc.ssh_banner_reachable',
+                             side_effect=self.probe)
+        self.patcher.start()
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_concurrent(self):
+        remotes = [self.make_remote('slow', 3), self.make_remote('fast', 0),
+                   self.make_remote('down', 1)]
+        remotes[2].reconnect.side_effect = [False, True]
+        returned = misc.wait_for_remotes(remotes, 5, interval=0.01)
+        assert sorted(returned) == sorted(r.name for r in remotes)
+        # the slow host did not hold up the others
+        assert self.order[:3] == ['slow', 'fast', 'down']
+        assert self.order.index('fast') < self.order.index('down')
+        assert returned['ubuntu@fast'] < returned['ubuntu@slow']
+        assert remotes[0].reconnect.call_count == 1
+        assert remotes[1].reconnect.call_count == 1
+        assert remotes[2].reconnect.call_count == 2
+
+    def test_timeout(self):
+        remotes = [self.make_remote('fast', 0),
+                   self.make_remote('gone', 10 ** 6)]
+        with pytest.raises(RuntimeError) as excinfo:
+            misc.wait_for_remotes(remotes, 0.1, interval=0.01,
+                                  max_interval=0.02)
+        assert 'ubuntu@gone' in str(excinfo.value)
+        assert 'ubuntu@fast' not in str(excinfo.value)
+        remotes[0].reconnect.assert_called_once()
+        remotes[1].reconnect.assert_not_called()
+        assert self.probes['gone'] > 3
+
+    def test_reconnect(self):
+        ctx = argparse.Namespace()
+        ctx.cluster = cluster.Cluster()
+        remote = self.make_remote('host1', 0)
+        ctx.cluster.add(remote, ['client.0'])
+        assert list(misc.reconnect(ctx, 5)) == ['ubuntu@host1']
+
+
+def test_ssh_banner_reachable():
+    import gevent.server
+    server = gevent.server.StreamServer(
+        ('127.0.0.1', 0), lambda sock, addr: sock.sendall(b'SSH-2.0-x\r\n'))
+    server.start()
+    try:
+        assert misc.ssh_banner_reachable('127.0.0.1', server.server_port)
+    finally:
+        server.stop()
+    assert not misc.ssh_banner_reachable(
+        '127.0.0.1', server.server_port, timeout=1)
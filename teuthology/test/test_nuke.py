@@ -1,4 +1,5 @@
 import datetime
+import gevent.subprocess
 import json
 import os
 import pytest
@@ -8,6 +9,8 @@ from unittest.mock import patch, Mock, DEFAULT, ANY
 
 from teuthology import nuke
 from teuthology import misc
+from teuthology.exceptions import CleanupError
+from teuthology.nuke import cleanup
 from teuthology.config import config
 from teuthology.dispatcher.supervisor import create_fake_context
 
@@ -288,3 +291,84 @@ def test_nuke_internal():
         nuke.nuke(ctx, True)
         m['nuke_helper'].assert_not_called()
         m['unlock_one'].assert_not_called()
+
+
+class TestCleanup(object):
+    def make_remote(self, package_type='deb', reimageable=False):
+        remote = Mock(shortname='host1', is_reimageable=reimageable)
+        remote.os.package_type = package_type
+        remote.os.name = 'ubuntu' if package_type == 'deb' else 'centos'
+        return remote
+
+    def step_names(self, remote, phase, **kwargs):
+        with patch.object(cleanup.install_task, 'get_package_list',
+                          return_value=dict(deb=['ceph'], rpm=['ceph'])):
+            steps = cleanup.get_steps(Mock(), remote, phase, **kwargs)
+        return [step.name for step in steps]
+
+    def test_get_steps(self):
+        remote = self.make_remote()
+        assert self.step_names(remote, 'pre-reboot') == [
+            'clear_firewall', 'stop_daemons', 'kill_daemons',
+            'kill_valgrind', 'dpkg_configure', 'remove_installed_packages',
+        ]
+        post = self.step_names(remote, 'post-reboot')
+        assert post[:2] == ['stop_daemons', 'kill_daemons']
+        assert 'remove_testing_tree' in post
+        assert 'remove_yum_timedhosts' not in post
+        assert post[-1] == 'remove_installed_packages'
+        assert 'remove_testing_tree' not in \
+            self.step_names(remote, 'post-reboot', keep_logs=True)
+        rpm_remote = self.make_remote('rpm', reimageable=True)
+        post = self.step_names(rpm_remote, 'post-reboot')
+        assert 'remove_yum_timedhosts' in post
+        assert 'remove_installed_packages' not in post
+        with pytest.raises(ValueError):
+            self.step_names(remote, 'mid-reboot')
+
+    def test_script(self, tmp_path):
+        steps = [
+            cleanup.Step('ok', 'true\necho "it\'s fine"'),
+            cleanup.Step('fails', 'false\necho unreachable', check=False),
+            cleanup.Step('times_out', 'sleep 10', timeout=1),
+        ]
+        script = tmp_path / 'cleanup.sh'
+        script.write_text(cleanup.build_script(steps))
+        with open(str(tmp_path / 'stderr'), 'w') as stderr:
+            stdout = gevent.subprocess.check_output(
+                ['bash', str(script)], stderr=stderr, universal_newlines=True)
+        stderr = (tmp_path / 'stderr').read_text()
+        assert "it's fine" in stderr
+        assert 'unreachable' not in stderr
+        report = cleanup.parse_results(steps, 'pre-reboot', stdout)
+        assert [(r['step'], r['status'], r['exitstatus']) for r in report] \
+            == [('ok', 'ok', 0), ('fails', 'failed', 1),
+                ('times_out', 'timeout', 124)]
+        assert report[2]['duration'] >= 1
+
+    def test_run_phase(self):
+        remote = self.make_remote(reimageable=True)
+        steps = [
+            cleanup.Step('one', 'true'),
+            cleanup.Step('two', 'true', check=False),
+            cleanup.Step('three', 'true'),
+        ]
+        output = '\n'.join([
+            'TEUTHOLOGY-CLEANUP-STEP one 0 10.0 10.5',
+            'TEUTHOLOGY-CLEANUP-STEP two 1 10.5 11.0',
+        ])
+        remote.run.return_value.stdout.getvalue.return_value = output
+        with patch.object(cleanup, 'get_steps', return_value=steps):
+            with pytest.raises(CleanupError) as excinfo:
+                cleanup.run_phase(Mock(), remote, 'post-reboot')
+        remote.run.assert_called_once()
+        assert remote.run.call_args[1]['args'] == ['sudo', 'bash', '-s']
+        assert [f['step'] for f in excinfo.value.failures] == ['three']
+        assert excinfo.value.failures[0]['status'] == 'not run'
+
+        output += '\nTEUTHOLOGY-CLEANUP-STEP three 0 11.0 11.2'
+        remote.run.return_value.stdout.getvalue.return_value = output
+        with patch.object(cleanup, 'get_steps', return_value=steps):
+            report = cleanup.run_phase(Mock(), remote, 'post-reboot')
+        assert [r['status'] for r in report] == ['ok', 'failed', 'ok']
+        assert report[0]['duration'] == pytest.approx(0.5)
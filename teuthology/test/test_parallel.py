@@ -1,3 +1,6 @@
+import gevent
+import pytest
+
 from teuthology.parallel import parallel
 
 
@@ -26,3 +29,69 @@ class TestParallel(object):
             for result in para:
                 in_set.remove(result)
 
+    def test_ordered(self):
+        delays = [0.05, 0.0, 0.03, 0.01]
+        with parallel(ordered=True) as para:
+            for i, delay in enumerate(delays):
+                para.spawn(sleep_then_return, delay, i)
+            assert list(para) == list(range(len(delays)))
+
+    def test_max_workers(self):
+        running = [0]
+        most_running = [0]
+
+        def count_running(item):
+            running[0] += 1
+            most_running[0] = max(most_running[0], running[0])
+            gevent.sleep(0.01)
+            running[0] -= 1
+            return item
+
+        with parallel(max_workers=2) as para:
+            for i in range(6):
+                para.spawn(count_running, i)
+            assert sorted(para) == list(range(6))
+        assert most_running[0] == 2
+
+    def test_records(self):
+        with parallel() as para:
+            para.spawn(sleep_then_return, 0.02, 'slow')
+            para.spawn(identity, 'fast')
+        slow, fast = para.records
+        assert (slow.index, fast.index) == (0, 1)
+        assert slow.func is sleep_then_return
+        assert slow.outcome == fast.outcome == 'ok'
+        assert slow.duration >= 0.02
+        assert fast.duration < slow.duration
+        assert 'identity' in repr(fast)
+
+    def test_failure_cancels_siblings(self):
+        finished = []
+
+        def fail():
+            raise RuntimeError('boom')
+
+        def slow():
+            gevent.sleep(10)
+            finished.append(True)
+
+        with pytest.raises(RuntimeError):
+            with parallel() as para:
+                para.spawn(slow)
+                para.spawn(fail)
+        assert [r.outcome for r in para.records] == ['cancelled', 'failed']
+        assert not para.group
+        assert finished == []
+
+    def test_with_block_raises_cancels(self):
+        with pytest.raises(ValueError):
+            with parallel() as para:
+                para.spawn(gevent.sleep, 10)
+                raise ValueError()
+        assert not para.group
+        assert para.records[0].outcome == 'cancelled'
+
+
+def sleep_then_return(delay, item):
+    gevent.sleep(delay)
+    return item
@@ -0,0 +1,114 @@
+import gzip
+import os
+import pytest
+import time
+
+from mock import patch
+
+from teuthology import prune
+from teuthology.archive_index import INDEX_FILE, RunIndex
+
+
+class TestPrune(object):
+    def make_job(self, run_dir, name, success=None, days=0, files=()):
+        job_dir = os.path.join(run_dir, name)
+        os.makedirs(job_dir)
+        if success is not None:
+            with open(os.path.join(job_dir, 'summary.yaml'), 'w') as f:
+                f.write('success: %s\n' % str(success).lower())
+        for path in files:
+            if path.endswith('/'):
+                os.makedirs(os.path.join(job_dir, path))
+            else:
+                with open(os.path.join(job_dir, path), 'w') as f:
+                    f.write('log line\n' * 100)
+        self.age(job_dir, days)
+        return job_dir
+
+    def age(self, path, days, recursive=True):
+        then = time.time() - days * 24 * 60 * 60
+        for dirpath, dirnames, filenames in os.walk(path):
+            if not recursive:
+                break
+            for name in filenames:
+                os.utime(os.path.join(dirpath, name), (then, then))
+        os.utime(path, (then, then))
+
+    def make_archive(self, tmpdir):
+        archive = str(tmpdir)
+        run = os.path.join(archive, 'run')
+        jobs = dict(
+            passed=self.make_job(run, '1', True, days=20),
+            failed=self.make_job(
+                run, '2', False, days=70,
+                files=['teuthology.log', 'remote/', 'data/']),
+            recent=self.make_job(
+                run, '3', True, days=1, files=['teuthology.log', 'remote/']),
+            preserved=self.make_job(
+                run, '4', True, days=20, files=[prune.PRESERVE_FILE]),
+        )
+        self.age(run, 70, recursive=False)
+        preserved_run = os.path.join(archive, 'preserved_run')
+        self.make_job(preserved_run, '5', True, days=20)
+        with open(os.path.join(preserved_run, prune.PRESERVE_FILE), 'w'):
+            pass
+        self.age(preserved_run, 70, recursive=False)
+        jobs['preserved_run'] = os.path.join(preserved_run, '5')
+        return jobs
+
+    def test_prune_archive(self, tmpdir):
+        jobs = self.make_archive(tmpdir)
+        stats = prune.prune_archive(str(tmpdir), 14, -1, 60, 30, workers=2)
+        assert not os.path.exists(jobs['passed'])
+        failed = jobs['failed']
+        assert not os.path.exists(os.path.join(failed, 'remote'))
+        assert not os.path.exists(os.path.join(failed, 'data'))
+        assert not os.path.exists(os.path.join(failed, 'teuthology.log'))
+        with gzip.open(os.path.join(failed, 'teuthology.log.gz')) as f:
+            assert f.read() == b'log line\n' * 100
+        assert sorted(os.listdir(jobs['recent'])) == \
+            ['remote', 'summary.yaml', 'teuthology.log']
+        assert os.path.exists(jobs['preserved'])
+        assert os.path.exists(jobs['preserved_run'])
+        assert stats['runs'] == 2
+        assert stats['jobs'] == 4
+        assert stats['removed'] == 3
+        assert stats['compressed'] == 1
+        assert stats['errors'] == 0
+
+    def test_prune_archive_dry_run(self, tmpdir):
+        jobs = self.make_archive(tmpdir)
+        stats = prune.prune_archive(
+            str(tmpdir), 14, -1, 60, 30, dry_run=True)
+        for job_dir in jobs.values():
+            assert os.path.exists(job_dir)
+        assert os.path.exists(os.path.join(jobs['failed'], 'remote'))
+        assert stats['removed'] == stats['compressed'] == 0
+
+    def test_prune_archive_index(self, tmpdir):
+        jobs = self.make_archive(tmpdir)
+        run = os.path.dirname(jobs['passed'])
+        mtime = os.stat(run).st_mtime
+        stats = prune.prune_archive(
+            str(tmpdir), -1, -1, -1, -1, dry_run=True, index=True)
+        assert stats['indexed'] == 0
+        assert not os.path.exists(os.path.join(run, INDEX_FILE))
+        stats = prune.prune_archive(str(tmpdir), -1, -1, -1, -1, index=True)
+        assert stats['indexed'] == 1
+        assert os.stat(run).st_mtime == mtime
+        assert sorted(RunIndex(run).read()) == ['1', '2', '3', '4']
+        preserved_run = os.path.dirname(jobs['preserved_run'])
+        assert not os.path.exists(os.path.join(preserved_run, INDEX_FILE))
+        stats = prune.prune_archive(str(tmpdir), -1, -1, -1, -1, index=True)
+        assert stats['indexed'] == 0
+
+    def test_io_budget(self):
+        budget = prune.IOBudget(iops=10, bandwidth=100)
+        with patch('teuthology.prune.time') as m_time:
+            m_time.time.return_value = 1000
+            budget.consume()
+            m_time.sleep.assert_not_called()
+            budget.consume(nbytes=50)
+            m_time.sleep.assert_called_once_with(pytest.approx(0.1))
+            budget.consume()
+            m_time.sleep.assert_called_with(pytest.approx(0.6))
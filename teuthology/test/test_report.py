@@ -1,5 +1,6 @@
 import yaml
 import json
+from mock import Mock
 from teuthology.test import fake_archive
 from teuthology import report
 
@@ -75,3 +76,94 @@ class TestSerializer(object):
         assert full_obj == out_obj
 
 
+
+
+class TestReporter(object):
+    def setup(self):
+        self.archive = fake_archive.FakeArchive()
+        self.archive.setup()
+        self.archive_base = self.archive.archive_base
+        self.reporter = report.ResultsReporter(
+            archive_base=self.archive_base, base_uri='http://paddles',
+            workers=4, bulk=True)
+        self.reporter.batch_size = 2
+        self.reporter.session = Mock()
+        self.run_name = 'test_report'
+        jobs = self.archive.create_fake_run(
+            self.run_name, 5, 'examples/3node_ceph.yaml', num_hung=5)
+        self.job_ids = sorted(str(job['job_id']) for job in jobs)
+
+    def teardown(self):
+        self.archive.teardown()
+
+    def response(self, status_code, message=None):
+        return Mock(status_code=status_code,
+                    json=Mock(return_value=dict(message=message)))
+
+    def test_report_jobs_bulk(self):
+        def post(uri, data, headers):
+            if uri.endswith('/bulk/'):
+                assert len(json.loads(data)) == 2
+            return self.response(200)
+        self.reporter.session.post.side_effect = post
+        self.reporter.report_jobs(self.run_name, self.job_ids)
+        uris = [c[0][0] for c in self.reporter.session.post.call_args_list]
+        bulk_uri = 'http://paddles/runs/test_report/jobs/bulk/'
+        assert uris.count(bulk_uri) == 2
+        # the last batch has a single job
+        assert uris.count('http://paddles/runs/test_report/jobs/') == 1
+        assert self.reporter.bulk_supported is True
+
+    def test_report_jobs_bulk_off(self):
+        reporter = report.ResultsReporter(
+            archive_base=self.archive_base, base_uri='http://paddles')
+        assert reporter.bulk_supported is False
+        reporter.session = Mock()
+        reporter.session.post.return_value = self.response(200)
+        reporter.report_jobs(self.run_name, self.job_ids)
+        uris = [c[0][0] for c in reporter.session.post.call_args_list]
+        assert uris == ['http://paddles/runs/test_report/jobs/'] * 5
+
+    def test_report_jobs_bulk_no_run(self):
+        def post(uri, data, headers):
+            if uri.endswith('/bulk/'):
+                return self.response(404)
+            return self.response(200)
+        self.reporter.session.post.side_effect = post
+        # the run does not exist yet
+        self.reporter.session.head.return_value = self.response(404)
+        self.reporter.report_batch(self.run_name, self.job_ids[:2])
+        assert self.reporter.bulk_supported is None
+        uris = [c[0][0] for c in self.reporter.session.post.call_args_list]
+        assert uris.count('http://paddles/runs/test_report/jobs/') == 2
+
+    def test_report_jobs_no_bulk(self):
+        def post(uri, data, headers):
+            if uri.endswith('/bulk/'):
+                return self.response(405)
+            return self.response(400, "job with job_id %s already exists" %
+                                 json.loads(data)['job_id'])
+        self.reporter.session.post.side_effect = post
+        self.reporter.session.put.return_value = self.response(200)
+        self.reporter.report_jobs(self.run_name, self.job_ids, dead=True)
+        assert self.reporter.bulk_supported is False
+        uris = [c[0][0] for c in self.reporter.session.post.call_args_list]
+        assert uris.count('http://paddles/runs/test_report/jobs/bulk/') == 1
+        assert uris.count('http://paddles/runs/test_report/jobs/') == 5
+        put_calls = self.reporter.session.put.call_args_list
+        assert sorted(c[0][0] for c in put_calls) == [
+            'http://paddles/runs/test_report/jobs/%s/' % job_id
+            for job_id in self.job_ids]
+        for c in put_calls:
+            assert json.loads(c[1]['data'])['status'] == 'dead'
+
+    def test_report_jobs_bulk_not_found(self):
+        def post(uri, data, headers):
+            if uri.endswith('/bulk/'):
+                return self.response(404)
+            return self.response(200)
+        self.reporter.session.post.side_effect = post
+        # the run exists, so the bulk endpoint is what is missing
+        self.reporter.session.head.return_value = self.response(200)
+        self.reporter.report_jobs(self.run_name, self.job_ids)
+        assert self.reporter.bulk_supported is False
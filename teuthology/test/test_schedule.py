@@ -1,4 +1,8 @@
-from teuthology.schedule import build_config
+import pytest
+
+from mock import patch
+
+from teuthology.schedule import build_config, schedule_jobs
 from teuthology.misc import get_user
 
 
@@ -43,3 +47,74 @@ class TestSchedule(object):
         job_dict = build_config(self.basic_args)
         assert job_dict['owner'] == 'scheduled_%s' % get_user()
 
+
+
+class TestScheduleJobs(object):
+    def make_args(self, description, **kwargs):
+        args = dict(TestSchedule.basic_args)
+        args.update({
+            '--description': description,
+            '--email': None,
+            '--timeout': None,
+            '--last-in-suite': False,
+            '--first-in-suite': False,
+            '--seed': None,
+            '--subset': None,
+            '--dry-run': False,
+            '--queue-backend': 'beanstalk',
+            '--num': '1',
+        })
+        args.update(kwargs)
+        return args
+
+    @patch('teuthology.schedule.config')
+    @patch('teuthology.schedule.report.ResultsReporter')
+    @patch('teuthology.schedule.teuthology.beanstalk.QueueIndex')
+    @patch('teuthology.schedule.report.try_push_jobs_info')
+    @patch('teuthology.schedule.teuthology.beanstalk.connect')
+    def test_single_connection(self, m_connect, m_try_push_jobs_info,
+                               m_queue_index, m_reporter, m_config):
+        m_config.results_server = 'http://results.example.com'
+        m_beanstalk = m_connect.return_value
+        m_beanstalk.put.side_effect = [1, 2, 3]
+        puts_before_push = list()
+        m_try_push_jobs_info.side_effect = lambda *args, **kwargs: \
+            puts_before_push.append(m_beanstalk.put.call_count)
+        args_list = [
+            self.make_args('DESC1'),
+            self.make_args('DESC2', **{'--num': '2'}),
+        ]
+        schedule_jobs(args_list)
+        m_connect.assert_called_once_with()
+        assert m_beanstalk.put.call_count == 3
+        m_beanstalk.close.assert_called_once_with()
+        # each job's status is pushed as soon as it is put, not at the end
+        assert puts_before_push == [1, 3]
+        m_reporter.assert_called_once_with()
+        queued = list()
+        for call in m_try_push_jobs_info.call_args_list:
+            jobs, extra_info = call[0]
+            assert extra_info == dict(status='queued')
+            assert call[1] == dict(reporter=m_reporter.return_value)
+            queued.extend(jobs)
+        assert [(job['description'], job['job_id']) for job in queued] == \
+            [('DESC1', '1'), ('DESC2', '2'), ('DESC2', '3')]
+        m_queue_index.assert_called_with('tala')
+        assert [c[0] for c in m_queue_index.return_value.add.call_args_list] \
+            == [(['1'], 'NAME'), (['2', '3'], 'NAME')]
+
+    @patch('teuthology.schedule.teuthology.beanstalk.QueueIndex')
+    @patch('teuthology.schedule.report.try_push_jobs_info')
+    @patch('teuthology.schedule.teuthology.beanstalk.connect')
+    def test_no_status_for_last_in_suite(self, m_connect,
+                                         m_try_push_jobs_info,
+                                         m_queue_index):
+        m_connect.return_value.put.return_value = 1
+        schedule_jobs([self.make_args('DESC', **{'--last-in-suite': True})])
+        m_try_push_jobs_info.assert_not_called()
+
+    @patch('teuthology.schedule.teuthology.beanstalk.connect')
+    def test_bad_name(self, m_connect):
+        with pytest.raises(ValueError):
+            schedule_jobs([self.make_args('DESC', **{'--name': '12'})])
+        m_connect.assert_not_called()
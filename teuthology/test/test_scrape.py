@@ -1,5 +1,7 @@
 from __future__ import with_statement
 
+import difflib
+import gzip
 import os
 import shutil
 import tempfile
@@ -44,21 +46,6 @@ class FakeResultDir(object):
 class TestScrape(object):
     """Tests for teuthology.scrape"""
 
-    def test_grep(self):
-        with FakeResultDir() as d:
-            filepath = os.path.join(d.path, "scrapetest.txt")
-            with open(filepath, 'w') as f:
-                f.write("Ceph is an open-source software storage platform\n\
-                        Teuthology is used for testing.")
-
-            #System level grep is called
-            value1 = scrape.grep(filepath, "software")
-            value2 = scrape.grep(filepath, "device")
-
-            assert value1 ==\
-                ['Ceph is an open-source software storage platform', '']
-            assert value2 == []
-
     def test_job(self):
         with FakeResultDir() as d:
             job = scrape.Job(d.path, 1)
@@ -165,3 +152,56 @@ class TestScrape(object):
         assert os.path.exists(os.path.join(d.path, "scrape.log"))
 
         shutil.rmtree(d.path)
+
+    def test_scan_log(self, tmpdir):
+        lines = ["2014-08-22T20:07:18.668 INFO:teuthology:foo\n"] * 1000 + [
+            "INFO:tasks.ceph.osd.1.smithi001.stderr: ceph version 1000\n",
+            "INFO:tasks.ceph.osd.1.smithi001.stderr: 1: (foo()+0x1)\n",
+            "INFO:tasks.ceph.osd.1.smithi001.stderr: FAILED assert(x)\n",
+            "INFO:tasks.ceph.osd.1.smithi001.stderr: NOTE: a copy of the executable\n",
+            " ceph version 2000\n",
+            " NOTE: a copy of the executable\n",
+            "ERROR:tasks.ceph:saw valgrind issue   <kind>Leak</kind> in /var/log/ceph/valgrind/osd.3.log.gz\n",
+        ]
+        path = str(tmpdir.join("ceph-osd.1.log.gz"))
+        with gzip.open(path, "wt") as f:
+            f.writelines(lines)
+
+        found = scrape.scan_log(path, chunk_size=100)
+        assert found.backtrace == "ceph version 1000\n 1: (foo()+0x1)\n" \
+            " FAILED assert(x)"
+        assert found.assertion == "FAILED assert(x)"
+        # the scan stopped at the first backtrace
+        assert found.valgrind == []
+
+        found = scrape.scan_log(path, stop_at_backtrace=False, chunk_size=100)
+        assert found.backtrace.startswith("ceph version 1000")
+        assert found.valgrind == [lines[-1].rstrip("\n")]
+
+    def test_crashed_daemon(self):
+        with FakeResultDir(blank_backtrace=True) as d:
+            with open(os.path.join(d.path, "teuthology.log"), "a") as f:
+                f.write("INFO:tasks.ceph.osd.1.smithi001.stderr:"
+                        "*** command crashed with signal 6\n")
+            log_dir = os.path.join(d.path, "remote", "smithi001", "log")
+            os.makedirs(log_dir)
+            with gzip.open(os.path.join(log_dir, "ceph-osd.1.log.gz"), "wt") as f:
+                f.write(" ceph version 1000\n FAILED assert(x)\n"
+                        " NOTE: a copy of the executable\n")
+            job = scrape.Job(d.path, 1)
+            assert job.get_backtrace() == "ceph version 1000\n FAILED assert(x)"
+            assert job.get_assertion() == "FAILED assert(x)"
+
+    def test_similar(self):
+        frame = " {0}: (ceph::osd::OSD::handle_op_{1}(OpRequest*)+0x{0:x}) [0x5581{0:08x}]\n"
+        bt1 = "".join(frame.format(i, "read") for i in range(100))
+        bt2 = "".join(frame.format(i, "read") for i in range(1, 101))
+        bt3 = "".join(frame.format(i * 7, "write") for i in range(50))
+        texts = [bt1, bt2, bt3, "a" * 2000, "b" * 2000,
+                 "Dummy reason", "Dummy dummy", "foo", "bar"]
+        for a in texts:
+            for b in texts:
+                ratio = difflib.SequenceMatcher(None, a, b).ratio()
+                assert scrape.similar(a, b) == (ratio > 0.5)
+        assert scrape.similar(bt1, bt2)
+        assert not scrape.similar(bt1, bt3)
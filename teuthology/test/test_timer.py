@@ -26,6 +26,14 @@ class TestTimer(object):
         assert [m['message'] for m in self.timer.data['marks']] == \
             ['0', '1', '2', '3', '4']
 
+    def test_record(self):
+        self.timer = timer.Timer()
+        self.timer.record('archive', dict(host=dict(bytes=1)))
+        assert self.timer.data == dict(archive=dict(host=dict(bytes=1)))
+        self.timer.mark('event')
+        assert self.timer.data['archive'] == dict(host=dict(bytes=1))
+        assert len(self.timer.data['marks']) == 1
+
     def test_intervals(self):
         fake_time = MagicMock()
         with patch('teuthology.timer.time.time', fake_time):
@@ -0,0 +1,142 @@
+import json
+
+from datetime import timedelta
+
+import gevent
+
+from mock import Mock
+from pytest import fixture
+
+from teuthology import trace
+
+
+class TestTracer(object):
+    @fixture
+    def tracer(self, tmp_path):
+        tracer = trace.Tracer()
+        tracer.open(str(tmp_path / 'trace.jsonl'))
+        yield tracer
+        tracer.close()
+
+    def read(self, tracer):
+        return dict((span['name'], span) for span in trace.read(tracer.path))
+
+    def test_disabled(self):
+        tracer = trace.Tracer()
+        assert tracer.span('a', 'x') is trace.NULL_SPAN
+        assert tracer.begin_task('a') is trace.NULL_SPAN
+        with tracer.span('a', 'x') as span:
+            span.args['key'] = 'value'
+        assert tracer.tasks == []
+
+    def test_nesting(self, tracer):
+        with tracer.span('outer', 'x'):
+            with tracer.span('inner', 'x', key='value'):
+                pass
+            span = tracer.begin('other', 'y')
+        span.finish(status='failed')
+        spans = self.read(tracer)
+        assert spans['outer']['parent'] is None
+        assert spans['inner']['parent'] == spans['outer']['id']
+        assert spans['inner']['args'] == dict(key='value')
+        assert spans['other']['parent'] == spans['outer']['id']
+        assert spans['other']['status'] == 'failed'
+        assert spans['inner']['dur'] <= spans['outer']['dur']
+
+    def test_error(self, tracer):
+        try:
+            with tracer.span('a', 'x'):
+                raise ValueError('oops')
+        except ValueError:
+            pass
+        span = self.read(tracer)['a']
+        assert span['status'] == 'error'
+        assert 'oops' in span['args']['error']
+
+    def test_task_parent(self, tracer):
+        task = tracer.begin_task('task')
+
+        def command():
+            tracer.begin('command', 'command').finish()
+
+        gevent.spawn(command).join()
+        task.finish()
+        tracer.begin('after', 'command').finish()
+        spans = self.read(tracer)
+        assert spans['command']['parent'] == spans['task']['id']
+        assert spans['command']['tid'] != spans['task']['tid']
+        assert spans['after']['parent'] is None
+
+    def test_long_name(self, tracer):
+        tracer.begin('x' * 1000, 'command').finish()
+        (span,) = trace.read(tracer.path)
+        assert len(span['name']) == trace.MAX_NAME_LENGTH
+
+    def test_record_response(self, tracer, monkeypatch):
+        monkeypatch.setattr(trace, 'tracer', tracer)
+        response = Mock(
+            status_code=404, ok=False, elapsed=timedelta(seconds=2))
+        response.request.method = 'GET'
+        response.request.url = 'http://paddles/runs/'
+        trace.record_response(response)
+        span = self.read(tracer)['GET http://paddles/runs/']
+        assert span['cat'] == 'http'
+        assert span['status'] == 'failed'
+        assert span['args'] == dict(status_code=404)
+        assert round(span['dur']) == 2
+
+
+def make_span(id, name, cat, ts, dur, parent=None):
+    return dict(id=id, parent=parent, name=name, cat=cat, ts=ts, dur=dur,
+                tid=1, status='ok', args=dict())
+
+
+class TestSummary(object):
+    spans = [
+        make_span(2, 'cmd 1', 'command', 101, 5, parent=1),
+        make_span(3, 'cmd 2', 'command', 107, 30, parent=1),
+        make_span(4, 'GET /', 'http', 140, 1, parent=5),
+        make_span(5, 'nested', 'archive', 139, 2, parent=1),
+        make_span(1, 'install', 'task', 100, 50),
+    ]
+
+    def test_read(self, tmp_path):
+        path = tmp_path / 'trace.jsonl'
+        lines = [json.dumps(span) for span in self.spans]
+        path.write_text('\n'.join(lines) + '\n{"id": 6, "na')
+        assert trace.read(str(path)) == self.spans
+
+    def test_summarize(self):
+        summary = trace.summarize(self.spans, top=2)
+        assert summary['elapsed'] == 50
+        assert summary['categories']['command'] == dict(
+            count=2, total=35, max=30)
+        (task,) = summary['tasks']
+        assert task['name'] == 'install'
+        assert task['children'] == dict(command=35, http=1, archive=2)
+        assert [span['name'] for span in summary['slowest']] == \
+            ['cmd 2', 'cmd 1']
+        text = trace.format_summary(summary)
+        assert 'install (command 35.0s, archive 2.0s, http 1.0s)' in text
+
+    def test_summarize_empty(self):
+        assert trace.format_summary(trace.summarize([])) == 'Elapsed: 0.0s' \
+            '\n\nBy category:'
+
+    def test_to_chrome(self):
+        events = trace.to_chrome(self.spans)['traceEvents']
+        assert events[0] == dict(
+            name='cmd 1', cat='command', ph='X', ts=101000000,
+            dur=5000000, pid=1, tid=1, args=dict(status='ok'))
+
+    def test_main(self, tmp_path, capsys):
+        path = tmp_path / 'trace.jsonl'
+        path.write_text(
+            '\n'.join(json.dumps(span) for span in self.spans) + '\n')
+        chrome = tmp_path / 'chrome.json'
+        trace.main({'<path>': str(tmp_path), '--top': '3',
+                    '--chrome': None})
+        assert 'Slowest:' in capsys.readouterr().out
+        trace.main({'<path>': str(path), '--top': '3',
+                    '--chrome': str(chrome)})
+        assert len(json.loads(chrome.read_text())['traceEvents']) == 5
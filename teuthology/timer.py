@@ -33,6 +33,7 @@ class Timer(object):
         self.path = path
         self.sync = sync
         self.marks = list()
+        self.extra = dict()
         self.start_time = None
         self.start_string = None
 
@@ -55,6 +56,18 @@ class Timer(object):
         if self.sync:
             self.write()
 
+    def record(self, key, value):
+        """
+        Store additional data, which self.data will contain under key
+
+        :param key:   A top-level key not used by self.data itself, e.g.
+                      'archive'
+        :param value: Anything yaml can represent
+        """
+        self.extra[key] = value
+        if self.sync:
+            self.write()
+
     def _mark_start(self, message):
         """
         Create the initial time mark
@@ -89,10 +102,11 @@ class Timer(object):
              ],
              }
 
-        'start' and 'end' times are in UTC.
+        'start' and 'end' times are in UTC. Anything passed to self.record()
+        is included as well.
         """
         if not self.start_string:
-            return dict()
+            return dict(self.extra)
         if len(self.marks) <= 1:
             end_interval = 0
         else:
@@ -104,6 +118,7 @@ class Timer(object):
             end=self.get_datetime_string(end_time),
             elapsed=end_interval,
         )
+        result.update(self.extra)
         return result
 
     def write(self):
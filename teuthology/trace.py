@@ -0,0 +1,400 @@
+"""
+Record where a job spends its time, as a trace of nested spans.
+
+Each span covers one task, remote command, archive transfer, wait for
+machines or HTTP request. Spans are appended to the trace file as they
+finish, one JSON object per line, so a trace is usable even if the job never
+finished. Each line looks like::
+
+    {"id": 7, "parent": 2, "name": "smithi001: sudo ceph health",
+     "cat": "command", "ts": 1454455191.25, "dur": 0.734, "tid": 3,
+     "status": "ok", "args": {"host": "smithi001", "exitstatus": 0}}
+
+'ts' is when the span started, in seconds since the epoch, and 'dur' how
+many seconds it lasted. 'parent' is the id of the span it is nested in: the
+enclosing span of the same greenlet, or failing that, the innermost task
+still running. 'tid' tells the greenlets apart.
+
+Use summarize() and format_summary(), or the teuthology-trace command, to
+see where the time went, and to_chrome() to load a trace into
+chrome://tracing or Perfetto.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+import gevent
+
+log = logging.getLogger(__name__)
+
+# The longest span name to record; commands can be very long
+MAX_NAME_LENGTH = 120
+
+
+class Span(object):
+    """
+    An interval of time spent on something
+
+    Spans are created by Tracer.span() and Tracer.begin(), and recorded when
+    finish() is called. A span can be used as a context manager, in which
+    case it is finished when the block exits.
+    """
+    def __init__(self, tracer, name, category, parent, args):
+        self.tracer = tracer
+        self.id = next(tracer.ids)
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.args = args
+        self.tid = tracer.get_tid()
+        self.start = time.time()
+        self.end = None
+        self.status = None
+
+    def finish(self, status='ok', **args):
+        """
+        Record the span, unless that was already done
+
+        :param status: 'ok', or what went wrong
+        :param args:   Anything to add to the span's args
+        """
+        if self.end is not None:
+            return
+        self.end = time.time()
+        self.status = status
+        self.args.update(args)
+        self.tracer.write(self)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('id', self.id),
+            ('parent', self.parent),
+            ('name', self.name),
+            ('cat', self.category),
+            ('ts', round(self.start, 6)),
+            ('dur', round(self.end - self.start, 6)),
+            ('tid', self.tid),
+            ('status', self.status),
+            ('args', self.args),
+        ])
+
+    def __enter__(self):
+        self.tracer.push(self)
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.tracer.pop(self)
+        if value is None:
+            self.finish()
+        else:
+            self.finish(status='error', error=repr(value))
+
+    def __repr__(self):
+        return 'Span({name!r}, {cat!r})'.format(
+            name=self.name, cat=self.category)
+
+
+class NullSpan(object):
+    """
+    What Tracer hands out while it is not recording
+    """
+    id = None
+
+    @property
+    def args(self):
+        return dict()
+
+    def finish(self, status='ok', **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """
+    Writes spans to a trace file, once open() has been called
+    """
+    def __init__(self):
+        self.path = None
+        self.file = None
+        self.ids = itertools.count(1)
+        self.tids = dict()
+        self.local = threading.local()
+        self.tasks = list()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def open(self, path):
+        """
+        Start appending spans to path
+        """
+        self.close()
+        try:
+            # line buffered, so that each span is written as soon as it ends
+            self.file = open(path, 'a', buffering=1)
+        except Exception:
+            log.exception("Failed to open %s; not tracing", path)
+            return
+        self.path = path
+        log.debug('Writing a trace to %s', path)
+
+    def close(self):
+        """
+        Stop recording spans
+        """
+        if self.file is not None:
+            self.file.close()
+        self.path = None
+        self.file = None
+        self.tasks = list()
+        self.tids = dict()
+
+    def span(self, name, category, **args):
+        """
+        :returns: A Span, to be used as a context manager. Spans begun inside
+                  the block by the same greenlet are nested in it.
+        """
+        return self.begin(name, category, **args)
+
+    def begin(self, name, category, **args):
+        """
+        :returns: A Span which lasts until its finish() is called, e.g. by a
+                  different greenlet
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return self._new_span(name, category, args)
+
+    def begin_task(self, name, **args):
+        """
+        Like begin(), but spans without another parent are nested in the
+        returned span until it is finished
+        """
+        span = self.begin(name, 'task', **args)
+        if span is not NULL_SPAN:
+            self.tasks.append(span)
+        return span
+
+    def record(self, name, category, start, end, status='ok', **args):
+        """
+        Record a span of something that has already happened
+        """
+        if not self.enabled:
+            return
+        span = self._new_span(name, category, args)
+        span.start = start
+        span.end = end
+        span.status = status
+        self.write(span)
+
+    def _new_span(self, name, category, args):
+        if len(name) > MAX_NAME_LENGTH:
+            name = name[:MAX_NAME_LENGTH - 3] + '...'
+        return Span(self, name, category, self.get_parent(), args)
+
+    def get_parent(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            return stack[-1].id
+        if self.tasks:
+            return self.tasks[-1].id
+        return None
+
+    def get_tid(self):
+        """
+        :returns: A small number identifying the current greenlet
+        """
+        return self.tids.setdefault(id(gevent.getcurrent()),
+                                    len(self.tids) + 1)
+
+    def push(self, span):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = list()
+        self.local.stack.append(span)
+
+    def pop(self, span):
+        stack = getattr(self.local, 'stack', [])
+        if span in stack:
+            stack.remove(span)
+
+    def write(self, span):
+        if span in self.tasks:
+            self.tasks.remove(span)
+        if not self.enabled:
+            return
+        try:
+            self.file.write(json.dumps(span.to_dict(), default=str) + '\n')
+        except Exception:
+            log.exception("Failed to write to %s; no longer tracing",
+                          self.path)
+            self.close()
+
+
+tracer = Tracer()
+
+
+def record_response(response, *args, **kwargs):
+    """
+    A requests response hook recording a span for each HTTP request, e.g.::
+
+        session.hooks['response'].append(record_response)
+
+    The span lasts until the response's headers were received.
+    """
+    if not tracer.enabled:
+        return
+    end = time.time()
+    request = response.request
+    tracer.record(
+        '{method} {url}'.format(method=request.method, url=request.url),
+        'http',
+        end - response.elapsed.total_seconds(),
+        end,
+        status='ok' if response.ok else 'failed',
+        status_code=response.status_code,
+    )
+
+
+def read(path):
+    """
+    :returns: The spans in the trace at path, as dicts. Lines which cannot be
+              parsed, like one cut short when the job died, are skipped.
+    """
+    spans = list()
+    with open(path) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                log.warning('Skipping a malformed line of %s', path)
+    return spans
+
+
+def summarize(spans, top=10):
+    """
+    :param spans: Spans, as returned by read()
+    :param top:   How many of the slowest spans to list
+    :returns:     A dict with the keys:
+
+        'elapsed':    Seconds from the first span's start to the last's end
+        'categories': For each category, the 'count' of its spans, their
+                      'total' duration and the 'max'imum one
+        'tasks':      For each task span, its 'name' and 'dur'ation, and how
+                      many seconds of that went to each category of the
+                      spans nested in it, under 'children'
+        'slowest':    The top slowest spans which are not tasks
+    """
+    if not spans:
+        return dict(elapsed=0, categories=dict(), tasks=list(), slowest=list())
+    start = min(span['ts'] for span in spans)
+    end = max(span['ts'] + span['dur'] for span in spans)
+    categories = OrderedDict()
+    for span in spans:
+        stats = categories.setdefault(
+            span['cat'], dict(count=0, total=0.0, max=0.0))
+        stats['count'] += 1
+        stats['total'] += span['dur']
+        stats['max'] = max(stats['max'], span['dur'])
+
+    by_id = dict((span['id'], span) for span in spans)
+    tasks = OrderedDict()
+    for span in sorted(spans, key=lambda span: span['ts']):
+        if span['cat'] == 'task':
+            tasks[span['id']] = dict(
+                name=span['name'], dur=span['dur'], children=dict())
+    for span in spans:
+        if span['cat'] == 'task':
+            continue
+        task_id = span['parent']
+        # attribute the span to the innermost task it is nested in
+        while task_id is not None and task_id not in tasks:
+            task_id = by_id.get(task_id, dict()).get('parent')
+        if task_id is None:
+            continue
+        children = tasks[task_id]['children']
+        children[span['cat']] = children.get(span['cat'], 0.0) + span['dur']
+
+    slowest = sorted(
+        (span for span in spans if span['cat'] != 'task'),
+        key=lambda span: span['dur'],
+        reverse=True,
+    )
+    return dict(
+        elapsed=end - start,
+        categories=categories,
+        tasks=list(tasks.values()),
+        slowest=slowest[:top],
+    )
+
+
+def format_summary(summary):
+    """
+    :returns: summary, as returned by summarize(), as text
+    """
+    lines = ['Elapsed: %.1fs' % summary['elapsed'], '', 'By category:']
+    for category, stats in summary['categories'].items():
+        lines.append('  {cat:<10} {count:>7} spans {total:>10.1f}s total '
+                     '{max:>9.1f}s max'.format(cat=category, **stats))
+    if summary['tasks']:
+        lines.extend(['', 'Tasks:'])
+        for task in summary['tasks']:
+            children = ', '.join(
+                '%s %.1fs' % item for item in sorted(
+                    task['children'].items(), key=lambda item: -item[1]))
+            lines.append('  {dur:>10.1f}s {name}{children}'.format(
+                dur=task['dur'], name=task['name'],
+                children=' (%s)' % children if children else ''))
+    if summary['slowest']:
+        lines.extend(['', 'Slowest:'])
+        for span in summary['slowest']:
+            lines.append('  {dur:>10.1f}s {cat:<10} {status:<7} {name}'.format(
+                **span))
+    return '\n'.join(lines)
+
+
+def to_chrome(spans):
+    """
+    :returns: spans in the Chrome trace event format, as a dict to be dumped
+              as JSON
+    """
+    events = list()
+    for span in spans:
+        args = dict(span['args'])
+        args['status'] = span['status']
+        events.append(dict(
+            name=span['name'],
+            cat=span['cat'],
+            ph='X',
+            ts=int(span['ts'] * 1e6),
+            dur=int(span['dur'] * 1e6),
+            pid=1,
+            tid=span['tid'],
+            args=args,
+        ))
+    return dict(traceEvents=events, displayTimeUnit='ms')
+
+
+def main(args):
+    path = args['<path>']
+    if os.path.isdir(path):
+        path = os.path.join(path, 'trace.jsonl')
+    spans = read(path)
+    if args['--chrome']:
+        with open(args['--chrome'], 'w') as f:
+            json.dump(to_chrome(spans), f)
+        return
+    print(format_summary(summarize(spans, top=int(args['--top']))))